@@ -9,40 +9,95 @@ FOCUS=${1}
 SKIP=${2}
 PARALLELISM=${3}
 TIMEOUT=${4}
-EXTRA_ARGS="${@:5}"
+EXTRA_ARGS=("${@:5}")
+
+# The charm passes its own paths; they default to the ones it has always used.
+ACTION_HOME=${E2E_ACTION_HOME:-/home/ubuntu}
+KUBE_CONFIG=${E2E_KUBE_CONFIG:-/home/ubuntu/.kube/config}
 
 # get the host from the config file
-SERVER=$(cat /home/ubuntu/.kube/config | grep server | sed 's/    server: //')
+SERVER=$(cat $KUBE_CONFIG | grep server | sed 's/    server: //')
+
+# The charm may run more than one suite per action, each with its own run id
+# and its own prefix for the action results.
+RUN_ID=${E2E_RUN_ID:-$JUJU_ACTION_UUID}
+RESULT_KEY=${E2E_RESULT_KEY:-}
+
+# Record phase boundaries for the charm's trace when it asks for them.
+phase() {
+  if [ -n "${E2E_TRACE_PHASES:-}" ]; then
+    echo "$1 $2 $(date -u +%s.%N)" >> "$E2E_TRACE_PHASES"
+  fi
+}
 
-ACTION_HOME=/home/ubuntu
-ACTION_LOG=$ACTION_HOME/${JUJU_ACTION_UUID}.log
+ACTION_LOG=$ACTION_HOME/${RUN_ID}.log
 ACTION_LOG_TGZ=$ACTION_LOG.tar.gz
-ACTION_JUNIT=$ACTION_HOME/${JUJU_ACTION_UUID}-junit
+ACTION_JUNIT=$ACTION_HOME/${RUN_ID}-junit
 ACTION_JUNIT_TGZ=$ACTION_JUNIT.tar.gz
 
+# The charm may stage the output of the run in a tmpfs, see src/scratch.py.
+SCRATCH=${E2E_SCRATCH:-$ACTION_HOME}
+RUN_LOG=$SCRATCH/${RUN_ID}.log
+RUN_JUNIT=$SCRATCH/${RUN_ID}-junit
+
 # This initializes an e2e build log with the START TIMESTAMP.
-echo "JUJU_E2E_START=$(date -u +%s)" | tee $ACTION_LOG
+echo "JUJU_E2E_START=$(date -u +%s)" | tee $RUN_LOG
 # Append if using extra args
-echo "Using extra args = $EXTRA_ARGS" | tee -a $ACTION_LOG
-echo "Skip tests matching: $SKIP" | tee -a $ACTION_LOG
-echo "JUJU_E2E_VERSION=$(kubectl version | grep Server | cut -d " " -f 5 | cut -d ":" -f 2 | sed s/\"// | sed s/\",//)" | tee -a $ACTION_LOG
+echo "Using extra args = ${EXTRA_ARGS[*]}" | tee -a $RUN_LOG
+echo "Skip tests matching: $SKIP" | tee -a $RUN_LOG
+# Suites run from one action share the charm's probe of the server version.
+if [ -n "${E2E_SERVER_VERSION:-}" ]; then
+  echo "JUJU_E2E_VERSION=$E2E_SERVER_VERSION" | tee -a $RUN_LOG
+else
+  phase version-probe begin
+  echo "JUJU_E2E_VERSION=$(kubectl version | grep Server | cut -d " " -f 5 | cut -d ":" -f 2 | sed s/\"// | sed s/\",//)" | tee -a $RUN_LOG
+  phase version-probe end
+fi
+# The charm may interrupt the suite to stop it early. tee ignores the
+# interrupt so the suite's final output and reports still reach the log.
+# The JSON report tells which ginkgo node ran each spec, see src/nodes.py.
+phase suite begin
+mkdir -p $RUN_JUNIT
 GINKGO_ARGS="-nodes=$PARALLELISM" kubernetes-test.e2e \
-  -kubeconfig /home/ubuntu/.kube/config \
+  -kubeconfig $KUBE_CONFIG \
   -host $SERVER \
-  -ginkgo.focus $FOCUS \
+  -ginkgo.focus "$FOCUS" \
   -ginkgo.skip "$SKIP" \
-  ${EXTRA_ARGS[@]} \
-  -report-dir $ACTION_JUNIT 2>&1 | tee -a $ACTION_LOG
+  -ginkgo.json-report $RUN_JUNIT/ginkgo-report.json \
+  "${EXTRA_ARGS[@]}" \
+  -report-dir $RUN_JUNIT 2>&1 | tee -i -a $RUN_LOG
+phase suite end
 
 # This appends the END TIMESTAMP to the e2e build log
-echo "JUJU_E2E_END=$(date -u +%s)" | tee -a $ACTION_LOG
+echo "JUJU_E2E_END=$(date -u +%s)" | tee -a $RUN_LOG
+
+# Append the part of the log the charm has not moved to disk yet, and the
+# reports, while holding the same lock as the charm.
+if [ "$SCRATCH" != "$ACTION_HOME" ]; then
+  phase persist begin
+  flock $ACTION_LOG sh -c 'tail -c +$(($(stat -c %s "$2") + 1)) "$1" >> "$2"' persist $RUN_LOG $ACTION_LOG
+  mv $RUN_JUNIT $ACTION_JUNIT
+  phase persist end
+fi
+
+# Merge the reports of the ginkgo nodes into one when the charm asks for it.
+# The originals are packed along with it either way.
+if [ -n "${E2E_JUNIT_MERGE:-}" ]; then
+  phase junit-merge begin
+  $E2E_JUNIT_MERGE $ACTION_JUNIT "kubernetes-e2e $RUN_ID" || echo "Failed to merge the JUnit reports"
+  phase junit-merge end
+fi
 
 # set cwd to /home/ubuntu and tar the artifacts using a minimal directory
 # path. Extracting "home/ubuntu/1412341234/foobar.log is cumbersome in ci
-cd $ACTION_HOME/${JUJU_ACTION_UUID}-junit
+phase package begin
+cd $ACTION_HOME/${RUN_ID}-junit
 tar -czf $ACTION_JUNIT_TGZ *
 cd ..
-tar -czf $ACTION_LOG_TGZ ${JUJU_ACTION_UUID}.log
+tar -czf $ACTION_LOG_TGZ ${RUN_ID}.log
+phase package end
 
-action-set log="$ACTION_LOG_TGZ"
-action-set junit="$ACTION_JUNIT_TGZ"
\ No newline at end of file
+phase action-set begin
+action-set ${RESULT_KEY}log="$ACTION_LOG_TGZ"
+action-set ${RESULT_KEY}junit="$ACTION_JUNIT_TGZ"
+phase action-set end
\ No newline at end of file
@@ -0,0 +1,195 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Measure how a cluster performs under an e2e workload.
+
+The latency histograms of the API server, of its requests to etcd and of pod
+startup on every kubelet are read before and after the workload. The
+percentiles of the difference describe the requests the workload made,
+whatever else the cluster served before it.
+"""
+
+import json
+import logging
+import math
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import kubectl
+from sampler import LABEL, LONG_RUNNING_VERBS, SERIES
+
+logger = logging.getLogger(__name__)
+
+# The histograms measured, with the labels their series are grouped by.
+API_METRICS = {
+    "apiserver_request_duration_seconds": ("verb", "resource"),
+    "etcd_request_duration_seconds": ("operation", "type"),
+}
+# Newer kubelets leave image pulls out of pod startup; older ones only have the latter.
+POD_STARTUP_METRICS = (
+    "kubelet_pod_start_sli_duration_seconds",
+    "kubelet_pod_start_duration_seconds",
+)
+QUANTILES = (0.5, 0.9, 0.99)
+# Where each metric goes in the action results, and how many of its busiest groups.
+RESULT_KEYS = {
+    "apiserver_request_duration_seconds": "api-server",
+    "etcd_request_duration_seconds": "etcd",
+    "pod_start_duration_seconds": "pod-startup",
+}
+RESULT_ROWS = 25
+SCRAPE_TIMEOUT = 60
+SCRAPE_CONCURRENCY = 10
+
+Key = Tuple[str, str]
+
+
+@dataclass
+class Histogram:
+    """Cumulative bucket counts of one metric, summed over the series of a group."""
+
+    buckets: Dict[float, float] = field(default_factory=lambda: defaultdict(float))
+    count: float = 0.0
+
+    def __sub__(self, other: "Histogram") -> "Histogram":
+        delta = Histogram()
+        for le, value in self.buckets.items():
+            delta.buckets[le] = value - other.buckets.get(le, 0.0)
+        delta.count = self.count - other.count
+        return delta
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as Prometheus does, interpolating within its bucket."""
+        bounds = sorted(self.buckets)
+        if not bounds or self.count <= 0:
+            return math.nan
+        rank = q * self.count
+        lower, below = 0.0, 0.0
+        for le in bounds:
+            if self.buckets[le] >= rank:
+                if math.isinf(le):
+                    # Past the largest finite bucket all there is to tell is that bound.
+                    return lower
+                inside = self.buckets[le] - below
+                return lower + (le - lower) * ((rank - below) / inside if inside else 1)
+            lower, below = le, self.buckets[le]
+        return lower
+
+
+@dataclass
+class Latency:
+    """The latency percentiles of one group of requests, in seconds."""
+
+    metric: str
+    subject: str
+    requests: float
+    p50: float
+    p90: float
+    p99: float
+
+    def describe(self) -> str:
+        """One line for the action results."""
+        return (
+            f"p50 {_ms(self.p50)} p90 {_ms(self.p90)} p99 {_ms(self.p99)} "
+            f"({self.requests:.0f} requests)"
+        )
+
+
+Snapshot = Dict[Tuple[str, Key], Histogram]
+
+
+def parse_histograms(lines: Iterable[str], metrics: Dict[str, Tuple[str, ...]]) -> Snapshot:
+    """Sum the histograms of the given metrics over the series of each label group."""
+    histograms: Snapshot = defaultdict(Histogram)
+    for line in lines:
+        if not (match := SERIES.match(line)):
+            continue
+        name, _, suffix = match["name"].rpartition("_")
+        if name not in metrics or suffix not in ("bucket", "count"):
+            continue
+        labels = dict(LABEL.findall(match["labels"] or ""))
+        if labels.get("verb") in LONG_RUNNING_VERBS:
+            continue
+        # Every group is keyed by a pair, padded for metrics grouped by fewer labels.
+        values = [labels.get(label, "") for label in metrics[name]] + ["", ""]
+        histogram = histograms[(name, (values[0], values[1]))]
+        if suffix == "bucket":
+            histogram.buckets[float(labels["le"])] += float(match["value"])
+        else:
+            histogram.count += float(match["value"])
+    return dict(histograms)
+
+
+def _scrape(path: str, run: Callable[..., str]) -> List[str]:
+    return run("get", "--raw", path, timeout=SCRAPE_TIMEOUT).splitlines()
+
+
+def snapshot(run: Callable[..., str] = kubectl.kubectl) -> Snapshot:
+    """Read the latency histograms of the API server and of every kubelet."""
+    histograms = parse_histograms(_scrape("/metrics", run), API_METRICS)
+    nodes = [
+        node["metadata"]["name"] for node in json.loads(run("get", "nodes", "-o", "json"))["items"]
+    ]
+
+    def kubelet(node: str) -> Snapshot:
+        try:
+            lines = _scrape(f"/api/v1/nodes/{node}/proxy/metrics", run)
+        except (subprocess.SubprocessError, OSError):
+            logger.warning("Failed to read the metrics of the kubelet on %s", node)
+            return {}
+        found = parse_histograms(lines, {name: () for name in POD_STARTUP_METRICS})
+        # Only the preferred metric of the two counts, should a kubelet have both.
+        for name in POD_STARTUP_METRICS:
+            if (name, ("", "")) in found:
+                return {("pod_start_duration_seconds", ("", "")): found[(name, ("", ""))]}
+        return {}
+
+    with ThreadPoolExecutor(SCRAPE_CONCURRENCY) as pool:
+        for found in pool.map(kubelet, nodes):
+            for key, histogram in found.items():
+                total = histograms.setdefault(key, Histogram())
+                for le, value in histogram.buckets.items():
+                    total.buckets[le] += value
+                total.count += histogram.count
+    return histograms
+
+
+def measure(before: Snapshot, after: Snapshot) -> List[Latency]:
+    """The latency percentiles of the requests made between two snapshots, busiest first."""
+    latencies = []
+    for (metric, key), histogram in after.items():
+        delta = histogram - before.get((metric, key), Histogram())
+        if delta.count <= 0:
+            continue
+        subject = " ".join(part for part in key if part) or "all"
+        p50, p90, p99 = (delta.quantile(q) for q in QUANTILES)
+        latencies.append(Latency(metric, subject, delta.count, p50, p90, p99))
+    return sorted(latencies, key=lambda latency: (latency.metric, -latency.requests))
+
+
+def summarize(
+    latencies: List[Latency], baseline: Optional[Dict[Tuple[str, str], Dict]] = None
+) -> Dict[str, str]:
+    """The busiest groups of each metric for the action results.
+
+    With the latencies of a baseline run, keyed by metric and subject, each
+    group also tells how its p99 moved against the same group there.
+    """
+    lines: Dict[str, List[str]] = defaultdict(list)
+    for latency in latencies:
+        key = RESULT_KEYS.get(latency.metric, latency.metric)
+        if len(lines[key]) >= RESULT_ROWS:
+            continue
+        line = f"{latency.subject}: {latency.describe()}"
+        before = (baseline or {}).get((latency.metric, latency.subject), {})
+        if before.get("p99") and not math.isnan(latency.p99):
+            line += f", p99 {round((latency.p99 / before['p99'] - 1) * 100):+d}% on the baseline"
+        lines[key].append(line)
+    return {key: "\n".join(group) for key, group in lines.items()}
+
+
+def _ms(seconds: float) -> str:
+    return "n/a" if math.isnan(seconds) else f"{seconds * 1000:.1f}ms"
@@ -0,0 +1,196 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Run the suite in a systemd scope of its own, bounded and accounted for.
+
+The scope sits in system.slice next to the Juju agent and snapd, so its CPU
+weight decides how the suite shares the CPUs with them under contention, and
+its memory limits confine reclaim and OOM kills to the suite. The processes
+of the run are also made the first choice of the kernel's OOM killer should
+the whole machine run out of memory. While the run lasts, the scope's cgroup
+is read every few seconds for the CPU, memory and IO it has used, as a scope
+goes away with its last process.
+
+systemd-run fails before the suite starts when it cannot make the scope, or
+rejects a limit, which would look like a failed suite. A scope is first made
+for a command which does nothing, with the same limits, and the suite runs
+unconfined if that fails.
+"""
+
+import re
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from runner import RunObserver
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+SLICE = "system.slice"
+# Between the default 0 of the agent and the 1000 which is killed first.
+RUN_OOM_SCORE_ADJ = 500
+ACCOUNTING_INTERVAL = 2.0
+# Shorter windows, such as the one up to the last sample, make for noisy CPU rates.
+MIN_RATE_WINDOW = 1.0
+# systemd memory limits: bytes with an optional K, M, G or T suffix, a
+# percentage of physical memory, or infinity.
+MEMORY_LIMIT = re.compile(r"^(?:\d+[KMGT]?|\d{1,3}(?:\.\d+)?%|infinity)$")
+PROBE_TIMEOUT = 60
+
+
+def available() -> bool:
+    """Whether systemd runs the machine, so transient scopes can be made."""
+    return Path("/run/systemd/system").is_dir() and shutil.which("systemd-run") is not None
+
+
+def scope_name(run_id: str) -> str:
+    """The name of the scope of a run."""
+    return f"kubernetes-e2e-{run_id}.scope"
+
+
+def scope_command(
+    run_id: str,
+    command: List[str],
+    cpu_weight: int = 0,
+    memory_high: str = "",
+    memory_max: str = "",
+) -> List[str]:
+    """Wrap a command to run it in its own scope with the given limits.
+
+    Limits left at 0 or "" are not set. Raises ValueError on a malformed limit.
+    """
+    properties = []
+    if cpu_weight:
+        if not 1 <= cpu_weight <= 10000:
+            raise ValueError(f"CPU weight {cpu_weight} is not between 1 and 10000")
+        properties.append(f"CPUWeight={cpu_weight}")
+    for name, limit in (("MemoryHigh", memory_high), ("MemoryMax", memory_max)):
+        if limit:
+            if not MEMORY_LIMIT.match(limit):
+                raise ValueError(f"{name} {limit!r} is not a size, percentage or infinity")
+            properties.append(f"{name}={limit}")
+    wrapped = [
+        "systemd-run",
+        "--scope",
+        "--quiet",
+        "--collect",
+        f"--slice={SLICE}",
+        f"--unit={scope_name(run_id)}",
+    ]
+    for prop in ["CPUAccounting=yes", "MemoryAccounting=yes", "IOAccounting=yes", *properties]:
+        wrapped += ["-p", prop]
+    wrapped.append("--")
+    if shutil.which("choom"):
+        wrapped += ["choom", "-n", str(RUN_OOM_SCORE_ADJ), "--"]
+    return wrapped + command
+
+
+def probe_scope(run_id: str, **limits) -> None:
+    """Make a scope with the limits a run's scope will have, for a command doing nothing.
+
+    Raises ValueError with what systemd-run said if the scope cannot be made.
+    """
+    command = scope_command(f"{run_id}-probe", ["true"], **limits)
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"systemd-run failed: {e.stderr.strip() or e}") from e
+    except (subprocess.TimeoutExpired, OSError) as e:
+        raise ValueError(f"systemd-run failed: {e}") from e
+
+
+def _read_keyed(path: Path) -> Dict[str, int]:
+    """Read a flat keyed cgroup file such as cpu.stat or memory.events."""
+    values = {}
+    for line in path.read_text().splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            values[key] = int(value)
+    return values
+
+
+def _read_io(path: Path) -> Dict[str, int]:
+    """Sum io.stat over every device."""
+    totals: Dict[str, int] = {}
+    for line in path.read_text().splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if value.isdigit():
+                totals[key] = totals.get(key, 0) + int(value)
+    return totals
+
+
+class ScopeAccounting(RunObserver):
+    """Follow what the scope of a run uses until the run exits."""
+
+    def __init__(
+        self,
+        run_id: str,
+        interval: float = ACCOUNTING_INTERVAL,
+        root: Path = CGROUP_ROOT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = root / SLICE / scope_name(run_id)
+        self.interval = interval
+        self._clock = clock
+        self.cpu_seconds = 0.0
+        self.peak_cpu = 0.0
+        self.peak_memory = 0
+        self.io: Dict[str, int] = {}
+        self.oom_kills = 0
+        self.samples = 0
+        self._last: Optional[tuple] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="accounting", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Read the cgroup of the scope, if it is still there."""
+        try:
+            usage = _read_keyed(self.path / "cpu.stat")["usage_usec"] / 1e6
+            memory = int((self.path / "memory.current").read_text())
+            if (self.path / "memory.peak").exists():
+                memory = max(memory, int((self.path / "memory.peak").read_text()))
+            io = _read_io(self.path / "io.stat") if (self.path / "io.stat").exists() else {}
+            events = _read_keyed(self.path / "memory.events")
+        except (OSError, ValueError, KeyError):
+            return
+        now = self._clock()
+        if self._last is None:
+            self._last = (now, usage)
+        elif now - self._last[0] >= MIN_RATE_WINDOW:
+            self.peak_cpu = max(self.peak_cpu, (usage - self._last[1]) / (now - self._last[0]))
+            self._last = (now, usage)
+        self.cpu_seconds = usage
+        self.peak_memory = max(self.peak_memory, memory)
+        self.io = io or self.io
+        self.oom_kills = events.get("oom_kill", self.oom_kills)
+        self.samples += 1
+
+    def close(self) -> None:
+        """Stop following the scope, with a last sample should it still be there."""
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def summary(self) -> Dict[str, str]:
+        """What the run used, for the action results."""
+        if not self.samples:
+            return {}
+        summary = {
+            "scope": self.path.name,
+            "cpu-seconds": f"{self.cpu_seconds:.1f}",
+            "peak-cpu": f"{self.peak_cpu:.2f}",
+            "peak-memory-mib": f"{self.peak_memory / 2**20:.0f}",
+            "io-read-mib": f"{self.io.get('rbytes', 0) / 2**20:.0f}",
+            "io-write-mib": f"{self.io.get('wbytes', 0) / 2**20:.0f}",
+        }
+        if self.oom_kills:
+            summary["oom-kills"] = str(self.oom_kills)
+        return summary
@@ -6,20 +6,70 @@
 
 import logging
 import os
+import re
 import shlex
 import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import ops
+import yaml
 from charms.operator_libs_linux.v2 import snap
 from ops.interface_kube_control import KubeControlRequirer
 from ops.interface_tls_certificates import CertificatesRequires
 
+import benchmark
+import cgroup
+import checkpoint
+import cleanup
+import coalesce
+import compare
+import health
+import logindex
+import matrix
+import prepull
+import quarantine
+import retention
+import upload
+from ginkgo import SpecReport
+from history import STATE_DIR, RunHistory, RunMarkers, fingerprint
+from junit import iter_reports, write_junit
+from kubectl import KUBE_CONFIG_PATH, ROOT_KUBE_CONFIG_PATH, kubectl_json
+from metrics import Metrics
+from nodes import NodeDemux, ginkgo_report, nodes_dir
+from runner import ACTION_HOME, E2ERunner, FailureTracker, artifact_paths
+from sampler import ResourceSampler
+from scratch import ScratchSpace
+from snaps import LocalSnaps
+from store import ArtifactStore
+from tracing import PHASES_ENV, Tracer, traced
+
 logger = logging.getLogger(__name__)
 
 VALID_LOG_LEVELS = ["info", "debug", "warning", "error", "critical"]
-KUBE_CONFIG_PATH = "/home/ubuntu/.kube/config"
+TEST_PARAMS = ["focus", "skip", "parallelism", "timeout", "extra"]
+VERBOSE_FLAGS = {"ginkgo.v", "ginkgo.vv"}
+TRACE_DIR = STATE_DIR / "traces"
+# The snaps the charm installs, each from a resource of the same name when one
+# is attached, with whether the store installs it with classic confinement.
+SNAPS = {"kubectl": False, "kubernetes-test": True}
+# Spans whose latest duration is also published as a metric.
+SPAN_METRICS = {
+    "setup-environment": "setup_environment_duration_seconds",
+    "install-snaps": "snap_install_duration_seconds",
+    "health-probe": "health_probe_duration_seconds",
+}
+
+
+def verbose_args(args: List[str]) -> List[str]:
+    """Make ginkgo name passing specs, which checkpoints rely on, unless it already does."""
+    if any(arg.lstrip("-").split("=")[0] in VERBOSE_FLAGS for arg in args):
+        return args
+    return [*args, "-ginkgo.v"]
 
 
 class KubeConfigResourceManager:
@@ -67,6 +117,9 @@ class KubernetesE2ECharm(ops.CharmBase):
 
     def __init__(self, *args) -> None:
         super().__init__(*args)
+        self._dispatch_started = time.monotonic()
+        self.metrics = Metrics()
+        self.tracer = Tracer()
         self.kube_control = KubeControlRequirer(self, schemas="0,1")
         self.certificates = CertificatesRequires(self)
 
@@ -83,12 +136,23 @@ class KubernetesE2ECharm(ops.CharmBase):
         self.framework.observe(certificates.relation_changed, self._setup_environment)
 
         self.framework.observe(self.on.test_action, self._on_test_action)
+        self.framework.observe(self.on.cleanup_action, self._on_cleanup_action)
+        self.framework.observe(self.on.runs_action, self._on_runs_action)
+        self.framework.observe(self.on.compare_action, self._on_compare_action)
+        self.framework.observe(self.on.gc_action, self._on_gc_action)
+        self.framework.observe(self.on.restore_action, self._on_restore_action)
+        self.framework.observe(self.on.logs_action, self._on_logs_action)
+        self.framework.observe(self.on.upload_action, self._on_upload_action)
+        self.framework.observe(self.on.benchmark_action, self._on_benchmark_action)
         self.framework.observe(self.on.config_changed, self._setup_environment)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
 
     def _kube_control_relation_joined(self, event: ops.EventBase):
         self.kube_control.set_auth_request(self.unit.name, "system:masters")
         return self._setup_environment(event)
 
+    @traced("kube-control")
     def _ensure_kube_control_relation(self, event: ops.EventBase) -> bool:
         self.unit.status = ops.MaintenanceStatus("Evaluating kubernetes authentication.")
         evaluation = self.kube_control.evaluate_relation(event)
@@ -103,10 +167,10 @@ class KubernetesE2ECharm(ops.CharmBase):
             return False
         self.unit.status = ops.MaintenanceStatus("Kubernetes authentication completed.")
         self.kube_control.create_kubeconfig(
-            self.CA_CERT_PATH, "/root/.kube/config", "root", self.unit.name
+            self.CA_CERT_PATH, ROOT_KUBE_CONFIG_PATH, "root", self.unit.name
         )
         self.kube_control.create_kubeconfig(
-            self.CA_CERT_PATH, "/home/ubuntu/.kube/config", "ubuntu", self.unit.name
+            self.CA_CERT_PATH, KUBE_CONFIG_PATH, "ubuntu", self.unit.name
         )
         return True
 
@@ -126,6 +190,7 @@ class KubernetesE2ECharm(ops.CharmBase):
         self.CA_CERT_PATH.write_text(self.certificates.ca)
         return True
 
+    @traced("setup-environment")
     def _setup_environment(self, event: ops.EventBase) -> None:
         kubeconfig_resource_manager = KubeConfigResourceManager(self.model)
 
@@ -143,12 +208,81 @@ class KubernetesE2ECharm(ops.CharmBase):
 
         self.unit.status = ops.ActiveStatus("Ready to test.")
 
+    @traced("install-snaps")
     def _install_snaps(self, channel: Optional[str]) -> None:
         self.unit.status = ops.MaintenanceStatus("Installing kubectl and kubernetes-test snaps.")
-        snap.ensure("kubectl", snap.SnapState.Latest.value, channel=channel)
-        snap.ensure("kubernetes-test", snap.SnapState.Latest.value, channel=channel, classic=True)
+        local = LocalSnaps()
+        for name, classic in SNAPS.items():
+            if resource := self._snap_resource(name):
+                local.install(name, resource, classic)
+            else:
+                snap.ensure(name, snap.SnapState.Latest.value, channel=channel, classic=classic)
         self.unit.status = ops.MaintenanceStatus("Snaps installed successfully.")
 
+    def _on_update_status(self, _: ops.EventBase) -> None:
+        """Reflect whether the cluster still answers and takes the unit's credentials."""
+        state = health.HealthState()
+        status = self.unit.status
+        # Leave alone what setup reported, unless it is the outcome of an earlier probe.
+        if not isinstance(status, ops.ActiveStatus) and status.message != state.status:
+            return
+        if not Path(KUBE_CONFIG_PATH).exists() or not state.due():
+            return
+        if (result := self._probe_cluster()) is None:
+            return
+        self.metrics.set("cluster_healthy", float(result.healthy))
+        if result.healthy:
+            self.unit.status = ops.ActiveStatus("Ready to test.")
+        elif result.refused:
+            self.unit.status = ops.BlockedStatus(f"Cluster {result.reason}.")
+        else:
+            self.unit.status = ops.WaitingStatus(f"Cluster unreachable: {result.reason}")
+        state.record(result, self.unit.status.message)
+        if not result.healthy:
+            logger.warning(
+                "Cluster probe %d failed (%s), next probe in %.0fs",
+                state.failures,
+                result.reason,
+                state.next - time.time(),
+            )
+
+    @traced("health-probe")
+    def _probe_cluster(self) -> Optional[health.Probe]:
+        return health.probe(Path(KUBE_CONFIG_PATH))
+
+    def _snap_resource(self, name: str) -> Optional[Path]:
+        """The snap attached as the resource of the same name, if there is one."""
+        try:
+            path = self.model.resources.fetch(name)
+        except (ops.model.ModelError, NameError):
+            return None
+        # Charmhub hands out an empty file for a resource nobody uploaded.
+        return path if path.stat().st_size else None
+
+    def _on_commit(self, _: ops.EventBase) -> None:
+        """Record how long this hook took and publish its trace and the metrics."""
+        hook = Path(os.environ.get("JUJU_DISPATCH_PATH", "unknown")).name
+        self.metrics.observe_hook(hook, time.monotonic() - self._dispatch_started)
+        timings = self.tracer.summary()
+        for span, metric in SPAN_METRICS.items():
+            if span in timings:
+                self.metrics.set(metric, timings[span])
+        if self.tracer.spans:
+            self.tracer.write(TRACE_DIR / f"{hook}.json")
+        try:
+            self.metrics.save()
+        except OSError:
+            logger.exception("Failed to save metrics state")
+        if directory := str(self.config.get("metrics-textfile-directory") or ""):
+            self.metrics.write_textfile(Path(directory))
+
+    def _snap_revision(self, name: str) -> str:
+        try:
+            return snap.SnapCache()[name].revision
+        except snap.Error:
+            logger.exception("Failed to look up the %s snap revision", name)
+            return ""
+
     def _check_kube_config_exists(self, event: ops.ActionEvent) -> bool:
         if not Path(KUBE_CONFIG_PATH).exists():
             event.fail("Missing Kubernetes configuration. See logs for info.")
@@ -157,7 +291,7 @@ class KubernetesE2ECharm(ops.CharmBase):
         return True
 
     def _log_has_errors(self, event: ops.ActionEvent) -> bool:
-        log_file_path = Path(f"/home/ubuntu/{event.id}.log")
+        log_file_path = Path(artifact_paths(event.id)["log"])
 
         if not log_file_path.exists():
             msg = f"Logfile not found at expected location {log_file_path}"
@@ -167,34 +301,932 @@ class KubernetesE2ECharm(ops.CharmBase):
 
         return "Test Suite Failed" in log_file_path.read_text()
 
-    def _on_test_action(self, event: ops.ActionEvent) -> None:
-        def param_get(p):
-            return str(event.params.get(p, ""))
+    @traced("prepull")
+    def _prepull_images(self, event: ops.ActionEvent) -> bool:
+        self.unit.status = ops.MaintenanceStatus("Pre-pulling e2e images...")
+        try:
+            images = prepull.list_images()
+            puller = prepull.ImagePrePuller(
+                batch_size=int(event.params.get("prepull-batch-size", 10)),
+                timeout=int(event.params.get("prepull-timeout", 1800)),
+            )
+            report = puller.run(images)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.exception("Failed to pre-pull e2e images")
+            event.fail(f"Failed to pre-pull e2e images: {e}")
+            return False
 
-        # Param order matters here because test.sh uses $1, $2, etc.
-        args = [param_get(param) for param in ["focus", "skip", "parallelism", "timeout"]]
-        args += shlex.split(param_get("extra"))
+        summary = prepull.summarize(report, ACTION_HOME / f"{event.id}-prepull.json")
+        event.log(f"Pre-pulled {summary['images']} images, {summary['failed']} failed.")
+        event.set_results({"prepull": summary})
+        return True
 
-        command = ["scripts/test.sh", *args]
+    def _cleanup(self, event: ops.ActionEvent, key: str) -> bool:
+        self.unit.status = ops.MaintenanceStatus("Cleaning up leftover e2e objects...")
+        try:
+            with self.tracer.span(key):
+                summary = cleanup.cleanup(
+                    concurrency=int(event.params.get("cleanup-concurrency", 10)),
+                    timeout=int(event.params.get("cleanup-timeout", 900)),
+                    min_age=int(event.params.get("cleanup-min-age", cleanup.MIN_AGE)),
+                )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.exception("Failed to clean up leftover e2e objects")
+            event.log(f"Failed to clean up leftover e2e objects: {e}")
+            return False
+
+        event.log(
+            f"Removed {summary['objects']} leftover e2e objects in {summary['seconds']}s, "
+            f"{summary['remaining']} namespaces still terminating."
+        )
+        event.set_results({key: summary})
+        return summary["failed"] == "0" and summary["remaining"] == "0"
+
+    def _on_cleanup_action(self, event: ops.ActionEvent) -> None:
+        if not self._check_kube_config_exists(event):
+            return
+
+        previous_status = self.unit.status
+        try:
+            if not self._cleanup(event, "cleanup"):
+                event.fail("Leftover e2e objects remain. See logs for info.")
+        finally:
+            self.unit.status = previous_status
+
+    def _merge_resumed_run(self, event: ops.ActionEvent, resume: str) -> bool:
+        """Fold this run's specs into the run it resumed and report the combined verdict."""
+        original = checkpoint.checkpoint_path(resume)
+        _, resumed = checkpoint.load(checkpoint.checkpoint_path(event.id))
+        checkpoint.append(original, resumed.values())
+        _, combined = checkpoint.load(original)
+
+        combined_junit = ACTION_HOME / f"{resume}-junit-combined.xml"
+        write_junit(combined_junit, f"kubernetes-e2e {resume}", combined.values())
+        failed = any(report.failed for report in combined.values())
+        history = RunHistory()
+        if run := history.get(resume):
+            history.update(
+                resume,
+                verdict="failed" if failed else "passed",
+                artifacts={**run["artifacts"], "junit-combined": str(combined_junit)},
+            )
+        history.close()
+        event.set_results(
+            {
+                "resumed-from": resume,
+                "combined-junit": str(combined_junit),
+                "combined-verdict": "failed" if failed else "passed",
+            }
+        )
+        return failed
+
+    def _on_runs_action(self, event: ops.ActionEvent) -> None:
+        history = RunHistory()
+        try:
+            for param, pinned in (("pin", True), ("unpin", False)):
+                run_id = str(event.params.get(param, ""))
+                if run_id and not history.pin(run_id, pinned):
+                    event.fail(f"Unknown run {run_id}.")
+                    return
+            runs = history.query(
+                verdict=str(event.params.get("verdict", "")),
+                since=str(event.params.get("since", "")),
+                until=str(event.params.get("until", "")),
+                server_version=str(event.params.get("server-version", "")),
+                action=str(event.params.get("action", "")),
+                limit=int(event.params.get("limit", 20)),
+            )
+        except ValueError as e:
+            event.fail(f"Invalid filter: {e}")
+            return
+        finally:
+            history.close()
+        event.set_results({"count": str(len(runs)), "runs": yaml.safe_dump(runs)})
+
+    def _junit_source(
+        self, run_id: str, artifacts: Dict[str, str], scratch: Path
+    ) -> Optional[Path]:
+        """The JUnit results of a run, rebuilt from the artifact store if only it has them."""
+        if source := compare.junit_source(artifacts):
+            return source
+        try:
+            return ArtifactStore().tarball(
+                run_id, f"{run_id}-junit/", scratch / f"{run_id}-junit.tar.gz"
+            )
+        except FileNotFoundError:
+            return None
+
+    def _on_compare_action(self, event: ops.ActionEvent) -> None:
+        history = RunHistory()
+        scratch = tempfile.TemporaryDirectory()
+        try:
+            run_ids = [str(event.params.get(p, "")) for p in ("base", "target")]
+            if not all(run_ids):
+                stored = set(ArtifactStore().runs())
+                finished = [
+                    run["id"]
+                    for run in history.query(action="test", limit=50)
+                    if run["verdict"] != "running"
+                    and (compare.junit_source(run["artifacts"]) is not None or run["id"] in stored)
+                ]
+                if len(finished) < 2:
+                    event.fail("Need two finished runs with JUnit results to compare.")
+                    return
+                run_ids = [finished[1], finished[0]]
+
+            results = []
+            for run_id in run_ids:
+                run = history.get(run_id)
+                source = run and self._junit_source(run_id, run["artifacts"], Path(scratch.name))
+                if not source:
+                    event.fail(f"No JUnit results found for run {run_id}.")
+                    return
+                results.append(compare.load_results(iter_reports(source)))
+                history.touch(run_id)
+        finally:
+            history.close()
+            scratch.cleanup()
+
+        report = compare.compare(*results)
+        event.set_results(
+            {
+                "base": run_ids[0],
+                "target": run_ids[1],
+                "new-failures": str(len(report["new-failures"])),
+                "new-passes": str(len(report["new-passes"])),
+                "report": yaml.safe_dump(report, sort_keys=False),
+            }
+        )
+
+    @traced("gc")
+    def _collect_garbage(self, dry_run: bool = False) -> Dict[str, str]:
+        """Evict the artifacts of old runs beyond the configured budget and age."""
+        history = RunHistory()
+        try:
+            # A negative limit lists every run.
+            result = retention.collect(
+                ACTION_HOME,
+                history.query(limit=-1),
+                budget=int(self.config.get("artifacts-budget", 0)) * 2**20,
+                max_age=float(self.config.get("artifacts-max-age", 0)) * 24 * 3600,
+                keep=int(self.config.get("artifacts-keep", 1)),
+                dry_run=dry_run,
+                store=ArtifactStore(),
+            )
+            if not dry_run:
+                for run_id in result["evicted"]:
+                    history.update(run_id, artifacts={})
+        finally:
+            history.close()
+        return {
+            "evicted": " ".join(result["evicted"]),
+            "moved-to-store": " ".join(result["moved-to-store"]),
+            "reclaimed": retention.format_size(result["reclaimed"]),
+            "reclaimed-bytes": str(result["reclaimed"]),
+            "remaining": retention.format_size(result["remaining"]),
+            "kept": str(result["kept"]),
+        }
+
+    def _on_gc_action(self, event: ops.ActionEvent) -> None:
+        dry_run = bool(event.params.get("dry-run", False))
+        try:
+            summary = self._collect_garbage(dry_run)
+        except OSError as e:
+            logger.exception("Failed to collect artifacts")
+            event.fail(f"Failed to collect artifacts: {e}")
+            return
+        verb = "Would reclaim" if dry_run else "Reclaimed"
+        event.log(f"{verb} {summary['reclaimed']}, {summary['remaining']} of artifacts kept.")
+        event.set_results(summary)
+
+    @traced("store")
+    def _store_artifacts(self, run_id: str) -> Dict[str, str]:
+        """Add the artifacts of a run to the artifact store, leaving out the tarballs."""
+        files = {}
+        for path in retention.run_paths(ACTION_HOME, run_id):
+            if path.name.endswith(".tar.gz"):
+                continue
+            if path.is_dir():
+                for child in sorted(path.rglob("*")):
+                    if child.is_file():
+                        files[str(child.relative_to(ACTION_HOME))] = child
+            else:
+                files[path.name] = path
+        stats = ArtifactStore().put(run_id, files)
+        return {
+            "files": str(stats["files"]),
+            "size": retention.format_size(stats["bytes"]),
+            "stored": retention.format_size(stats["stored"]),
+            "new-chunks": f"{stats['new-chunks']}/{stats['chunks']}",
+        }
+
+    def _on_restore_action(self, event: ops.ActionEvent) -> None:
+        run_id = str(event.params["run"])
+        try:
+            rebuilt = ArtifactStore().rebuild(run_id, ACTION_HOME)
+        except FileNotFoundError as e:
+            event.fail(str(e))
+            return
+        history = RunHistory()
+        try:
+            history.touch(run_id)
+        finally:
+            history.close()
+        event.set_results({"files": "\n".join(str(path) for path in rebuilt)})
+
+    def _on_logs_action(self, event: ops.ActionEvent) -> None:
+        run_id = str(event.params.get("run", ""))
+        if not run_id:
+            history = RunHistory()
+            try:
+                finished = [
+                    run["id"]
+                    for run in history.query(action="test", limit=10)
+                    if run["verdict"] != "running"
+                ]
+            finally:
+                history.close()
+            if not finished:
+                event.fail("No finished runs.")
+                return
+            run_id = finished[0]
+
+        pattern = str(event.params.get("spec", ""))
+        limit = int(event.params.get("max-bytes", 0))
+        log = logindex.RunLog(run_id, ArtifactStore())
+        try:
+            # Without a spec name, the failures are what there is to triage.
+            specs = log.find(pattern, bool(event.params.get("failed")) or not pattern)
+            output, used, truncated = [], 0, False
+            for spec in specs:
+                remaining = limit - used
+                if limit and remaining <= 0:
+                    truncated = True
+                    break
+                size = spec.end - spec.start
+                truncated = truncated or bool(limit and size > remaining)
+                output.append(log.output(spec, remaining if limit else 0))
+                used += size
+        except FileNotFoundError:
+            event.fail(f"No log index found for run {run_id}.")
+            return
+        except re.error as e:
+            event.fail(f"Invalid spec pattern: {e}")
+            return
+        except ValueError as e:
+            event.fail(str(e))
+            return
+        event.set_results(
+            {
+                "run": run_id,
+                "matched": str(len(specs)),
+                "specs": "\n".join(f"{spec.name} [{spec.state}]" for spec in specs),
+                "output": "".join(output),
+                "truncated": str(truncated).lower(),
+            }
+        )
+
+    def _uploader(self) -> Optional[upload.Uploader]:
+        """An uploader to the configured object storage, or None when there is none."""
+        endpoint = str(self.config.get("s3-endpoint", ""))
+        if not endpoint:
+            return None
+        bucket = str(self.config.get("s3-bucket", ""))
+        if not bucket:
+            raise ValueError("s3-bucket is not set")
+        secret_id = str(self.config.get("s3-credentials", ""))
+        if not secret_id:
+            raise ValueError("s3-credentials is not set")
+        try:
+            secret = self.model.get_secret(id=secret_id)
+            credentials = secret.get_content(refresh=True)
+        except (ops.SecretNotFoundError, ops.ModelError) as e:
+            raise ValueError(f"Cannot read the s3-credentials secret: {e}") from e
+        if not {"access-key", "secret-key"} <= credentials.keys():
+            raise ValueError("The s3-credentials secret needs access-key and secret-key")
+        config = upload.S3Config(
+            endpoint,
+            bucket,
+            credentials["access-key"],
+            credentials["secret-key"],
+            str(self.config.get("s3-region", "")) or "us-east-1",
+        )
+        workers = int(self.config.get("s3-upload-parallelism", 4))
+        return upload.Uploader(upload.S3Client(config), workers=workers)
+
+    def _upload_prefix(self, run_id: str) -> str:
+        prefix = str(self.config.get("s3-prefix", "")).strip("/")
+        unit = self.unit.name.replace("/", "-")
+        return "/".join(filter(None, [prefix, self.model.name, unit, run_id]))
+
+    def _submit_uploads(self, uploader: upload.Uploader, run_id: str) -> int:
+        """Start uploading the artifacts of a run found so far; return how many there are."""
+        paths = [
+            path
+            for path in retention.run_paths(ACTION_HOME, run_id)
+            # The log and JUnit reports go up as the tarballs scripts/test.sh packs.
+            if path.is_file() and not path.name.endswith(".log")
+        ]
+        for path in paths:
+            uploader.submit(path, f"{self._upload_prefix(run_id)}/{path.name}")
+        return len(paths)
+
+    @traced("upload")
+    def _finish_uploads(self, uploader: upload.Uploader, run_id: str) -> Dict[str, str]:
+        self._submit_uploads(uploader, run_id)
+        done = uploader.wait()
+        bucket = self.config.get("s3-bucket")
+        return {
+            "location": f"s3://{bucket}/{self._upload_prefix(run_id)}/",
+            "uploaded": str(len(done["uploaded"])),
+            "failed": " ".join(done["failed"]),
+        }
+
+    def _on_upload_action(self, event: ops.ActionEvent) -> None:
+        run_id = str(event.params["run"])
+        try:
+            uploader = self._uploader()
+        except ValueError as e:
+            event.fail(str(e))
+            return
+        if uploader is None:
+            event.fail("s3-endpoint is not set.")
+            return
+        if not self._submit_uploads(uploader, run_id):
+            uploader.wait()
+            event.fail(f"No artifacts of run {run_id} on disk; restore them first.")
+            return
+        summary = self._finish_uploads(uploader, run_id)
+        event.set_results(summary)
+        if summary["failed"]:
+            event.fail(f"Failed to upload {summary['failed']}.")
+
+    @traced("metrics-snapshot")
+    def _latency_snapshot(self) -> benchmark.Snapshot:
+        return benchmark.snapshot()
+
+    def _benchmark_baseline(
+        self, event: ops.ActionEvent, history: RunHistory
+    ) -> Tuple[str, Optional[Dict]]:
+        """The run to compare with: the one asked for, or the last benchmark measured."""
+        if baseline := str(event.params.get("baseline", "")):
+            return baseline, history.latencies(baseline) or None
+        for run in history.query(action="benchmark", limit=20):
+            if latencies := history.latencies(run["id"]):
+                return run["id"], latencies
+        return "", None
 
+    def _on_benchmark_action(self, event: ops.ActionEvent) -> None:
         if not self._check_kube_config_exists(event):
             return
+        params = {p: str(event.params.get(p, "")) for p in TEST_PARAMS}
+        args = [params[param] for param in ["focus", "skip", "parallelism", "timeout"]]
+        args = verbose_args(args + shlex.split(params["extra"]))
 
-        logger.info("Running scripts/test.sh: %s", "".join(command))
+        history = RunHistory()
+        baseline_id, baseline = self._benchmark_baseline(event, history)
+        if baseline_id and baseline is None:
+            history.close()
+            event.fail(f"No latencies recorded for run {baseline_id}.")
+            return
+        try:
+            before = self._latency_snapshot()
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError) as e:
+            history.close()
+            logger.exception("Failed to read the cluster's metrics")
+            event.fail(f"Failed to read the cluster's metrics: {e}")
+            return
 
         previous_status = self.unit.status
+        self.unit.status = ops.MaintenanceStatus("Benchmarking...")
+        snap_revision = self._snap_revision("kubernetes-test")
+        history.start(event.id, params, snap_revision, action="benchmark")
+        runner = self._suite_runner(event.id, args)
+        failures = FailureTracker()
+        progress = checkpoint.Checkpoint(
+            checkpoint.checkpoint_path(event.id), {"run": event.id, "params": params}
+        )
+        markers = RunMarkers()
+        index = logindex.LogIndex(logindex.index_path(event.id))
+        runner.observers += [failures, progress, markers, index]
+        accounting, unconfined = self._isolate(runner, event.id)
+        self._report_unconfined(event, unconfined)
+
+        verdict = "error"
+        try:
+            returncode = self._run_suite(runner, event.id)
+            after = self._latency_snapshot()
+            latencies = benchmark.measure(before, after)
+            history.record_latencies(event.id, latencies)
+            _, reports = checkpoint.load(progress.path)
+            history.record_specs(event.id, reports.values())
+
+            event.set_results({"latency": benchmark.summarize(latencies, baseline)})
+            if baseline_id:
+                event.set_results({"baseline": baseline_id})
+            if accounting and (usage := accounting.summary()):
+                event.set_results({"usage": usage})
+            if failures.failures:
+                event.set_results({"failed-specs": "\n".join(failures.failures)})
+            if self._log_has_errors(event) or returncode != 0:
+                verdict = "failed"
+                event.fail("One or more specs of the workload failed.")
+            else:
+                verdict = "passed"
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError) as e:
+            logger.exception("Benchmark failed")
+            event.fail(f"Benchmark failed: {e}")
+        finally:
+            fields = markers.fields()
+            history.update(
+                event.id,
+                verdict=verdict,
+                artifacts=artifact_paths(event.id),
+                fingerprint=fingerprint(fields.get("server_version", ""), snap_revision),
+                **fields,
+            )
+            history.close()
+            self.tracer.write(Path(artifact_paths(event.id)["trace"]))
+            try:
+                event.set_results({"gc": self._collect_garbage()})
+            except OSError:
+                logger.exception("Failed to collect artifacts")
+            self.unit.status = previous_status
+
+    @traced("quarantine")
+    def _quarantine(self, event: ops.ActionEvent) -> Dict[str, str]:
+        mode = str(event.params.get("quarantine", "off"))
+        if mode == "off":
+            return {}
+        window = float(event.params.get("quarantine-window", 30)) * 24 * 3600
+        history = RunHistory()
+        try:
+            flakes = history.flakes(since=time.time() - window)
+        finally:
+            history.close()
+        quarantined = quarantine.select(
+            flakes, float(event.params.get("quarantine-threshold", 0.1))
+        )
+        if quarantined:
+            event.log(f"Quarantining {len(quarantined)} flaky specs ({mode}).")
+            event.set_results({"quarantine": {"mode": mode, "specs": yaml.safe_dump(quarantined)}})
+        return quarantined
+
+    def _suite_runner(self, run_id: str, args: List[str], result_key: str = "") -> E2ERunner:
+        command = ["scripts/test.sh", *args]
+        logger.info("Running scripts/test.sh: %s", " ".join(command))
+        env = {
+            **os.environ,
+            "E2E_RUN_ID": run_id,
+            "E2E_RESULT_KEY": result_key,
+            "E2E_ACTION_HOME": str(ACTION_HOME),
+            "E2E_KUBE_CONFIG": KUBE_CONFIG_PATH,
+            "E2E_JUNIT_MERGE": f"{sys.executable} {Path(__file__).parent / 'junit.py'}",
+            PHASES_ENV: str(self._phases_path(run_id)),
+        }
+        return E2ERunner(command, env=env)
+
+    def _isolate(
+        self, runner: E2ERunner, run_id: str
+    ) -> Tuple[Optional[cgroup.ScopeAccounting], str]:
+        """Move the suite into a scope of its own and account for what it uses.
+
+        Returns the accounting of the scope, or why the suite runs unconfined
+        when isolation is asked for but cannot be had.
+        """
+        if not self.config.get("runner-isolation"):
+            return None, ""
+        if not cgroup.available():
+            return None, "systemd does not manage this machine"
+        limits = {
+            "cpu_weight": int(self.config.get("runner-cpu-weight", 0)),
+            "memory_high": str(self.config.get("runner-memory-high", "")),
+            "memory_max": str(self.config.get("runner-memory-max", "")),
+        }
+        try:
+            command = cgroup.scope_command(run_id, runner.command, **limits)
+            cgroup.probe_scope(run_id, **limits)
+        except ValueError as e:
+            logger.error("Running the suite unconfined: %s", e)
+            return None, str(e)
+        runner.command = command
+        accounting = cgroup.ScopeAccounting(run_id)
+        runner.observers.append(accounting)
+        return accounting, ""
+
+    def _report_unconfined(self, event: ops.ActionEvent, reason: str) -> None:
+        if reason:
+            event.log(f"Running the suite unconfined: {reason}")
+            event.set_results({"unconfined": reason})
+
+    def _phases_path(self, run_id: str) -> Path:
+        return Path(tempfile.gettempdir()) / f"kubernetes-e2e-{run_id}.phases"
+
+    def _run_suite(self, runner: E2ERunner, run_id: str) -> int:
+        """Run a suite, tracing the phases scripts/test.sh reports."""
+        phases = self._phases_path(run_id)
+        phases.unlink(missing_ok=True)
+        scratch = ScratchSpace(run_id, int(self.config.get("scratch-size", 0)), ACTION_HOME)
+        try:
+            with scratch, self.tracer.span("run", run=run_id) as span:
+                span.args["scratch"] = "tmpfs" if scratch.tmpfs else "disk"
+                if scratch.fallback:
+                    span.args["scratch-fallback"] = scratch.fallback
+                if runner.env is not None:
+                    runner.env.update(scratch.env())
+                runner.observers.append(scratch)
+                return runner.run()
+        finally:
+            self.tracer.import_phases(phases)
+            phases.unlink(missing_ok=True)
+
+    @traced("quarantine-pass")
+    def _run_quarantined(
+        self, event: ops.ActionEvent, args: List[str], quarantined: Dict[str, str]
+    ) -> List[SpecReport]:
+        """Run the quarantined specs on their own, letting ginkgo retry them."""
+        self.unit.status = ops.MaintenanceStatus("Retrying quarantined specs...")
+        run_id = f"{event.id}-quarantine"
+        _, skip, parallelism, timeout, *extra = args
+        args = [quarantine.focus_pattern(quarantined), skip, parallelism, timeout]
+        runner = self._suite_runner(run_id, args + quarantine.retry_args(extra), "quarantine.")
+        failures = FailureTracker()
+        progress = checkpoint.Checkpoint(checkpoint.checkpoint_path(run_id), {"run": run_id})
+        index = logindex.LogIndex(logindex.index_path(run_id))
+        runner.observers += [failures, progress, index]
+        self._report_unconfined(event, self._isolate(runner, run_id)[1])
+        returncode = self._run_suite(runner, run_id)
+
+        results = {"verdict": "failed" if failures.failures or returncode != 0 else "passed"}
+        if failures.failures:
+            results["failed-specs"] = "\n".join(failures.failures)
+        event.set_results({"quarantine": results})
+        _, reports = checkpoint.load(progress.path)
+        return list(reports.values())
+
+    def _on_test_action(self, event: ops.ActionEvent) -> None:
+        requests = coalesce.RequestLog()
+        if run_id := self._queued_behind(event, requests):
+            requests.finish(event.id, run_id)
+            return
+        try:
+            self._test(event)
+        finally:
+            requests.finish(event.id, event.id)
+
+    def _queued_behind(self, event: ops.ActionEvent, requests: coalesce.RequestLog) -> str:
+        """Answer a request with the run of an identical one it queued behind, if any."""
+        try:
+            kubeconfig = Path(KUBE_CONFIG_PATH).read_bytes()
+        except OSError:
+            kubeconfig = b""
+        # Whether to coalesce does not make requests differ.
+        params = {name: value for name, value in event.params.items() if name != "coalesce"}
+        key = coalesce.request_key(params, kubeconfig, self._snap_revision("kubernetes-test"))
+        # Every request is logged, so that the ones queued behind it can be coalesced.
+        run_id = requests.start(event.id, key)
+        history = RunHistory()
+        try:
+            runs = [history.get(run) for run in requests.runs(key)]
+            if (expected := coalesce.expected_duration(runs)) is not None:
+                event.set_results({"expected-duration": f"{expected:.0f}s"})
+            if not run_id or not event.params.get("coalesce"):
+                return ""
+            run = history.get(run_id)
+            failed = history.failed_specs(run_id)
+            # Its artifacts are the answer to this request too.
+            history.touch(run_id)
+        finally:
+            history.close()
+        if not run or run["verdict"] not in coalesce.VERDICTS:
+            return ""
+        event.log(f"Queued behind the identical run {run_id}, answering with its results.")
+        event.set_results(
+            {"answered-by": run_id, "verdict": run["verdict"], "artifacts": run["artifacts"]}
+        )
+        if failed:
+            event.set_results({"failed-specs": "\n".join(failed)})
+        event.set_results({"result": "Tests ran successfully."})
+        return run_id
+
+    def _test(self, event: ops.ActionEvent) -> None:
+        try:
+            uploader = self._uploader()
+        except ValueError as e:
+            logger.error("Not uploading artifacts: %s", e)
+            event.log(f"Not uploading artifacts: {e}")
+            event.set_results({"upload": {"error": str(e)}})
+            uploader = None
+
+        with self.tracer.span("test"):
+            suites = self._run_tests(event, uploader)
+
+        trace = Path(artifact_paths(event.id)["trace"])
+        self.tracer.write(trace)
+        if uploader:
+            event.set_results({"upload": self._finish_uploads(uploader, event.id)})
+            # The uploaded trace ends where the upload began; the one on disk covers it.
+            self.tracer.write(trace)
+        timings = {name: f"{seconds:.1f}s" for name, seconds in self.tracer.summary().items()}
+        event.set_results({"trace": str(trace), "timings": timings})
+        # The budget is enforced after every action which writes artifacts.
+        try:
+            if self.config.get("artifact-store") and suites:
+                stored = {name: self._store_artifacts(run_id) for name, run_id in suites.items()}
+                event.set_results({"store": stored})
+            elif self.config.get("artifact-store"):
+                event.set_results({"store": self._store_artifacts(event.id)})
+            event.set_results({"gc": self._collect_garbage()})
+        except OSError:
+            logger.exception("Failed to store or collect artifacts")
+
+    def _run_tests(
+        self, event: ops.ActionEvent, uploader: Optional[upload.Uploader] = None
+    ) -> Dict[str, str]:
+        """Run the suite, or the suites of a matrix, and return the run id of each suite."""
+        params = {p: str(event.params.get(p, "")) for p in TEST_PARAMS}
+        resume = str(event.params.get("resume", ""))
+        completed = {}
+        if resume:
+            original = checkpoint.checkpoint_path(resume)
+            if not original.exists():
+                event.fail(f"No checkpoint found for run {resume}.")
+                return {}
+            header, completed = checkpoint.load(original)
+            params.update(header.get("params", {}))
+            event.log(f"Resuming run {resume}, skipping {len(completed)} finished specs.")
+
+        # Param order matters here because test.sh uses $1, $2, etc.
+        args = [params[param] for param in ["focus", "skip", "parallelism", "timeout"]]
+        args = verbose_args(args + shlex.split(params["extra"]))
+
+        suites = []
+        if matrix_text := str(event.params.get("matrix", "")):
+            if resume or event.params.get("quarantine") == "retry":
+                event.fail("A matrix can neither be resumed nor retry quarantined specs.")
+                return {}
+            try:
+                suites = matrix.parse(matrix_text, params)
+            except ValueError as e:
+                event.fail(f"Invalid matrix: {e}")
+                return {}
+
+        if not self._check_kube_config_exists(event):
+            return {}
+
+        previous_status = self.unit.status
+        if event.params.get("cleanup-before"):
+            self._cleanup(event, "cleanup-before")
+
+        if event.params.get("prepull") and not self._prepull_images(event):
+            self.unit.status = previous_status
+            return {}
+
+        quarantined = self._quarantine(event)
         self.unit.status = ops.MaintenanceStatus("Tests running...")
 
-        # Let check=False so the log and process return code can be checked below.
-        process = subprocess.run(command, capture_output=False, check=False)
+        snap_revision = self._snap_revision("kubernetes-test")
+        if suites:
+            try:
+                return self._run_matrix(event, suites, quarantined, snap_revision, uploader)
+            finally:
+                if event.params.get("cleanup-after"):
+                    self._cleanup(event, "cleanup-after")
+                self.unit.status = previous_status
+
+        history = RunHistory()
+        history.start(event.id, {**params, "resume": resume}, snap_revision)
+
+        runner = self._suite_runner(
+            event.id, args + checkpoint.skip_args([*completed, *quarantined])
+        )
+        failures = FailureTracker(int(event.params.get("max-failures", 0)), stop=runner.stop)
+        progress = checkpoint.Checkpoint(
+            checkpoint.checkpoint_path(event.id),
+            {"run": event.id, "resumes": resume, "params": params},
+        )
+        markers = RunMarkers()
+        index = logindex.LogIndex(logindex.index_path(event.id))
+        demux = NodeDemux(nodes_dir(event.id), ginkgo_report(event.id))
+        runner.observers += [failures, progress, markers, index, demux]
+        accounting, unconfined = self._isolate(runner, event.id)
+        self._report_unconfined(event, unconfined)
+        sampler = self._sampler(event, event.id)
+        if sampler:
+            runner.observers.append(sampler)
+
+        # The log and process return code are checked below.
+        started = time.monotonic()
+        with sampler or nullcontext():
+            returncode = self._run_suite(runner, event.id)
+        run_seconds = time.monotonic() - started
+        if sampler and (resources := sampler.summary()):
+            event.set_results({"resources": resources})
+        if node_timing := demux.summary():
+            event.set_results({"nodes": node_timing})
+        if accounting and (usage := accounting.summary()):
+            event.set_results({"usage": usage})
+        # The tarballs are packed; upload them while the run is wrapped up.
+        if uploader:
+            self._submit_uploads(uploader, event.id)
 
+        verdict = "error"
+        specs: List[SpecReport] = []
         try:
-            if self._log_has_errors(event) or process.returncode != 0:
+            _, reports = checkpoint.load(progress.path)
+            specs += reports.values()
+            if quarantined and event.params.get("quarantine") == "retry":
+                specs += self._run_quarantined(event, args, quarantined)
+            history.record_specs(event.id, specs)
+
+            if failures.failures:
+                event.set_results({"failed-specs": "\n".join(failures.failures)})
+            combined_failed = resume and self._merge_resumed_run(event, resume)
+            if runner.stop_reason:
+                verdict = "partial"
+                event.set_results({"partial": "true", "stop-reason": runner.stop_reason})
+                event.fail(f"Stopped early: {runner.stop_reason}.")
+            elif self._log_has_errors(event) or returncode != 0 or combined_failed:
+                verdict = "failed"
                 event.fail("One or more tests failed.")
             else:
+                verdict = "passed"
                 event.set_results({"result": "Tests ran successfully."})
         finally:
+            fields = markers.fields()
+            history.update(
+                event.id,
+                verdict=verdict,
+                artifacts=artifact_paths(event.id),
+                fingerprint=fingerprint(fields.get("server_version", ""), snap_revision),
+                **fields,
+            )
+            history.close()
+            self.metrics.record_run(run_seconds, verdict, specs)
+            if event.params.get("cleanup-after"):
+                self._cleanup(event, "cleanup-after")
             self.unit.status = previous_status
+        return {}
+
+    def _schedulable_nodes(self) -> int:
+        """How many cluster nodes take test pods, or 0 if they cannot be listed."""
+        try:
+            return matrix.schedulable_nodes(kubectl_json("get", "nodes", timeout=60)["items"])
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError, TypeError):
+            logger.exception("Failed to list the cluster's nodes")
+            return 0
+
+    def _sampler(self, event: ops.ActionEvent, run_id: str) -> Optional[ResourceSampler]:
+        interval = float(event.params.get("sample-interval", 0))
+        if interval <= 0:
+            return None
+        return ResourceSampler(Path(artifact_paths(run_id)["resources"]), interval)
+
+    @traced("version-probe")
+    def _server_version(self) -> str:
+        """The version of the cluster's API server, or "" if it cannot be told."""
+        try:
+            return kubectl_json("version", timeout=60)["serverVersion"]["gitVersion"]
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError, TypeError):
+            logger.exception("Failed to probe the server version")
+            return ""
+
+    def _run_matrix(
+        self,
+        event: ops.ActionEvent,
+        suites: List[matrix.Suite],
+        quarantined: Dict[str, str],
+        snap_revision: str,
+        uploader: Optional[upload.Uploader],
+    ) -> Dict[str, str]:
+        """Run the suites of a matrix side by side as far as the node budget allows."""
+        max_nodes = int(self.config.get("matrix-max-nodes", 0))
+        nodes = matrix.capacity(max_nodes, self._schedulable_nodes() if max_nodes <= 0 else 0)
+        event.log(f"Running {len(suites)} suites, up to {nodes} ginkgo nodes at once.")
+        version = self._server_version()
+        max_failures = int(event.params.get("max-failures", 0))
+        # One sampler watches the cluster for every suite.
+        sampler = self._sampler(event, event.id)
+        started = time.monotonic()
+
+        def run(suite: matrix.Suite) -> Tuple[Dict[str, str], List[SpecReport]]:
+            run_id = f"{event.id}.{suite.name}"
+            try:
+                return self._run_matrix_suite(
+                    run_id,
+                    suite,
+                    quarantined,
+                    snap_revision,
+                    version,
+                    max_failures,
+                    uploader,
+                    sampler,
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception("Suite %s failed to run", suite.name)
+                return {"verdict": "error", "error": str(e)}, []
+
+        with sampler or nullcontext():
+            outcomes = matrix.schedule(suites, nodes, run)
+        if sampler and (resources := sampler.summary()):
+            event.set_results({"resources": resources})
+        specs = [spec for _, reports in outcomes.values() for spec in reports]
+        verdicts = {name: results["verdict"] for name, (results, _) in outcomes.items()}
+        verdict = "passed" if set(verdicts.values()) == {"passed"} else "failed"
+        self.metrics.record_run(time.monotonic() - started, verdict, specs)
+
+        event.set_results({"suites": {name: results for name, (results, _) in outcomes.items()}})
+        if failed := [
+            name for name, suite_verdict in verdicts.items() if suite_verdict != "passed"
+        ]:
+            event.fail(f"Suites did not pass: {', '.join(failed)}.")
+        else:
+            event.set_results({"result": "Tests ran successfully."})
+        return {suite.name: f"{event.id}.{suite.name}" for suite in suites}
+
+    def _run_matrix_suite(
+        self,
+        run_id: str,
+        suite: matrix.Suite,
+        quarantined: Dict[str, str],
+        snap_revision: str,
+        version: str,
+        max_failures: int,
+        uploader: Optional[upload.Uploader],
+        sampler: Optional[ResourceSampler],
+    ) -> Tuple[Dict[str, str], List[SpecReport]]:
+        """Run one suite of a matrix; called from the scheduler's threads."""
+        history = RunHistory()
+        history.start(run_id, suite.params(), snap_revision)
+        runner = self._suite_runner(
+            run_id,
+            verbose_args(suite.args()) + checkpoint.skip_args(quarantined),
+            f"suites.{suite.name}.",
+        )
+        if version and runner.env is not None:
+            runner.env["E2E_SERVER_VERSION"] = version
+        failures = FailureTracker(max_failures, stop=runner.stop)
+        progress = checkpoint.Checkpoint(
+            checkpoint.checkpoint_path(run_id), {"run": run_id, "params": suite.params()}
+        )
+        markers = RunMarkers()
+        index = logindex.LogIndex(logindex.index_path(run_id))
+        demux = NodeDemux(nodes_dir(run_id), ginkgo_report(run_id))
+        runner.observers += [failures, progress, markers, index, demux]
+        accounting, unconfined = self._isolate(runner, run_id)
+        if sampler:
+            runner.observers.append(sampler)
+
+        started = time.monotonic()
+        verdict = "error"
+        specs: List[SpecReport] = []
+        try:
+            returncode = self._run_suite(runner, run_id)
+            if uploader:
+                self._submit_uploads(uploader, run_id)
+            _, reports = checkpoint.load(progress.path)
+            specs += reports.values()
+            history.record_specs(run_id, specs)
+            log = Path(artifact_paths(run_id)["log"])
+            if runner.stop_reason:
+                verdict = "partial"
+            elif (
+                returncode != 0
+                or not log.exists()
+                or "Test Suite Failed" in log.read_text(errors="replace")
+            ):
+                verdict = "failed"
+            else:
+                verdict = "passed"
+        finally:
+            fields = markers.fields()
+            history.update(
+                run_id,
+                verdict=verdict,
+                artifacts=artifact_paths(run_id),
+                fingerprint=fingerprint(fields.get("server_version", ""), snap_revision),
+                **fields,
+            )
+            history.close()
+
+        results = {
+            "run": run_id,
+            "verdict": verdict,
+            "seconds": f"{time.monotonic() - started:.1f}",
+        }
+        if failures.failures:
+            results["failed-specs"] = "\n".join(failures.failures)
+        if runner.stop_reason:
+            results["stop-reason"] = runner.stop_reason
+        if unconfined:
+            results["unconfined"] = unconfined
+        node_timing = demux.summary()
+        for key in ("utilisation", "stragglers"):
+            if key in node_timing:
+                results[f"node-{key}"] = node_timing[key]
+        if accounting:
+            results.update(accounting.summary())
+        return results, specs
 
 
 if __name__ == "__main__":  # pragma: nocover
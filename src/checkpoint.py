@@ -0,0 +1,114 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Checkpoint completed specs to disk so interrupted runs can be resumed."""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from ginkgo import SpecReport, spec_regex
+from runner import RunObserver, artifact_paths
+
+logger = logging.getLogger(__name__)
+
+FSYNC_EVERY = 10
+# Stay well clear of the kernel's limit on the length of a single argument.
+MAX_SKIP_ARG_LENGTH = 64 * 1024
+
+
+def checkpoint_path(run_id: str) -> Path:
+    """Path of the checkpoint kept for a run."""
+    return Path(artifact_paths(run_id)["checkpoint"])
+
+
+class Checkpoint(RunObserver):
+    """Append every finished spec to a JSON lines file as the run goes.
+
+    The first line holds the run's parameters so a resumed run can repeat
+    them.
+    """
+
+    def __init__(self, path: Path, header: dict):
+        self.path = path
+        self._file = path.open("w", encoding="utf-8")
+        self._unsynced = 0
+        self._write(header)
+        self._sync()
+
+    def on_spec(self, report: SpecReport) -> None:
+        """Persist a finished spec."""
+        if report.state == "interrupted":
+            return
+        self._write({"name": report.name, "state": report.state, "seconds": report.seconds})
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY:
+            self._sync()
+
+    def close(self) -> None:
+        """Flush everything to disk."""
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+
+def load(path: Path) -> Tuple[dict, Dict[str, SpecReport]]:
+    """Read a checkpoint, returning its header and the latest result per spec."""
+    header: dict = {}
+    reports: Dict[str, SpecReport] = {}
+    with path.open(encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be torn if the unit went down mid-write.
+                logger.warning("Ignoring corrupt line %d of %s", number + 1, path)
+                continue
+            if number == 0:
+                header = record
+            else:
+                reports[record["name"]] = SpecReport(
+                    record["name"], record["state"], record["seconds"]
+                )
+    return header, reports
+
+
+def append(path: Path, reports: Iterable[SpecReport]) -> None:
+    """Merge the specs finished by a resumed run into the original checkpoint."""
+    with path.open("a", encoding="utf-8") as f:
+        for report in reports:
+            record = {"name": report.name, "state": report.state, "seconds": report.seconds}
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def skip_args(names: Iterable[str]) -> List[str]:
+    """Build -ginkgo.skip arguments which skip exactly the given specs.
+
+    Ginkgo ORs repeated -ginkgo.skip flags, so long lists are split across
+    several arguments.
+    """
+    args: List[str] = []
+    chunk: List[str] = []
+    length = 0
+    for name in sorted(names):
+        pattern = spec_regex(name)
+        if chunk and length + len(pattern) + 1 > MAX_SKIP_ARG_LENGTH:
+            args += ["-ginkgo.skip", "|".join(chunk)]
+            chunk, length = [], 0
+        chunk.append(pattern)
+        length += len(pattern) + 1
+    if chunk:
+        args += ["-ginkgo.skip", "|".join(chunk)]
+    return args
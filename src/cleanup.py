@@ -0,0 +1,104 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Remove namespaces and objects left behind by aborted or failed e2e runs.
+
+Nothing tells which runner created an e2e object, so the objects of a suite
+still running elsewhere against the same cluster look like leftovers. Only
+objects older than a minimum age are deleted, which spares the specs other
+runners are in the middle of, as long as none runs longer than that age.
+"""
+
+import logging
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from kubectl import kubectl, kubectl_json
+from prepull import PREPULL_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+# The e2e framework labels every namespace it creates with the run it belongs to.
+E2E_NAMESPACE_SELECTOR = "e2e-run"
+# Cluster scoped objects are named by the specs which create them.
+E2E_CLUSTER_OBJECT_PATTERN = re.compile(r"^e2e-test-")
+E2E_CLUSTER_KINDS = [
+    "customresourcedefinitions",
+    "validatingwebhookconfigurations",
+    "mutatingwebhookconfigurations",
+    "clusterroles",
+    "clusterrolebindings",
+    "priorityclasses",
+]
+POLL_INTERVAL = 2
+# Objects younger than this may belong to a run still going on elsewhere.
+MIN_AGE = 3600
+
+
+def _created(item: dict) -> float:
+    """When an object was created, as a timestamp."""
+    created = item["metadata"]["creationTimestamp"]
+    return datetime.fromisoformat(created.replace("Z", "+00:00")).timestamp()
+
+
+def find_leftovers(min_age: float = MIN_AGE) -> Dict[str, List[str]]:
+    """Find every leftover e2e object created at least min_age seconds ago, keyed by kind."""
+    created_before = time.time() - min_age
+
+    def old(items: List[dict]) -> List[str]:
+        return [item["metadata"]["name"] for item in items if _created(item) <= created_before]
+
+    namespaces = kubectl_json("get", "namespaces", "-l", E2E_NAMESPACE_SELECTOR)["items"]
+    prepull = kubectl_json(
+        "get", "namespaces", "--field-selector", f"metadata.name={PREPULL_NAMESPACE}"
+    )["items"]
+    leftovers = {"namespaces": old(namespaces + prepull)}
+    for kind in E2E_CLUSTER_KINDS:
+        names = old(kubectl_json("get", kind)["items"])
+        leftovers[kind] = [name for name in names if E2E_CLUSTER_OBJECT_PATTERN.match(name)]
+    return {kind: names for kind, names in leftovers.items() if names}
+
+
+def _delete(kind_and_name: Tuple[str, str]) -> bool:
+    kind, name = kind_and_name
+    try:
+        kubectl("delete", kind, name, "--ignore-not-found", "--wait=false", timeout=60)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        logger.exception("Failed to delete %s/%s", kind, name)
+        return False
+    return True
+
+
+def _remaining_namespaces(names: List[str]) -> List[str]:
+    existing = kubectl("get", "namespaces", "-o", "name").split()
+    existing = {name.split("/", 1)[-1] for name in existing}
+    return [name for name in names if name in existing]
+
+
+def cleanup(concurrency: int = 10, timeout: float = 900, min_age: float = MIN_AGE) -> dict:
+    """Delete the leftover e2e objects and wait until their namespaces are gone."""
+    started = time.monotonic()
+    leftovers = find_leftovers(min_age)
+    targets = [(kind, name) for kind, names in leftovers.items() for name in names]
+    logger.info("Deleting %d leftover e2e objects", len(targets))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        failed = sum(not ok for ok in executor.map(_delete, targets))
+
+    remaining = leftovers.get("namespaces", [])
+    deadline = started + timeout
+    while remaining and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        remaining = _remaining_namespaces(remaining)
+
+    return {
+        "namespaces": str(len(leftovers.get("namespaces", []))),
+        "objects": str(len(targets)),
+        "failed": str(failed),
+        "remaining": str(len(remaining)),
+        "seconds": f"{time.monotonic() - started:.1f}",
+    }
@@ -0,0 +1,135 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Answer test requests which queued up behind an identical run with its results.
+
+Juju runs the actions of a unit one after the other, in the order they were
+queued. A request which starts right after the previous one ended was queued
+while it ran, and if that was a run of the same parameters against the same
+cluster with the same snap and it passed, it answers the waiting request
+too, as it does any identical requests queued behind that one, if they ask
+to be coalesced. A request which finds the unit idle, or follows a run of
+anything else, runs on its own.
+
+A request sent just after a run ended cannot be told from one queued while
+it ran, which is why coalescing is left to the requests which ask for it.
+
+Juju does not show the charm the actions still queued, so there are no queue
+positions to report. What the unit can tell a request is how long the
+identical runs it remembers took.
+"""
+
+import hashlib
+import json
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from history import STATE_DIR
+
+REQUEST_LOG = STATE_DIR / "requests.json"
+# How long after one action ends a queued one has started by, with room for
+# the end of the previous dispatch and a slow agent.
+QUEUE_GAP = 30.0
+# Only a pass answers other requests: a failure is what a retry is sent to test again.
+VERDICTS = ("passed",)
+KEPT_REQUESTS = 50
+# The runs whose durations tell how long an identical one takes.
+TIMED_VERDICTS = ("passed", "failed")
+
+
+def request_key(params: Dict[str, Any], kubeconfig: bytes, snap_revision: str) -> str:
+    """What makes two requests identical: their parameters, cluster and snap."""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(hashlib.sha256(kubeconfig).digest())
+    digest.update(snap_revision.encode())
+    return digest.hexdigest()
+
+
+def expected_duration(runs: Iterable[Optional[Dict[str, Any]]]) -> Optional[float]:
+    """The median seconds the suite took in the given runs of the history, if any tell."""
+    durations = [
+        run["ended_at"] - run["started_at"]
+        for run in runs
+        if run
+        and run["verdict"] in TIMED_VERDICTS
+        and run.get("started_at") is not None
+        and run.get("ended_at") is not None
+    ]
+    return statistics.median(durations) if durations else None
+
+
+@dataclass
+class Request:
+    """A test request and the run which answered it."""
+
+    id: str
+    key: str
+    started: float
+    finished: float = 0.0
+    # The run whose results answered the request, its own unless it was coalesced.
+    run: str = ""
+
+
+def _newer(action_id: str, than: str) -> bool:
+    """Whether one action was queued after another, where Juju numbers them."""
+    if action_id.isdigit() and than.isdigit():
+        return int(action_id) > int(than)
+    return True
+
+
+class RequestLog:
+    """The latest test requests of the unit, kept between actions."""
+
+    def __init__(self, path: Path = REQUEST_LOG, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        try:
+            self.requests = [Request(**entry) for entry in json.loads(path.read_text())]
+        except (OSError, ValueError, TypeError):
+            self.requests = []
+
+    def start(self, action_id: str, key: str) -> Optional[str]:
+        """Record a request; return the identical run it queued behind, if any."""
+        request = Request(action_id, key, self._clock())
+        source = self._source(request)
+        self.requests = [*self.requests, request][-KEPT_REQUESTS:]
+        self._save()
+        return source
+
+    def finish(self, action_id: str, run: str) -> None:
+        """Record that a request is over, and which run answered it."""
+        for request in self.requests:
+            if request.id == action_id:
+                request.finished = self._clock()
+                request.run = run
+        self._save()
+
+    def runs(self, key: str) -> List[str]:
+        """The runs of the requests with this key which ran the suite, newest first."""
+        return [
+            request.id
+            for request in reversed(self.requests)
+            if request.key == key and request.run == request.id
+        ]
+
+    def _source(self, request: Request) -> Optional[str]:
+        """Walk back over the requests the unit answered back to back."""
+        after = request.started
+        for previous in reversed(self.requests):
+            if previous.key != request.key or not previous.run:
+                return None
+            if not previous.finished or after - previous.finished > QUEUE_GAP:
+                return None
+            if previous.run == previous.id:
+                return previous.id if _newer(request.id, previous.id) else None
+            after = previous.started
+        return None
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps([asdict(request) for request in self.requests]))
+        tmp.replace(self.path)
@@ -0,0 +1,144 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Compare the verdicts and spec durations of two e2e runs."""
+
+import math
+import re
+import statistics
+from collections import defaultdict
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from ginkgo import SpecReport, spec_name
+
+SIG_PATTERN = re.compile(r"^\[(sig-[\w-]+)\]")
+# A spec's duration change must be at least this many seconds to be reported.
+MIN_DELTA_SECONDS = 1.0
+# Outlier threshold, in robust standard deviations, for per-spec changes.
+SPEC_Z_THRESHOLD = 3.0
+# Threshold on the paired t statistic of a SIG's per-spec log ratios.
+SIG_T_THRESHOLD = 2.0
+MAD_TO_SIGMA = 1.4826
+
+
+def sig_of(name: str) -> str:
+    """The SIG a spec belongs to, taken from its leading [sig-*] label."""
+    match = SIG_PATTERN.match(name)
+    return match[1] if match else "other"
+
+
+def junit_source(artifacts: Dict[str, str]) -> Optional[Path]:
+    """Pick the JUnit artifact of a run that is still on disk."""
+    for key in ("junit-combined", "junit", "junit-tgz"):
+        if (path := artifacts.get(key)) and Path(path).exists():
+            return Path(path)
+    return None
+
+
+def load_results(reports: Iterable[SpecReport]) -> Dict[str, SpecReport]:
+    """Keep the last result for each spec which actually ran, by its bare spec name.
+
+    Per-node JUnit reports prefix names with the node type, as in "[It] [sig-node] ...",
+    where the combined report and the checkpoint do not.
+    """
+    results = {}
+    for report in reports:
+        if name := spec_name(report.name):
+            results[name] = replace(report, name=name)
+    return results
+
+
+def _ran(report: Optional[SpecReport]) -> bool:
+    return report is not None and report.state not in ("skipped", "pending")
+
+
+def compare(base: Dict[str, SpecReport], target: Dict[str, SpecReport]) -> dict:
+    """Report verdict changes and significant duration changes between two runs."""
+    names = sorted(set(base) | set(target))
+    new_failures = [
+        n
+        for n in names
+        if _ran(base.get(n)) and target.get(n) and target[n].failed and not base[n].failed
+    ]
+    new_passes = [
+        n
+        for n in names
+        if base.get(n) and base[n].failed and target.get(n) and target[n].state == "passed"
+    ]
+    missing = [n for n in names if _ran(base.get(n)) and not _ran(target.get(n))]
+    added = [n for n in names if _ran(target.get(n)) and not _ran(base.get(n))]
+
+    # Durations are compared on a log scale so that one slow spec does not
+    # dominate, and relative to the run-wide median change so that a uniformly
+    # slower cluster does not flag every spec.
+    paired = {
+        n: (base[n].seconds, target[n].seconds)
+        for n in names
+        if n in base
+        and n in target
+        and base[n].state == target[n].state == "passed"
+        and base[n].seconds > 0
+        and target[n].seconds > 0
+    }
+    ratios = {n: math.log(b / a) for n, (a, b) in paired.items()}
+    changes = []
+    if len(ratios) >= 3:
+        median = statistics.median(ratios.values())
+        mad = statistics.median(abs(r - median) for r in ratios.values()) * MAD_TO_SIGMA
+        for n, ratio in ratios.items():
+            before, after = paired[n]
+            if mad:
+                z = (ratio - median) / mad
+            else:
+                z = 0.0 if ratio == median else math.inf
+            if abs(after - before) >= MIN_DELTA_SECONDS and abs(z) >= SPEC_Z_THRESHOLD:
+                changes.append((n, before, after))
+    changes.sort(key=lambda change: change[2] - change[1], reverse=True)
+
+    return {
+        "new-failures": new_failures,
+        "new-passes": new_passes,
+        "missing": missing,
+        "added": added,
+        "slower": [_change(*c) for c in changes if c[2] > c[1]],
+        "faster": [_change(*c) for c in reversed(changes) if c[2] < c[1]],
+        "sigs": _compare_sigs(base, target, ratios),
+    }
+
+
+def _change(name: str, before: float, after: float) -> str:
+    return f"{name}: {before:.1f}s -> {after:.1f}s"
+
+
+def _compare_sigs(
+    base: Dict[str, SpecReport], target: Dict[str, SpecReport], ratios: Dict[str, float]
+) -> Dict[str, dict]:
+    totals: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for report in base.values():
+        totals[sig_of(report.name)][0] += report.seconds
+    for report in target.values():
+        totals[sig_of(report.name)][1] += report.seconds
+
+    by_sig: Dict[str, List[float]] = defaultdict(list)
+    for name, ratio in ratios.items():
+        by_sig[sig_of(name)].append(ratio)
+
+    sigs = {}
+    for sig, (before, after) in sorted(totals.items()):
+        samples = by_sig.get(sig, [])
+        significant = False
+        if len(samples) >= 3:
+            spread = statistics.stdev(samples)
+            mean = statistics.fmean(samples)
+            if spread:
+                significant = abs(mean / (spread / math.sqrt(len(samples)))) >= SIG_T_THRESHOLD
+            else:
+                significant = mean != 0
+        sigs[sig] = {
+            "before": f"{before:.1f}s",
+            "after": f"{after:.1f}s",
+            "significant": significant,
+        }
+    return sigs
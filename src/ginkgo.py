@@ -0,0 +1,150 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Incremental parser for the spec reports ginkgo writes while the suite runs."""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+SEPARATOR = "------------------------------"
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+# Ginkgo prefixes streamed output with the parallel node that produced it.
+NODE_PREFIX = re.compile(r"^\[(?P<node>\d+)\] ")
+STATUS_LINE = re.compile(
+    r"^(?P<mark>[•SP])\s*(?P<label>.*?)\s*\[(?:SLOW TEST:)?(?P<seconds>[\d.]+) seconds\]\s*$"
+)
+SOURCE_LINE = re.compile(r"^\S+\.go:\d+$")
+NODE_TYPES = (
+    r"It|BeforeEach|AfterEach|JustBeforeEach|JustAfterEach|BeforeAll|AfterAll"
+    r"|DeferCleanup[^\]]*|SynchronizedBeforeSuite|SynchronizedAfterSuite"
+)
+# Markers ginkgo inserts into the spec text to show which node failed.
+NODE_TYPE_MARKER = re.compile(rf" \[({NODE_TYPES})\]")
+# Ginkgo v2's JUnit reports name each testcase after its node type first.
+NODE_TYPE_LABEL = re.compile(rf"^\[({NODE_TYPES}|BeforeSuite|AfterSuite|ReportAfterSuite)\] ")
+FAILED_STATES = {"failed", "panicked", "timedout"}
+# Ginkgo v2 matches -ginkgo.focus and -ginkgo.skip against the suite
+# description followed by the spec text; this is the one e2e.test runs with.
+SUITE_DESCRIPTION = "Kubernetes e2e suite"
+
+
+@dataclass
+class SpecReport:
+    """The outcome of one spec as reported by ginkgo."""
+
+    name: str
+    state: str
+    seconds: float
+    node: Optional[int] = None
+    start: int = 0
+    end: int = 0
+
+    @property
+    def failed(self) -> bool:
+        """Whether the spec counts as a failure."""
+        return self.state in FAILED_STATES
+
+
+def spec_regex(name: str) -> str:
+    """A regex for -ginkgo.focus or -ginkgo.skip matching one spec by its full text.
+
+    Ginkgo searches the full text for the regex, so without the anchors a spec
+    would also match every spec whose name it is a prefix of. The text starts
+    with the suite description under ginkgo v2 and with the spec under v1.
+    """
+    return f"^(?:{re.escape(SUITE_DESCRIPTION)} )?(?:{re.escape(name)})$"
+
+
+def spec_state(mark: str, label: str) -> str:
+    """Map a ginkgo status marker and label to a spec state."""
+    label = label.upper()
+    if "PANIC" in label:
+        return "panicked"
+    if "TIMEDOUT" in label or "TIMED OUT" in label:
+        return "timedout"
+    if "INTERRUPTED" in label:
+        return "interrupted"
+    if "FAIL" in label:
+        return "failed"
+    if mark == "S" or "SKIP" in label:
+        return "skipped"
+    if mark == "P" or "PENDING" in label:
+        return "pending"
+    return "passed"
+
+
+def spec_name(line: str) -> str:
+    """Strip ginkgo's node-type markers so the name matches -ginkgo.focus/skip."""
+    return NODE_TYPE_MARKER.sub("", NODE_TYPE_LABEL.sub("", line.strip()))
+
+
+class _Block:
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.name: Optional[str] = None
+        self.status: Optional[re.Match] = None
+
+
+class GinkgoParser:
+    """Turn the suite's output, line by line, into SpecReports.
+
+    Ginkgo separates spec reports with a dashed line. A report contains a
+    status line such as ``• [FAILED] [1.234 seconds]`` and, unless ginkgo
+    is running succinctly, the full spec text.
+    """
+
+    def __init__(self):
+        self._blocks: Dict[Optional[int], _Block] = {}
+
+    def feed(self, line: str, offset: int = 0, length: int = 0) -> List[SpecReport]:
+        """Consume one line of output and return any specs it completed."""
+        text = ANSI_ESCAPE.sub("", line.rstrip("\r\n"))
+        node = None
+        if match := NODE_PREFIX.match(text):
+            node = int(match["node"])
+            text = text[match.end() :]
+
+        if text.strip() == SEPARATOR:
+            reports = self._close(node)
+            self._blocks[node] = _Block(offset)
+            return reports
+
+        block = self._blocks.get(node)
+        if block is None:
+            return []
+        block.end = offset + length
+        if status := STATUS_LINE.match(text):
+            block.status = status
+        elif (
+            block.name is None
+            and text.strip()
+            and not text[0].isspace()
+            and not SOURCE_LINE.match(text)
+        ):
+            block.name = spec_name(text)
+        return []
+
+    def close(self) -> List[SpecReport]:
+        """Flush the reports still open at the end of the stream."""
+        reports = []
+        for node in list(self._blocks):
+            reports += self._close(node)
+        return reports
+
+    def _close(self, node: Optional[int]) -> List[SpecReport]:
+        block = self._blocks.pop(node, None)
+        if block is None or block.status is None or block.name is None:
+            return []
+        status = block.status
+        return [
+            SpecReport(
+                name=block.name,
+                state=spec_state(status["mark"], status["label"]),
+                seconds=float(status["seconds"]),
+                node=node,
+                start=block.start,
+                end=block.end,
+            )
+        ]
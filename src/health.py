@@ -0,0 +1,212 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Check between runs that the cluster answers and still takes our credentials.
+
+A probe asks the API server whether it is ready, then reads one small object
+with the credentials of the kubeconfig, over a single connection with a short
+timeout. Spawning kubectl for this would cost more than the requests
+themselves. The outcome is kept between hooks: after consecutive failures the
+next probe waits twice as long as the last, up to an hour, so that a dead API
+server is not asked again by every runner every few minutes.
+"""
+
+import base64
+import http.client
+import json
+import logging
+import ssl
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import yaml
+
+from history import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+HEALTH_STATE = STATE_DIR / "health.json"
+PROBE_TIMEOUT = 5
+READY_PATH = "/readyz"
+# Needs authentication on every cluster and is a few hundred bytes.
+AUTH_PATH = "/api/v1/namespaces/default"
+# A little under the default update-status interval of five minutes, so that
+# the first retry comes with the next hook.
+BACKOFF = 240.0
+MAX_BACKOFF = 3600.0
+
+
+class UnsupportedKubeconfig(Exception):
+    """A kubeconfig whose credentials only kubectl can present."""
+
+
+@dataclass
+class ClusterAccess:
+    """Where the API server is and how to authenticate to it."""
+
+    server: str
+    context: Optional[ssl.SSLContext] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "ClusterAccess":
+        """Read the current context of a kubeconfig.
+
+        Raises UnsupportedKubeconfig for exec and auth provider plugins, and
+        OSError, ValueError or KeyError on a broken kubeconfig.
+        """
+        config = yaml.safe_load(path.read_text())
+        current = _named(config["contexts"], config["current-context"])
+        cluster = _named(config["clusters"], current["cluster"])
+        user = _named(config.get("users") or [], current["user"]) if current.get("user") else {}
+        if "exec" in user or "auth-provider" in user:
+            raise UnsupportedKubeconfig("the user authenticates through a kubectl plugin")
+
+        access = cls(cluster["server"])
+        if access.server.startswith("https:"):
+            access.context = _ssl_context(cluster, user)
+        if token := user.get("token"):
+            access.headers["Authorization"] = f"Bearer {token}"
+        elif user.get("tokenFile"):
+            token = Path(user["tokenFile"]).read_text().strip()
+            access.headers["Authorization"] = f"Bearer {token}"
+        elif user.get("username"):
+            basic = base64.b64encode(f"{user['username']}:{user.get('password', '')}".encode())
+            access.headers["Authorization"] = f"Basic {basic.decode()}"
+        return access
+
+    def connect(self, timeout: float) -> http.client.HTTPConnection:
+        """A connection to the API server, opened on its first request."""
+        server = urlsplit(self.server)
+        if self.context is not None:
+            return http.client.HTTPSConnection(
+                server.netloc, timeout=timeout, context=self.context
+            )
+        return http.client.HTTPConnection(server.netloc, timeout=timeout)
+
+    def url(self, path: str) -> str:
+        """A path of the API under the server's own prefix, if it has one."""
+        return urlsplit(self.server).path.rstrip("/") + path
+
+
+def _named(entries: list, name: str) -> dict:
+    for entry in entries:
+        if entry["name"] == name:
+            return next(value for key, value in entry.items() if key != "name")
+    raise KeyError(name)
+
+
+def _ssl_context(cluster: dict, user: dict) -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    if cluster.get("insecure-skip-tls-verify"):
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif data := cluster.get("certificate-authority-data"):
+        context.load_verify_locations(cadata=base64.b64decode(data).decode())
+    elif cluster.get("certificate-authority"):
+        context.load_verify_locations(cafile=cluster["certificate-authority"])
+
+    cert, key = user.get("client-certificate"), user.get("client-key")
+    if "client-certificate-data" in user:
+        # The ssl module only loads client certificates from files.
+        with tempfile.TemporaryDirectory() as tmp:
+            cert, key = f"{tmp}/client.crt", f"{tmp}/client.key"
+            Path(cert).write_bytes(base64.b64decode(user["client-certificate-data"]))
+            Path(key).write_bytes(base64.b64decode(user["client-key-data"]))
+            context.load_cert_chain(cert, key)
+    elif cert:
+        context.load_cert_chain(cert, key)
+    return context
+
+
+@dataclass
+class Probe:
+    """What the API server made of a probe."""
+
+    healthy: bool
+    reason: str = ""
+    # The API server answered, but would not take the credentials.
+    refused: bool = False
+    seconds: float = 0.0
+
+
+def probe(kubeconfig: Path, timeout: float = PROBE_TIMEOUT) -> Optional[Probe]:
+    """Probe the cluster of a kubeconfig, or None if its credentials are out of reach."""
+    started = time.monotonic()
+    try:
+        access = ClusterAccess.load(kubeconfig)
+    except UnsupportedKubeconfig as e:
+        logger.info("Not probing the cluster: %s", e)
+        return None
+    except (OSError, ValueError, KeyError, StopIteration, TypeError, yaml.YAMLError) as e:
+        return Probe(False, f"unusable kubeconfig ({e})")
+
+    connection = access.connect(timeout)
+    try:
+        for path in (READY_PATH, AUTH_PATH):
+            connection.request("GET", access.url(path), headers=access.headers)
+            response = connection.getresponse()
+            body = response.read()
+            if response.status in (401, 403):
+                reason = "rejected" if response.status == 401 else "not authorized"
+                return Probe(False, f"credentials {reason}", True, time.monotonic() - started)
+            if response.status != 200:
+                return Probe(
+                    False,
+                    f"{path} answered {response.status} {_message(body)}".rstrip(),
+                    seconds=time.monotonic() - started,
+                )
+    except ssl.SSLCertVerificationError as e:
+        reason = f"certificate verify failed: {e.verify_message}"
+        return Probe(False, reason, seconds=time.monotonic() - started)
+    except (OSError, http.client.HTTPException) as e:
+        reason = getattr(e, "strerror", None) or str(e) or type(e).__name__
+        return Probe(False, reason, seconds=time.monotonic() - started)
+    finally:
+        connection.close()
+    return Probe(True, seconds=time.monotonic() - started)
+
+
+def _message(body: bytes) -> str:
+    """The message of a Status object, or the start of a plain text answer."""
+    try:
+        return json.loads(body)["message"]
+    except (ValueError, KeyError, TypeError):
+        return body.decode(errors="replace").splitlines()[0][:80] if body.strip() else ""
+
+
+class HealthState:
+    """Consecutive probe failures and when the next probe is due, kept between hooks."""
+
+    def __init__(self, state_path: Path = HEALTH_STATE, clock: Callable[[], float] = time.time):
+        self.state_path = state_path
+        self._clock = clock
+        try:
+            self.state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            self.state = {}
+        self.failures: int = self.state.get("failures", 0)
+        self.next: float = self.state.get("next", 0.0)
+        # The unit status the last probe set, which the next one may replace.
+        self.status: str = self.state.get("status", "")
+
+    def due(self) -> bool:
+        """Whether enough time went by since the last failure to probe again."""
+        return self._clock() >= self.next
+
+    def record(self, result: Probe, status: str) -> None:
+        """Count a probe and the unit status it led to."""
+        if result.healthy:
+            self.failures, self.next = 0, 0.0
+        else:
+            self.failures += 1
+            self.next = self._clock() + min(BACKOFF * 2 ** (self.failures - 1), MAX_BACKOFF)
+        self.status = status
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(
+            json.dumps({"failures": self.failures, "next": self.next, "status": status})
+        )
@@ -0,0 +1,251 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Catalog of e2e runs kept in an embedded sqlite database."""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from benchmark import Latency
+from ginkgo import FAILED_STATES, SpecReport
+from runner import RunObserver
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = Path("/var/lib/kubernetes-e2e")
+HISTORY_DB = STATE_DIR / "history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    action TEXT NOT NULL,
+    params TEXT NOT NULL,
+    snap_revision TEXT,
+    server_version TEXT,
+    created_at REAL NOT NULL,
+    started_at INTEGER,
+    ended_at INTEGER,
+    verdict TEXT NOT NULL DEFAULT 'running',
+    fingerprint TEXT,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    accessed_at REAL,
+    artifacts TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE INDEX IF NOT EXISTS runs_verdict ON runs (verdict, created_at);
+CREATE INDEX IF NOT EXISTS runs_server_version ON runs (server_version, created_at);
+CREATE TABLE IF NOT EXISTS specs (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS specs_name ON specs (name);
+CREATE TABLE IF NOT EXISTS latencies (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    requests REAL NOT NULL,
+    p50 REAL,
+    p90 REAL,
+    p99 REAL,
+    PRIMARY KEY (run_id, metric, subject)
+);
+"""
+# A flake is a failure followed by a pass of the same spec on the same fingerprint.
+FLAKES_QUERY = """
+SELECT name, COUNT(*) AS runs, SUM(failed) AS failures,
+       SUM(CASE WHEN previous_failed = 1 AND failed = 0 THEN 1 ELSE 0 END) AS flakes
+FROM (
+    SELECT specs.name, specs.state IN ('failed', 'panicked', 'timedout') AS failed,
+           LAG(specs.state IN ('failed', 'panicked', 'timedout')) OVER (
+               PARTITION BY runs.fingerprint, specs.name ORDER BY runs.created_at
+           ) AS previous_failed
+    FROM specs JOIN runs ON runs.id = specs.run_id
+    WHERE specs.state NOT IN ('skipped', 'pending') AND runs.created_at >= ?
+)
+GROUP BY name
+HAVING flakes > 0
+ORDER BY CAST(flakes AS REAL) / COUNT(*) DESC, name
+"""
+JSON_COLUMNS = ("params", "artifacts")
+
+
+def fingerprint(server_version: str, snap_revision: str) -> str:
+    """Identify the cluster and test binary combination a run was made against."""
+    return hashlib.sha256(f"{server_version}/{snap_revision}".encode()).hexdigest()[:16]
+
+
+def parse_time(value: str) -> float:
+    """Accept either a unix timestamp or an ISO 8601 date/time."""
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+class RunHistory:
+    """Record every run and look them up without touching the artifacts on disk."""
+
+    def __init__(self, path: Path = HISTORY_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self.db.close()
+
+    def start(
+        self, run_id: str, params: Dict[str, Any], snap_revision: str = "", action: str = "test"
+    ) -> None:
+        """Record that a run has started."""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO runs (id, action, params, snap_revision, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (run_id, action, json.dumps(params), snap_revision, time.time()),
+            )
+
+    def update(self, run_id: str, **fields: Any) -> None:
+        """Update columns of a recorded run."""
+        if not fields:
+            return
+        for column in JSON_COLUMNS:
+            if column in fields:
+                fields[column] = json.dumps(fields[column])
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self.db:
+            self.db.execute(
+                f"UPDATE runs SET {assignments} WHERE id = ?", (*fields.values(), run_id)
+            )
+
+    def pin(self, run_id: str, pinned: bool = True) -> bool:
+        """Protect a run's artifacts from garbage collection, or stop protecting them."""
+        with self.db:
+            cursor = self.db.execute(
+                "UPDATE runs SET pinned = ? WHERE id = ?", (int(pinned), run_id)
+            )
+        return cursor.rowcount > 0
+
+    def touch(self, run_id: str) -> None:
+        """Note that a run's artifacts were just used."""
+        self.update(run_id, accessed_at=time.time())
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a single run."""
+        row = self.db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def query(
+        self,
+        verdict: str = "",
+        since: str = "",
+        until: str = "",
+        server_version: str = "",
+        action: str = "",
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """List runs, newest first, optionally filtered."""
+        clauses, args = [], []
+        if verdict:
+            clauses.append("verdict = ?")
+            args.append(verdict)
+        if since:
+            clauses.append("created_at >= ?")
+            args.append(parse_time(since))
+        if until:
+            clauses.append("created_at < ?")
+            args.append(parse_time(until))
+        if server_version:
+            clauses.append("server_version = ?")
+            args.append(server_version)
+        if action:
+            clauses.append("action = ?")
+            args.append(action)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.db.execute(
+            f"SELECT * FROM runs {where} ORDER BY created_at DESC LIMIT ?", (*args, limit)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def record_specs(self, run_id: str, reports: Iterable[SpecReport]) -> None:
+        """Store the per-spec results of a run."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO specs (run_id, name, state, seconds) VALUES (?, ?, ?, ?)",
+                ((run_id, r.name, r.state, r.seconds) for r in reports),
+            )
+
+    def failed_specs(self, run_id: str) -> List[str]:
+        """The names of the specs which failed in a run."""
+        rows = self.db.execute(
+            "SELECT name, state FROM specs WHERE run_id = ? ORDER BY name", (run_id,)
+        )
+        return [row["name"] for row in rows if row["state"] in FAILED_STATES]
+
+    def record_latencies(self, run_id: str, latencies: Iterable[Latency]) -> None:
+        """Store the latency percentiles measured by a benchmark run."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO latencies"
+                " (run_id, metric, subject, requests, p50, p90, p99)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, lat.metric, lat.subject, lat.requests, lat.p50, lat.p90, lat.p99)
+                    for lat in latencies
+                ),
+            )
+
+    def latencies(self, run_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """The latency percentiles of a benchmark run, keyed by metric and subject."""
+        rows = self.db.execute("SELECT * FROM latencies WHERE run_id = ?", (run_id,))
+        return {(row["metric"], row["subject"]): dict(row) for row in rows}
+
+    def flakes(self, since: float = 0) -> List[Dict[str, Any]]:
+        """Per-spec flake counts across the recorded runs, flakiest first."""
+        return [dict(row) for row in self.db.execute(FLAKES_QUERY, (since,))]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        run = dict(row)
+        for column in JSON_COLUMNS:
+            run[column] = json.loads(run[column])
+        return run
+
+
+class RunMarkers(RunObserver):
+    """Pick the markers scripts/test.sh writes into the log out of the output."""
+
+    def __init__(self):
+        self.markers: Dict[str, str] = {}
+
+    def on_line(self, line: str, offset: int) -> None:
+        """Remember JUJU_E2E_* markers."""
+        if line.startswith("JUJU_E2E_"):
+            key, _, value = line.strip().partition("=")
+            self.markers[key] = value
+
+    def fields(self) -> Dict[str, Any]:
+        """The markers as run history columns."""
+        fields: Dict[str, Any] = {}
+        if version := self.markers.get("JUJU_E2E_VERSION"):
+            fields["server_version"] = version
+        for marker, column in (("JUJU_E2E_START", "started_at"), ("JUJU_E2E_END", "ended_at")):
+            if self.markers.get(marker, "").isdigit():
+                fields[column] = int(self.markers[marker])
+        return fields
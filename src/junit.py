@@ -0,0 +1,215 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Read and write the JUnit reports produced by e2e runs.
+
+Run as a script, it merges the reports in a directory into one; see
+merge_reports.
+"""
+
+import heapq
+import json
+import os
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import Element, iterparse, tostring
+from xml.sax.saxutils import XMLGenerator, quoteattr
+
+from ginkgo import SpecReport
+
+# The merged report sits next to the reports of the ginkgo nodes.
+CONSOLIDATED = "junit_consolidated.xml"
+# How many bytes of testcases are sorted in memory at once while merging.
+MERGE_CHUNK = 8 * 2**20
+
+
+def _testcase_state(testcase: Element) -> str:
+    for child in testcase:
+        if child.tag in ("failure", "error"):
+            return "failed"
+        if child.tag == "skipped":
+            return "skipped"
+    return "passed"
+
+
+def _iter_elements(source: IO[bytes]) -> Iterator[Element]:
+    """Stream the testcase elements out of one JUnit document.
+
+    Each testcase is detached from the tree once handled, so memory stays
+    bounded however large the report is.
+    """
+    stack: List[Element] = []
+    for event, element in iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            continue
+        stack.pop()
+        if element.tag != "testcase":
+            continue
+        yield element
+        if stack:
+            stack[-1].remove(element)
+
+
+def iter_testcases(source: IO[bytes]) -> Iterator[SpecReport]:
+    """Stream the testcases out of one JUnit document."""
+    for element in _iter_elements(source):
+        yield SpecReport(
+            name=element.get("name", ""),
+            state=_testcase_state(element),
+            seconds=float(element.get("time") or 0),
+        )
+
+
+def iter_reports(path: Path) -> Iterator[SpecReport]:
+    """Stream the testcases of a JUnit file, a report directory or a report tarball.
+
+    A directory holding a consolidated report is read from that report alone.
+    """
+    if path.is_dir():
+        reports = [path / CONSOLIDATED] if (path / CONSOLIDATED).is_file() else _node_reports(path)
+        for report in reports:
+            with report.open("rb") as f:
+                yield from iter_testcases(f)
+    elif path.name.endswith((".tar.gz", ".tgz")):
+        with tarfile.open(path, "r|gz") as tar:
+            for member in tar:
+                # The tarball is read in one pass, so the consolidated report is skipped.
+                if (
+                    member.isfile()
+                    and member.name.endswith(".xml")
+                    and Path(member.name).name != CONSOLIDATED
+                ):
+                    f = tar.extractfile(member)
+                    if f is not None:
+                        yield from iter_testcases(f)
+    else:
+        with path.open("rb") as f:
+            yield from iter_testcases(f)
+
+
+def write_junit(path: Path, suite: str, reports: Iterable[SpecReport]) -> None:
+    """Write spec reports as a single JUnit testsuite."""
+    reports = list(reports)
+    failures = sum(report.failed for report in reports)
+    skipped = sum(report.state in ("skipped", "pending") for report in reports)
+    seconds = sum(report.seconds for report in reports)
+
+    with path.open("w", encoding="utf-8") as f:
+        xml = XMLGenerator(f, encoding="utf-8", short_empty_elements=True)
+        xml.startDocument()
+        attrs = {
+            "name": suite,
+            "tests": str(len(reports)),
+            "failures": str(failures),
+            "errors": "0",
+            "skipped": str(skipped),
+            "time": f"{seconds:.3f}",
+        }
+        xml.startElement("testsuites", attrs)
+        xml.startElement("testsuite", attrs)
+        for report in reports:
+            xml.startElement(
+                "testcase",
+                {"name": report.name, "classname": suite, "time": f"{report.seconds:.3f}"},
+            )
+            if report.failed:
+                xml.startElement("failure", {"type": report.state, "message": report.state})
+                xml.endElement("failure")
+            elif report.state in ("skipped", "pending"):
+                xml.startElement("skipped", {"message": report.state})
+                xml.endElement("skipped")
+            xml.endElement("testcase")
+        xml.endElement("testsuite")
+        xml.endElement("testsuites")
+        xml.endDocument()
+
+
+def _node_reports(directory: Path) -> List[Path]:
+    return [path for path in sorted(directory.glob("*.xml")) if path.name != CONSOLIDATED]
+
+
+def _sorted_run(records: List[Tuple[str, int, str]]) -> IO[str]:
+    run = tempfile.TemporaryFile("w+", encoding="utf-8")
+    for record in sorted(records):
+        run.write(json.dumps(record) + "\n")
+    run.seek(0)
+    return run
+
+
+def _read_run(run: IO[str]) -> Iterator[Tuple[str, int, str]]:
+    for line in run:
+        name, seq, xml = json.loads(line)
+        yield name, seq, xml
+
+
+def _attrs(attrs: Dict[str, str]) -> str:
+    return "".join(f" {key}={quoteattr(value)}" for key, value in attrs.items())
+
+
+def merge_reports(directory: Path, suite: str, chunk: int = MERGE_CHUNK) -> Optional[Path]:
+    """Merge the reports of the ginkgo nodes in a directory into one testsuite.
+
+    Testcases are ordered by spec name, and by report and position among
+    specs of the same name, so reruns of a suite list them alike. They are
+    streamed out of the reports into sorted runs of up to ``chunk`` bytes in
+    temporary files, which are then merged, so memory does not grow with
+    the reports. Failure messages and captured output are kept as they are.
+    Returns the path of the merged report, or None if there was nothing to merge.
+    """
+    reports = _node_reports(directory)
+    if not reports:
+        return None
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    seconds = 0.0
+    runs: List[IO[str]] = []
+    records: List[Tuple[str, int, str]] = []
+    size = 0
+    try:
+        for report in reports:
+            with report.open("rb") as f:
+                for element in _iter_elements(f):
+                    totals["tests"] += 1
+                    tags = {child.tag for child in element}
+                    if "failure" in tags:
+                        totals["failures"] += 1
+                    elif "error" in tags:
+                        totals["errors"] += 1
+                    elif "skipped" in tags:
+                        totals["skipped"] += 1
+                    seconds += float(element.get("time") or 0)
+                    element.set("classname", element.get("classname") or suite)
+                    element.set("time", element.get("time") or "0")
+                    element.tail = None
+                    xml = tostring(element, encoding="unicode")
+                    records.append((element.get("name", ""), totals["tests"], xml))
+                    size += len(xml)
+                    if size >= chunk:
+                        runs.append(_sorted_run(records))
+                        records, size = [], 0
+        runs.append(_sorted_run(records))
+
+        attrs = {"name": suite, **{key: str(value) for key, value in totals.items()}}
+        attrs["time"] = f"{seconds:.3f}"
+        path = directory / CONSOLIDATED
+        partial = path.with_name(f".{path.name}.partial")
+        with partial.open("w", encoding="utf-8") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            out.write(f"<testsuites{_attrs(attrs)}>\n")
+            out.write(f"  <testsuite{_attrs(attrs)}>\n")
+            for _, _, xml in heapq.merge(*(_read_run(run) for run in runs)):
+                out.write(f"    {xml}\n")
+            out.write("  </testsuite>\n</testsuites>\n")
+        os.replace(partial, path)
+        return path
+    finally:
+        for run in runs:
+            run.close()
+
+
+if __name__ == "__main__":
+    # scripts/test.sh: junit.py <report directory> <suite name>
+    merge_reports(Path(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,35 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Thin wrappers around the kubectl snap for talking to the cluster under test."""
+
+import json
+import logging
+import subprocess
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+KUBECTL = "/snap/bin/kubectl"
+KUBE_CONFIG_PATH = "/home/ubuntu/.kube/config"
+ROOT_KUBE_CONFIG_PATH = "/root/.kube/config"
+
+
+def kubectl(*args: str, stdin: Optional[str] = None, timeout: Optional[float] = None) -> str:
+    """Run kubectl against the configured cluster and return its stdout."""
+    command = [KUBECTL, "--kubeconfig", KUBE_CONFIG_PATH, *args]
+    logger.debug("Running %s", " ".join(command))
+    process = subprocess.run(
+        command, input=stdin, capture_output=True, text=True, check=True, timeout=timeout
+    )
+    return process.stdout
+
+
+def kubectl_json(*args: str, timeout: Optional[float] = None) -> Any:
+    """Run kubectl with JSON output and return the decoded document."""
+    return json.loads(kubectl(*args, "-o", "json", timeout=timeout))
+
+
+def kubectl_apply(manifest: dict, timeout: Optional[float] = None) -> None:
+    """Apply a single manifest passed in as a dict."""
+    kubectl("apply", "-f", "-", stdin=json.dumps(manifest), timeout=timeout)
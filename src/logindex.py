@@ -0,0 +1,145 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Index the byte ranges of each spec in a run log so its output can be looked up.
+
+The index is written while the suite runs, one tab separated line per spec,
+so a lookup scans the small index and then reads only the bytes of the specs
+it wants, from the log on disk or from the chunks of the artifact store that
+hold them.
+"""
+
+import bisect
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from ginkgo import ANSI_ESCAPE, FAILED_STATES, NODE_PREFIX, SEPARATOR, SpecReport
+from runner import RunObserver, artifact_paths
+from store import ArtifactStore
+
+# Lines ginkgo starts the failure message of a spec with.
+FAILURE_LINE = re.compile(r"^\s*\[(FAILED|PANICKED|TIMEDOUT)\]\s*(?!\[[\d.]+ seconds\])\S")
+# start, end, failure, node, state, seconds and, last as it may hold anything, name.
+FIELDS = 7
+
+
+def index_path(run_id: str) -> Path:
+    """Path of the log index kept for a run."""
+    return Path(artifact_paths(run_id)["index"])
+
+
+@dataclass
+class IndexedSpec(SpecReport):
+    """A spec with where its failure message starts in the log, if it failed."""
+
+    failure: Optional[int] = None
+
+
+class LogIndex(RunObserver):
+    """Append the byte range of every finished spec to the index file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = path.open("w", encoding="utf-8")
+        self._failures: List[int] = []
+
+    def on_line(self, line: str, offset: int) -> None:
+        """Remember where failure messages start."""
+        text = NODE_PREFIX.sub("", ANSI_ESCAPE.sub("", line))
+        if FAILURE_LINE.match(text):
+            self._failures.append(offset)
+
+    def on_spec(self, report: SpecReport) -> None:
+        """Record the byte range of a finished spec."""
+        failure = ""
+        if report.failed:
+            first = bisect.bisect_left(self._failures, report.start)
+            if first < len(self._failures) and self._failures[first] < report.end:
+                failure = str(self._failures[first])
+        # Failures before this spec ended belong to it or to none.
+        del self._failures[: bisect.bisect_left(self._failures, report.end)]
+        node = "" if report.node is None else str(report.node)
+        name = report.name.replace("\t", " ")
+        fields = [report.start, report.end, failure, node, report.state, report.seconds, name]
+        self._file.write("\t".join(map(str, fields)) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the index file."""
+        self._file.close()
+
+
+def _spec(fields: List[str]) -> IndexedSpec:
+    start, end, failure, node, state, seconds, name = fields
+    return IndexedSpec(
+        name=name,
+        state=state,
+        seconds=float(seconds),
+        node=int(node) if node else None,
+        start=int(start),
+        end=int(end),
+        failure=int(failure) if failure else None,
+    )
+
+
+def select(lines: Iterable[str], pattern: str = "", failed: bool = False) -> List[IndexedSpec]:
+    """Pick specs from an index by exact name, or else by a regex searched in their names.
+
+    Only the lines picked are parsed. A line torn by the unit going down
+    mid-write is skipped.
+    """
+    rows = [fields for line in lines if len(fields := line.rstrip("\n").split("\t")) == FIELDS]
+    if failed:
+        rows = [fields for fields in rows if fields[4] in FAILED_STATES]
+    if pattern:
+        if not (exact := [fields for fields in rows if fields[6] == pattern]):
+            regex = re.compile(pattern)
+            exact = [fields for fields in rows if regex.search(fields[6])]
+        rows = exact
+    return [_spec(fields) for fields in rows]
+
+
+class RunLog:
+    """The index and log of a run, on disk or in the artifact store."""
+
+    def __init__(self, run_id: str, store: Optional[ArtifactStore] = None):
+        self.run_id = run_id
+        self.store = store
+        self.log = Path(artifact_paths(run_id)["log"])
+        self.index = index_path(run_id)
+
+    def find(self, pattern: str = "", failed: bool = False) -> List[IndexedSpec]:
+        """The indexed specs of the run picked as select() does."""
+        try:
+            with self.index.open(encoding="utf-8") as f:
+                return select(f, pattern, failed)
+        except FileNotFoundError:
+            if self.store is None:
+                raise
+        data = b"".join(self.store.read(self.run_id, self.index.name))
+        return select(data.decode().splitlines(), pattern, failed)
+
+    def read(self, start: int, end: int) -> bytes:
+        """The bytes of the log between two offsets."""
+        try:
+            with self.log.open("rb") as f:
+                f.seek(start)
+                return f.read(end - start)
+        except FileNotFoundError:
+            if self.store is None:
+                raise
+        return b"".join(self.store.read(self.run_id, self.log.name, start, end))
+
+    def output(self, spec: IndexedSpec, limit: int = 0) -> str:
+        """The output of a spec, from its failure message on if it exceeds the limit."""
+        start = spec.start
+        if limit and spec.end - start > limit and spec.failure is not None:
+            start = spec.failure
+        data = self.read(start, spec.end if not limit else min(spec.end, start + limit))
+        text = ANSI_ESCAPE.sub("", data.decode(errors="replace"))
+        first = NODE_PREFIX.sub("", text.split("\n", 1)[0]).strip()
+        if start == spec.start and first != SEPARATOR:
+            raise ValueError(f"The index of run {self.run_id} does not match its log")
+        return text
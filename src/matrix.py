@@ -0,0 +1,128 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Run several suites from one test action, side by side while their nodes fit.
+
+Each suite of a matrix is its own run, with the id ``<action id>.<suite>``,
+its own log, reports and history record.
+"""
+
+import os
+import re
+import shlex
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, TypeVar
+
+import yaml
+
+# Suite names end up in run ids, file names and action result keys.
+SUITE_NAME = re.compile(r"^[a-z0-9](?:[a-z0-9-]*[a-z0-9])?$")
+SUITE_PARAMS = ("focus", "skip", "parallelism", "timeout", "extra")
+
+T = TypeVar("T")
+
+
+@dataclass
+class Suite:
+    """One focus/skip combination of a matrix."""
+
+    name: str
+    focus: str
+    skip: str
+    parallelism: int
+    timeout: str
+    extra: str = ""
+
+    def args(self) -> List[str]:
+        """The arguments of scripts/test.sh for the suite."""
+        return [
+            self.focus,
+            self.skip,
+            str(self.parallelism),
+            self.timeout,
+            *shlex.split(self.extra),
+        ]
+
+    def params(self) -> Dict[str, str]:
+        """The suite's parameters as recorded in the run history."""
+        return {param: str(getattr(self, param)) for param in SUITE_PARAMS}
+
+
+def parse(text: str, defaults: Dict[str, str]) -> List[Suite]:
+    """Parse a matrix: a YAML mapping of suite names to the test parameters they change."""
+    try:
+        document = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise ValueError(f"not YAML: {e}") from e
+    if not isinstance(document, dict) or not document:
+        raise ValueError("expected a mapping of suite names to parameters")
+    suites = []
+    for name, params in document.items():
+        name = str(name)
+        params = params or {}
+        if not SUITE_NAME.match(name):
+            raise ValueError(f"suite name {name!r} may only hold a-z, 0-9 and inner dashes")
+        if not isinstance(params, dict):
+            raise ValueError(f"the parameters of suite {name} are not a mapping")
+        if unknown := set(params) - set(SUITE_PARAMS):
+            raise ValueError(f"unknown parameters of suite {name}: {', '.join(sorted(unknown))}")
+        values = {param: str(params.get(param, defaults[param])) for param in SUITE_PARAMS}
+        try:
+            parallelism = int(values.pop("parallelism"))
+        except ValueError as e:
+            raise ValueError(f"the parallelism of suite {name} is not a number") from e
+        if parallelism < 1:
+            raise ValueError(f"the parallelism of suite {name} is below 1")
+        suites.append(Suite(name=name, parallelism=parallelism, **values))
+    return suites
+
+
+def schedulable_nodes(nodes: List[dict]) -> int:
+    """How many of a cluster's nodes are ready and take new pods."""
+    count = 0
+    for node in nodes:
+        if node.get("spec", {}).get("unschedulable"):
+            continue
+        taints = node.get("spec", {}).get("taints") or []
+        if any(taint.get("effect") in ("NoSchedule", "NoExecute") for taint in taints):
+            continue
+        conditions = node.get("status", {}).get("conditions") or []
+        if any(c.get("type") == "Ready" and c.get("status") == "True" for c in conditions):
+            count += 1
+    return count
+
+
+def capacity(max_nodes: int, cluster_nodes: int = 0) -> int:
+    """How many ginkgo nodes may run at once.
+
+    0 means one per CPU of the unit, but no more than the cluster has
+    schedulable nodes to spread their pods over, and one at a time when that
+    number is not known.
+    """
+    if max_nodes > 0:
+        return max_nodes
+    return max(min(os.cpu_count() or 1, cluster_nodes), 1)
+
+
+def schedule(suites: List[Suite], nodes: int, run: Callable[[Suite], T]) -> Dict[str, T]:
+    """Run the suites, starting each one as soon as its nodes fit next to those running.
+
+    Suites start in order, except that a suite which fits goes ahead of a
+    larger one still waiting. A suite larger than the capacity runs alone.
+    """
+    pending = list(suites)
+    running: Dict[Future, Suite] = {}
+    results: Dict[str, T] = {}
+    with ThreadPoolExecutor(max(len(suites), 1), thread_name_prefix="suite") as pool:
+        while pending or running:
+            busy = sum(suite.parallelism for suite in running.values())
+            for suite in list(pending):
+                if not running or busy + suite.parallelism <= nodes:
+                    pending.remove(suite)
+                    running[pool.submit(run, suite)] = suite
+                    busy += suite.parallelism
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future).name] = future.result()
+    return {suite.name: results[suite.name] for suite in suites}
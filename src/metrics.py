@@ -0,0 +1,130 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Prometheus textfile metrics for e2e runs and hook latency.
+
+Every hook runs in a fresh process, so the latest values are kept in a small
+JSON state file and the whole textfile is regenerated on each write.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable
+
+from compare import sig_of
+from ginkgo import SpecReport
+from history import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+METRICS_STATE = STATE_DIR / "metrics.json"
+TEXTFILE_NAME = "kubernetes_e2e.prom"
+PREFIX = "kubernetes_e2e"
+
+HELP = {
+    "run_duration_seconds": ("gauge", "Wall time of the last e2e run."),
+    "run_timestamp_seconds": ("gauge", "Unix time the last e2e run finished."),
+    "run_success": ("gauge", "Whether the last e2e run passed."),
+    "run_specs": ("gauge", "Specs of the last e2e run by state."),
+    "run_sig_seconds": ("gauge", "Spec time of the last e2e run per SIG."),
+    "snap_install_duration_seconds": ("gauge", "Time taken by the last snap install."),
+    "setup_environment_duration_seconds": ("gauge", "Time taken by the last environment setup."),
+    "health_probe_duration_seconds": ("gauge", "Time taken by the last cluster health probe."),
+    "cluster_healthy": ("gauge", "Whether the last health probe reached the cluster."),
+    "hook_duration_seconds": ("summary", "Time taken by charm hooks and actions."),
+}
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+    """Gauges and hook latency summaries persisted between hooks."""
+
+    def __init__(self, state_path: Path = METRICS_STATE):
+        self.state_path = state_path
+        try:
+            self.state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            self.state = {}
+        self.state.setdefault("gauges", {})
+        self.state.setdefault("hooks", {})
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge."""
+        self.state["gauges"].setdefault(name, {})[json.dumps(labels, sort_keys=True)] = value
+
+    def clear(self, name: str) -> None:
+        """Drop every series of a gauge, e.g. when its label set changes."""
+        self.state["gauges"].pop(name, None)
+
+    def observe_hook(self, hook: str, seconds: float) -> None:
+        """Add one hook execution to the latency summary."""
+        summary = self.state["hooks"].setdefault(hook, {"count": 0, "sum": 0.0})
+        summary["count"] += 1
+        summary["sum"] += seconds
+
+    def record_run(self, seconds: float, verdict: str, reports: Iterable[SpecReport]) -> None:
+        """Replace the metrics of the last e2e run."""
+        states: Dict[str, int] = defaultdict(int)
+        sigs: Dict[str, float] = defaultdict(float)
+        for report in reports:
+            states["failed" if report.failed else report.state] += 1
+            sigs[sig_of(report.name)] += report.seconds
+
+        self.set("run_duration_seconds", seconds)
+        self.set("run_timestamp_seconds", time.time())
+        self.set("run_success", float(verdict == "passed"))
+        self.clear("run_specs")
+        for state in ("passed", "failed", "skipped", *states):
+            self.set("run_specs", states[state], state=state)
+        self.clear("run_sig_seconds")
+        for sig, total in sigs.items():
+            self.set("run_sig_seconds", total, sig=sig)
+
+    def save(self) -> None:
+        """Persist the state for the next hook."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(json.dumps(self.state))
+
+    def render(self) -> str:
+        """Render everything in the Prometheus text exposition format."""
+        lines = []
+        for name, series in sorted(self.state["gauges"].items()):
+            kind, text = HELP.get(name, ("gauge", name))
+            lines += [f"# HELP {PREFIX}_{name} {text}", f"# TYPE {PREFIX}_{name} {kind}"]
+            for labels, value in sorted(series.items()):
+                lines.append(f"{PREFIX}_{name}{_labels(json.loads(labels))} {value}")
+        if self.state["hooks"]:
+            kind, text = HELP["hook_duration_seconds"]
+            name = f"{PREFIX}_hook_duration_seconds"
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            for hook, summary in sorted(self.state["hooks"].items()):
+                lines.append(f"{name}_sum{_labels({'hook': hook})} {summary['sum']}")
+                lines.append(f"{name}_count{_labels({'hook': hook})} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, directory: Path) -> None:
+        """Atomically replace the textfile the node-exporter collector reads."""
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{TEXTFILE_NAME}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, directory / TEXTFILE_NAME)
+        except OSError:
+            logger.exception("Failed to write metrics to %s", directory)
+            Path(tmp).unlink(missing_ok=True)
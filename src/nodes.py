@@ -0,0 +1,171 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Split a parallel run by ginkgo process and time each process.
+
+Ginkgo v2 does not mark streamed output with the process which wrote it: the
+output of a spec reaches the log as one block once the spec is over. Its JSON
+report does record the ``ParallelProcess`` of every spec, with its start and
+end time and captured output, so the nodes are told apart from the report
+once the run has exited. The run log stays the merged, chronological view of
+every node. Next to it, ``<run>-nodes/node-<n>.log`` holds the specs of one
+node, each stamped with the seconds since the suite started, so a hung or slow
+node can be read on its own. The timing of each node tells how busy the nodes
+were and which of them kept the run going after the others were done.
+"""
+
+import json
+import logging
+import re
+import statistics
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ginkgo import SpecReport
+from runner import RunObserver, artifact_paths
+
+logger = logging.getLogger(__name__)
+
+# scripts/test.sh asks the suite for this report in its JUnit directory.
+GINKGO_REPORT = "ginkgo-report.json"
+# A node straggles when it finishes this long after the median node ...
+STRAGGLER_SECONDS = 60
+# ... and after this share of the whole run.
+STRAGGLER_SHARE = 0.1
+# Specs left out by focus and skip are reported without running anywhere.
+NOT_RUN_STATES = ("skipped", "pending")
+# Go writes up to nine fractional digits, and leaves trailing zeros out.
+GO_FRACTION = re.compile(r"\.(\d+)")
+
+
+def nodes_dir(run_id: str) -> Path:
+    """Directory of the per-node logs of a run."""
+    return Path(artifact_paths(run_id)["nodes"])
+
+
+def ginkgo_report(run_id: str) -> Path:
+    """The JSON report ginkgo writes for a run."""
+    return Path(artifact_paths(run_id)["junit"]) / GINKGO_REPORT
+
+
+def parse_go_time(value: str) -> float:
+    """Convert a time marshalled by Go, as RFC 3339 with nanoseconds, to a timestamp."""
+    value = GO_FRACTION.sub(lambda match: "." + match[1][:6].ljust(6, "0"), value, count=1)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class NodeTiming:
+    """What one ginkgo node did during a run, in seconds since the suite started."""
+
+    def __init__(self, node: int):
+        self.node = node
+        self.busy = 0.0
+        self.specs = 0
+        self.last_spec_end = 0.0
+        self.longest: Optional[SpecReport] = None
+
+    def describe(self, wall: float) -> str:
+        """One line about the node for the action results."""
+        return (
+            f"specs {self.specs} busy {self.busy:.1f}s idle {max(wall - self.busy, 0):.1f}s "
+            f"finished {self.last_spec_end:.1f}s"
+        )
+
+
+class NodeDemux(RunObserver):
+    """Write each node's specs to its own log and time the nodes, from ginkgo's report."""
+
+    def __init__(self, path: Path, report: Path):
+        self.path = path
+        self.report = report
+        self.nodes: Dict[int, NodeTiming] = {}
+        self.wall = 0.0
+
+    def _timing(self, node: int) -> NodeTiming:
+        if node not in self.nodes:
+            self.nodes[node] = NodeTiming(node)
+        return self.nodes[node]
+
+    def close(self) -> None:
+        """Read the report the run left behind and split it by node."""
+        try:
+            suites = json.loads(self.report.read_text())
+        except (OSError, ValueError) as e:
+            logger.info("Not timing the ginkgo nodes without a report: %s", e)
+            return
+        logs: Dict[int, List[str]] = {}
+        try:
+            for suite in suites:
+                started = parse_go_time(suite["StartTime"])
+                self.wall = max(self.wall, parse_go_time(suite["EndTime"]) - started)
+                specs = [
+                    spec
+                    for spec in suite.get("SpecReports") or []
+                    if spec["State"] not in NOT_RUN_STATES and spec.get("ParallelProcess")
+                ]
+                for spec in sorted(specs, key=lambda spec: parse_go_time(spec["StartTime"])):
+                    self._add(spec, started, logs.setdefault(spec["ParallelProcess"], []))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Not timing the ginkgo nodes from a malformed report: %s", e)
+            self.nodes, self.wall = {}, 0.0
+            return
+        for node, entries in logs.items():
+            self.path.mkdir(parents=True, exist_ok=True)
+            (self.path / f"node-{node}.log").write_text("".join(entries), encoding="utf-8")
+
+    def _add(self, spec: dict, started: float, log: List[str]) -> None:
+        """Count one spec to its node and add its output to the node's log."""
+        name = " ".join([*(spec.get("ContainerHierarchyTexts") or []), spec["LeafNodeText"]])
+        # The suite's setup nodes have no text of their own, only a type.
+        name = name.strip() or f"[{spec['LeafNodeType']}]"
+        report = SpecReport(
+            name, spec["State"], spec["RunTime"] / 1e9, node=spec["ParallelProcess"]
+        )
+        start = parse_go_time(spec["StartTime"]) - started
+        timing = self._timing(report.node)
+        timing.busy += report.seconds
+        timing.last_spec_end = max(timing.last_spec_end, parse_go_time(spec["EndTime"]) - started)
+        if spec.get("LeafNodeType") == "It":
+            timing.specs += 1
+            if timing.longest is None or report.seconds > timing.longest.seconds:
+                timing.longest = report
+
+        log.append(f"+{start:.3f} {name} [{report.state}] [{report.seconds:.3f} seconds]\n")
+        for output in (spec.get("CapturedGinkgoWriterOutput"), spec.get("CapturedStdOutErr")):
+            if output:
+                log.append(output if output.endswith("\n") else output + "\n")
+        if message := (spec.get("Failure") or {}).get("Message"):
+            log.append(f"[{report.state.upper()}] {message}\n")
+
+    def stragglers(self) -> List[NodeTiming]:
+        """The nodes which finished their last spec well after most nodes."""
+        timings = [timing for timing in self.nodes.values() if timing.specs]
+        if len(timings) < 2:
+            return []
+        median = statistics.median(timing.last_spec_end for timing in timings)
+        threshold = max(STRAGGLER_SECONDS, STRAGGLER_SHARE * self.wall)
+        late = [timing for timing in timings if timing.last_spec_end - median > threshold]
+        return sorted(late, key=lambda timing: timing.last_spec_end, reverse=True)
+
+    def summary(self) -> Dict[str, str]:
+        """Per-node timing, utilisation and stragglers for the action results."""
+        if not self.nodes:
+            return {}
+        busy = sum(timing.busy for timing in self.nodes.values())
+        summary = {
+            "count": str(len(self.nodes)),
+            "logs": str(self.path),
+            "utilisation": f"{busy / (len(self.nodes) * self.wall) if self.wall else 0:.2f}",
+        }
+        for node, timing in sorted(self.nodes.items()):
+            summary[f"node-{node}"] = timing.describe(self.wall)
+        if stragglers := self.stragglers():
+            median = statistics.median(t.last_spec_end for t in self.nodes.values() if t.specs)
+            summary["stragglers"] = "\n".join(
+                f"node {timing.node} finished {timing.last_spec_end - median:.0f}s after the "
+                f"median node; longest spec: {timing.longest.name} [{timing.longest.seconds:.0f}s]"
+                for timing in stragglers
+                if timing.longest
+            )
+        return summary
@@ -0,0 +1,202 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Pre-pull the e2e test images onto every schedulable node before a run."""
+
+import json
+import logging
+import re
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from kubectl import kubectl, kubectl_apply, kubectl_json
+
+logger = logging.getLogger(__name__)
+
+E2E_BINARY = "/snap/bin/kubernetes-test.e2e"
+PREPULL_NAMESPACE = "kubernetes-e2e-prepull"
+PREPULL_NAME = "e2e-prepull"
+POLL_INTERVAL = 5
+# How long to wait for a batch's pods to go before the next batch, which
+# replaces the DaemonSet anyway if they have not; kubectl gets some more.
+DELETE_TIMEOUT = 120
+
+# Waiting reasons which can only be reached once the image is on the node.
+PULLED_WAITING_REASONS = {
+    "CrashLoopBackOff",
+    "RunContainerError",
+    "CreateContainerError",
+    "StartError",
+}
+PULLED_MESSAGE = re.compile(
+    r'Successfully pulled image "(?P<image>[^"]+)" in (?P<duration>[\dhms.µ]+)'
+)
+PRESENT_MESSAGE = re.compile(r'Container image "(?P<image>[^"]+)" already present on machine')
+GO_DURATION = re.compile(r"([\d.]+)(h|ms|µs|us|ns|m|s)")
+GO_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6, "ns": 1e-9}
+
+
+def list_images() -> List[str]:
+    """Ask the installed e2e binary which images the suite needs."""
+    process = subprocess.run(
+        [E2E_BINARY, "--list-images"], capture_output=True, text=True, check=True
+    )
+    return sorted({line.strip() for line in process.stdout.splitlines() if line.strip()})
+
+
+def parse_go_duration(value: str) -> float:
+    """Convert a Go duration string such as 1m2.5s into seconds."""
+    return sum(float(n) * GO_DURATION_UNITS[unit] for n, unit in GO_DURATION.findall(value))
+
+
+def _container_name(index: int) -> str:
+    return f"image-{index}"
+
+
+def _labels(batch: int) -> Dict[str, str]:
+    # Each batch selects only its own pods, not those of the last one still terminating.
+    return {"app.kubernetes.io/name": PREPULL_NAME, "app.kubernetes.io/instance": f"batch-{batch}"}
+
+
+def daemonset_manifest(images: Iterable[str], batch: int = 0) -> dict:
+    """Build a DaemonSet which pulls each of the given images on every node."""
+    containers = [
+        {
+            "name": _container_name(index),
+            "image": image,
+            "imagePullPolicy": "IfNotPresent",
+            "command": ["sh", "-c", "sleep 86400"],
+            "resources": {"requests": {"cpu": "1m", "memory": "4Mi"}},
+        }
+        for index, image in enumerate(images)
+    ]
+    labels = _labels(batch)
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "DaemonSet",
+        "metadata": {"name": PREPULL_NAME, "namespace": PREPULL_NAMESPACE, "labels": labels},
+        "spec": {
+            "selector": {"matchLabels": labels},
+            "template": {
+                "metadata": {"labels": labels},
+                "spec": {"containers": containers, "terminationGracePeriodSeconds": 0},
+            },
+        },
+    }
+
+
+def _is_pulled(status: dict) -> bool:
+    if status.get("imageID"):
+        return True
+    waiting = status.get("state", {}).get("waiting", {})
+    return waiting.get("reason") in PULLED_WAITING_REASONS
+
+
+class ImagePrePuller:
+    """Pull e2e images on all nodes in bounded batches and time each pull."""
+
+    def __init__(self, batch_size: int = 10, timeout: float = 1800):
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.images: Dict[str, dict] = {}
+
+    def run(self, images: List[str]) -> Dict[str, dict]:
+        """Pull every image and return a per-image timing report."""
+        kubectl_apply(
+            {"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": PREPULL_NAMESPACE}}
+        )
+        deadline = time.monotonic() + self.timeout
+        try:
+            for batch, start in enumerate(range(0, len(images), self.batch_size)):
+                self._pull_batch(images[start : start + self.batch_size], batch, deadline)
+        finally:
+            kubectl("delete", "namespace", PREPULL_NAMESPACE, "--ignore-not-found", "--wait=false")
+        return self.images
+
+    def _pull_batch(self, images: List[str], batch: int, deadline: float) -> None:
+        started = time.monotonic()
+        for image in images:
+            self.images[image] = {"pulled": False, "seconds": None, "nodes": {}}
+        kubectl_apply(daemonset_manifest(images, batch))
+
+        pending = set(images)
+        while pending and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            for image in self._pulled_everywhere(images, batch) & pending:
+                pending.discard(image)
+                self.images[image].update(pulled=True, seconds=time.monotonic() - started)
+        if pending:
+            logger.warning("Timed out pre-pulling %s", ", ".join(sorted(pending)))
+
+        self._record_pull_durations()
+        try:
+            kubectl(
+                "delete",
+                "daemonset",
+                PREPULL_NAME,
+                "-n",
+                PREPULL_NAMESPACE,
+                "--wait=true",
+                f"--timeout={DELETE_TIMEOUT}s",
+                timeout=DELETE_TIMEOUT + 30,
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning("Pre-pull pods of batch %d still going: %s", batch, e)
+
+    def _pulled_everywhere(self, images: List[str], batch: int) -> set:
+        daemonset = kubectl_json("get", "daemonset", PREPULL_NAME, "-n", PREPULL_NAMESPACE)
+        desired = daemonset.get("status", {}).get("desiredNumberScheduled", 0)
+        selector = ",".join(f"{key}={value}" for key, value in _labels(batch).items())
+        pods = [
+            pod
+            for pod in kubectl_json("get", "pods", "-n", PREPULL_NAMESPACE, "-l", selector)[
+                "items"
+            ]
+            if not pod.get("metadata", {}).get("deletionTimestamp")
+        ]
+        if not desired or len(pods) < desired:
+            return set()
+
+        pulled = set(images)
+        for pod in pods:
+            statuses = {s["name"]: s for s in pod.get("status", {}).get("containerStatuses", [])}
+            for index, image in enumerate(images):
+                if not _is_pulled(statuses.get(_container_name(index), {})):
+                    pulled.discard(image)
+        return pulled
+
+    def _record_pull_durations(self) -> None:
+        """Attribute kubelet-reported pull times to each image and node."""
+        events = kubectl_json(
+            "get", "events", "-n", PREPULL_NAMESPACE, "--field-selector", "reason=Pulled"
+        )["items"]
+        for event in events:
+            message = event.get("message", "")
+            node = event.get("source", {}).get("host", "unknown")
+            if match := PULLED_MESSAGE.search(message):
+                seconds = parse_go_duration(match["duration"])
+            elif match := PRESENT_MESSAGE.search(message):
+                seconds = 0.0
+            else:
+                continue
+            if report := self.images.get(match["image"]):
+                report["nodes"][node] = seconds
+
+
+def summarize(images: Dict[str, dict], report_path: Path) -> dict:
+    """Write the full report to disk and return a compact action result."""
+    report_path.write_text(json.dumps(images, indent=2, sort_keys=True))
+    slowest = sorted(
+        images.items(), key=lambda item: max(item[1]["nodes"].values(), default=0), reverse=True
+    )
+    return {
+        "images": str(len(images)),
+        "failed": str(sum(not report["pulled"] for report in images.values())),
+        "slowest": ", ".join(
+            f"{image}={max(report['nodes'].values(), default=0):.1f}s"
+            for image, report in slowest[:5]
+        ),
+        "report": str(report_path),
+    }
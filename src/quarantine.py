@@ -0,0 +1,39 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Pick out specs which flake on this infrastructure so runs can quarantine them."""
+
+from typing import Any, Dict, Iterable, List
+
+from ginkgo import spec_regex
+
+QUARANTINE_MODES = ("off", "skip", "retry")
+# How many times ginkgo retries a quarantined spec before calling it failed.
+FLAKE_ATTEMPTS = 3
+# Flake rates are meaningless for specs seen only once.
+MIN_RUNS = 2
+
+
+def select(flakes: Iterable[Dict[str, Any]], threshold: float) -> Dict[str, str]:
+    """Return the specs whose flake rate reaches the threshold, with the reason."""
+    quarantined = {}
+    for spec in flakes:
+        rate = spec["flakes"] / spec["runs"]
+        if spec["runs"] >= MIN_RUNS and rate >= threshold:
+            quarantined[spec["name"]] = (
+                f"flaked {spec['flakes']} times in {spec['runs']} runs ({rate:.0%}), "
+                f"{spec['failures']} failures"
+            )
+    return quarantined
+
+
+def focus_pattern(names: Iterable[str]) -> str:
+    """A -ginkgo.focus regex matching exactly the given specs."""
+    return "|".join(spec_regex(name) for name in sorted(names))
+
+
+def retry_args(extra: List[str]) -> List[str]:
+    """Extra suite arguments for the retried pass over quarantined specs."""
+    return [arg for arg in extra if "flake-attempts" not in arg] + [
+        f"-ginkgo.flake-attempts={FLAKE_ATTEMPTS}"
+    ]
@@ -0,0 +1,237 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Keep the artifacts of past runs within a disk budget and a maximum age.
+
+Runs are evicted least recently used first. The newest runs and pinned runs
+are never evicted. Runs in the artifact store only keep their files on disk
+while they are among the newest, since the store can rebuild them.
+"""
+
+import logging
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from store import ArtifactStore, chunk_sizes
+
+logger = logging.getLogger(__name__)
+
+# Everything scripts/test.sh and the charm leave in the action home for a run.
+# Runs are named by their Juju task id (a number, or a UUID on Juju 2). Files
+# the operator keeps in the home directory, such as 2024.log, can match too, so
+# only the runs of the run history are collected. Extra passes of a run, such
+# as the quarantine retry, belong to the run. Each suite of a matrix is a run
+# of its own.
+ARTIFACT_NAME = re.compile(
+    r"^(?P<run>(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
+    r"(?:\.[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)?)"
+    r"(?:-quarantine)?"
+    r"(?:\.log|\.log\.tar\.gz|-junit|-junit\.tar\.gz|-junit-combined\.xml"
+    r"|-checkpoint\.jsonl|-index\.tsv|-resources\.tsv|-nodes|-trace\.json|-prepull\.json)$"
+)
+
+
+@dataclass
+class RunArtifacts:
+    """The artifacts of one run found on disk."""
+
+    run_id: str
+    paths: List[Path] = field(default_factory=list)
+    size: int = 0
+    created: float = 0.0
+    last_used: float = 0.0
+    pinned: bool = False
+    # Stored size of each chunk of the run in the artifact store.
+    chunks: Dict[str, int] = field(default_factory=dict)
+
+
+def _size(path: Path) -> int:
+    if path.is_dir() and not path.is_symlink():
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+    try:
+        return path.lstat().st_size
+    except OSError:
+        return 0
+
+
+def run_paths(home: Path, run_id: str) -> List[Path]:
+    """The artifacts of one run in the action home."""
+    paths = []
+    with os.scandir(home) as entries:
+        for entry in entries:
+            if (match := ARTIFACT_NAME.match(entry.name)) and match["run"] == run_id:
+                paths.append(Path(entry.path))
+    return sorted(paths)
+
+
+def scan(
+    home: Path, runs: Iterable[Dict], store: Optional[ArtifactStore] = None
+) -> List[RunArtifacts]:
+    """Group the artifacts in the action home and the artifact store by run.
+
+    Files in the action home only count as artifacts of runs in the history;
+    anything else there was not written by the charm, or not since it kept a
+    history, and is left alone. Runs only the artifact store knows are dated
+    by when they were stored.
+    """
+    known = {run["id"]: run for run in runs}
+    found: Dict[str, RunArtifacts] = {}
+    with os.scandir(home) as entries:
+        for entry in entries:
+            match = ARTIFACT_NAME.match(entry.name)
+            if not match or match["run"] not in known:
+                continue
+            run_id = match["run"]
+            artifacts = found.setdefault(run_id, RunArtifacts(run_id))
+            path = Path(entry.path)
+            artifacts.paths.append(path)
+            artifacts.size += _size(path)
+            try:
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                mtime = 0.0
+            artifacts.created = max(artifacts.created, mtime)
+
+    for run_id in store.runs() if store else []:
+        if manifest := store.manifest(run_id):
+            artifacts = found.setdefault(run_id, RunArtifacts(run_id, created=manifest["created"]))
+            artifacts.chunks = chunk_sizes(manifest)
+
+    for run_id, artifacts in found.items():
+        if run := known.get(run_id):
+            artifacts.created = run["created_at"]
+            artifacts.pinned = bool(run.get("pinned"))
+            artifacts.last_used = max(run["created_at"], run.get("accessed_at") or 0)
+        else:
+            artifacts.last_used = artifacts.created
+    return sorted(found.values(), key=lambda a: a.created)
+
+
+def _newest(runs: List[RunArtifacts], keep: int) -> Set[str]:
+    return {a.run_id for a in sorted(runs, key=lambda a: a.created)[-max(keep, 1) :]}
+
+
+def stored_copies(runs: List[RunArtifacts], keep: int) -> List[RunArtifacts]:
+    """Runs whose files on disk can go because the artifact store holds them."""
+    newest = _newest(runs, keep)
+    return [a for a in runs if a.chunks and a.paths and a.run_id not in newest and not a.pinned]
+
+
+def plan(
+    runs: List[RunArtifacts],
+    budget: int,
+    max_age: float,
+    keep: int,
+    now: Optional[float] = None,
+) -> List[RunArtifacts]:
+    """Pick the runs to evict, oldest use first.
+
+    Evicting a run frees its files and the chunks of the artifact store no
+    other run shares. A budget or maximum age of 0 disables that limit.
+    """
+    now = time.time() if now is None else now
+    newest = _newest(runs, keep)
+    candidates = sorted(
+        (a for a in runs if a.run_id not in newest and not a.pinned),
+        key=lambda a: a.last_used,
+    )
+    references = Counter(digest for a in runs for digest in a.chunks)
+    chunks = {digest: size for a in runs for digest, size in a.chunks.items()}
+    total = sum(a.size for a in runs) + sum(chunks.values())
+    evict = []
+    for artifacts in candidates:
+        expired = max_age and artifacts.last_used < now - max_age
+        if not expired and not (budget and total > budget):
+            continue
+        evict.append(artifacts)
+        total -= artifacts.size
+        for digest, size in artifacts.chunks.items():
+            references[digest] -= 1
+            if not references[digest]:
+                total -= size
+    return evict
+
+
+def _unshared(runs: List[RunArtifacts], evict: List[RunArtifacts]) -> int:
+    """Stored bytes of the chunks only the evicted runs refer to."""
+    evicted = {a.run_id for a in evict}
+    kept = {digest for a in runs if a.run_id not in evicted for digest in a.chunks}
+    chunks = {digest: size for a in evict for digest, size in a.chunks.items()}
+    return sum(size for digest, size in chunks.items() if digest not in kept)
+
+
+def remove(artifacts: RunArtifacts) -> int:
+    """Delete the artifacts of a run and return the bytes freed."""
+    freed = 0
+    for path in artifacts.paths:
+        size = _size(path)
+        try:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except OSError:
+            logger.exception("Failed to remove %s", path)
+            continue
+        freed += size
+    return freed
+
+
+def format_size(size: float) -> str:
+    """A human readable size."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def collect(
+    home: Path,
+    runs: Iterable[Dict],
+    budget: int,
+    max_age: float,
+    keep: int,
+    dry_run: bool = False,
+    store: Optional[ArtifactStore] = None,
+) -> dict:
+    """Evict runs over the limits and report the space reclaimed."""
+    found = scan(home, runs, store)
+    total = sum(a.size for a in found) + (store.size() if store else 0)
+    reclaimed = 0
+
+    # Files the store can rebuild go first, whatever the budget.
+    stored = stored_copies(found, keep)
+    for artifacts in stored:
+        reclaimed += artifacts.size if dry_run else remove(artifacts)
+        artifacts.paths, artifacts.size = [], 0
+
+    evict = plan(found, budget, max_age, keep)
+    if dry_run:
+        reclaimed += sum(artifacts.size for artifacts in evict) + _unshared(found, evict)
+    else:
+        reclaimed += sum(remove(artifacts) for artifacts in evict)
+        if store and any(artifacts.chunks for artifacts in evict):
+            reclaimed += store.drop(a.run_id for a in evict if a.chunks)
+    for artifacts in evict:
+        logger.info("Evicted run %s", artifacts.run_id)
+    return {
+        "evicted": [artifacts.run_id for artifacts in evict],
+        "moved-to-store": [artifacts.run_id for artifacts in stored],
+        "reclaimed": reclaimed,
+        "remaining": total - reclaimed,
+        "kept": len(found) - len(evict),
+    }
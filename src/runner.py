@@ -0,0 +1,143 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Run scripts/test.sh and follow the suite's output while it runs."""
+
+import logging
+import os
+import signal
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from ginkgo import GinkgoParser, SpecReport
+
+logger = logging.getLogger(__name__)
+
+# Where scripts/test.sh writes the log and reports of each run.
+ACTION_HOME = Path("/home/ubuntu")
+
+
+def artifact_paths(run_id: str) -> Dict[str, str]:
+    """The files scripts/test.sh leaves behind for a run."""
+    return {
+        "log": str(ACTION_HOME / f"{run_id}.log"),
+        "log-tgz": str(ACTION_HOME / f"{run_id}.log.tar.gz"),
+        "junit": str(ACTION_HOME / f"{run_id}-junit"),
+        "junit-tgz": str(ACTION_HOME / f"{run_id}-junit.tar.gz"),
+        "checkpoint": str(ACTION_HOME / f"{run_id}-checkpoint.jsonl"),
+        "index": str(ACTION_HOME / f"{run_id}-index.tsv"),
+        "resources": str(ACTION_HOME / f"{run_id}-resources.tsv"),
+        "nodes": str(ACTION_HOME / f"{run_id}-nodes"),
+        "trace": str(ACTION_HOME / f"{run_id}-trace.json"),
+    }
+
+
+class RunObserver:
+    """Base class for anything that follows the output of a run."""
+
+    def on_line(self, line: str, offset: int) -> None:
+        """Handle one line of output starting at the given byte offset of the log."""
+
+    def on_spec(self, report: SpecReport) -> None:
+        """Handle one completed spec."""
+
+    def close(self) -> None:
+        """Finish up once the run has exited."""
+
+
+class E2ERunner:
+    """Launch the suite and feed its output to observers.
+
+    scripts/test.sh tees everything it writes to the run log onto stdout, so
+    byte offsets counted here are also offsets into the log file.
+    """
+
+    def __init__(self, command: Sequence[str], env: Optional[dict] = None):
+        self.command = list(command)
+        self.env = env
+        self.observers: List[RunObserver] = []
+        self.parser = GinkgoParser()
+        self.stop_reason: Optional[str] = None
+        self._process: Optional[subprocess.Popen] = None
+
+    def run(self) -> int:
+        """Run the suite to completion and return its exit code.
+
+        An observer which raises is logged and dropped, so one broken observer
+        cannot stop the output from being read.
+        """
+        # A new session lets stop() interrupt the suite without signalling the charm.
+        self._process = subprocess.Popen(
+            self.command, stdout=subprocess.PIPE, env=self.env, start_new_session=True
+        )
+        assert self._process.stdout is not None
+        offset = 0
+        drained = False
+        try:
+            for raw in self._process.stdout:
+                line = raw.decode(errors="replace")
+                for observer in list(self.observers):
+                    self._notify(observer, "on_line", line, offset)
+                self._dispatch(self.parser.feed(line, offset, len(raw)))
+                offset += len(raw)
+            self._dispatch(self.parser.close())
+            drained = True
+        finally:
+            if not drained:
+                # Nothing reads the output any more, and a suite writing into a
+                # full pipe would never exit.
+                self._process.stdout.close()
+                self._kill()
+            returncode = self._process.wait()
+            for observer in list(self.observers):
+                self._notify(observer, "close")
+        return returncode
+
+    def stop(self, reason: str) -> None:
+        """Interrupt ginkgo so it stops scheduling specs and writes its reports."""
+        if self.stop_reason is not None or self._process is None:
+            return
+        self.stop_reason = reason
+        logger.warning("Stopping e2e run: %s", reason)
+        try:
+            os.killpg(self._process.pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass
+
+    def _kill(self) -> None:
+        assert self._process is not None
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _notify(self, observer: RunObserver, method: str, *args) -> None:
+        try:
+            getattr(observer, method)(*args)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Dropping %s, which failed in %s", type(observer).__name__, method)
+            if observer in self.observers:
+                self.observers.remove(observer)
+
+    def _dispatch(self, reports: List[SpecReport]) -> None:
+        for report in reports:
+            for observer in list(self.observers):
+                self._notify(observer, "on_spec", report)
+
+
+class FailureTracker(RunObserver):
+    """Collect failed specs and optionally stop the run past a threshold."""
+
+    def __init__(self, max_failures: int = 0, stop: Optional[Callable[[str], None]] = None):
+        self.max_failures = max_failures
+        self.stop = stop
+        self.failures: List[str] = []
+
+    def on_spec(self, report: SpecReport) -> None:
+        """Record a failure and stop the run once too many have been seen."""
+        if not report.failed:
+            return
+        self.failures.append(report.name)
+        if self.stop and 0 < self.max_failures <= len(self.failures):
+            self.stop(f"{len(self.failures)} specs failed (max-failures={self.max_failures})")
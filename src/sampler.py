@@ -0,0 +1,327 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Sample cluster and runner resources in the background while suites run.
+
+Each sample is one tab separated line of the run's resources file, so slow
+specs can be matched against what the cluster and the runner were doing at the
+time. Node usage comes from the metrics API where it is installed, node
+pressure conditions otherwise, and API server latency from the deltas of its
+request duration histogram.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import kubectl
+from ginkgo import SpecReport
+from runner import RunObserver
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "time",
+    "runner-cpu",
+    "runner-load",
+    "runner-memory",
+    "runner-cpu-pressure",
+    "runner-io-pressure",
+    "node-cpu",
+    "node-memory",
+    "nodes-pressured",
+    "api-requests",
+    "api-mean-ms",
+    "api-p99-ms",
+)
+# Long running requests would swamp the latency of everything else.
+LONG_RUNNING_VERBS = {"WATCH", "CONNECT"}
+HISTOGRAM = "apiserver_request_duration_seconds"
+SERIES = re.compile(r"^(?P<name>[a-z_:]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+PRESSURE_CONDITIONS = {"MemoryPressure", "DiskPressure", "PIDPressure", "NetworkUnavailable"}
+SUFFIXES = {
+    "n": 1e-9,
+    "u": 1e-6,
+    "m": 1e-3,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+    "T": 1e12,
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+}
+# How many of the slowest specs the summary attributes.
+SLOW_SPECS = 5
+# What kubectl says when the cluster does not serve a path or denies it to us.
+UNAVAILABLE = ("(NotFound)", "(Forbidden)", "the server could not find the requested resource")
+
+
+def unavailable(error: subprocess.CalledProcessError) -> bool:
+    """Whether kubectl failed because the cluster lacks or denies the API, not by chance."""
+    return any(marker in str(error.stderr or "") for marker in UNAVAILABLE)
+
+
+def parse_quantity(quantity: str) -> float:
+    """Turn a Kubernetes quantity such as 250m, 1500123n or 16Gi into a number."""
+    match = re.match(r"^([0-9.eE+-]+?)([a-zA-Z]*)$", quantity.strip())
+    if not match or (match[2] and match[2] not in SUFFIXES):
+        raise ValueError(f"Not a quantity: {quantity}")
+    return float(match[1]) * SUFFIXES.get(match[2], 1)
+
+
+def node_usage(metrics: dict, allocatable: Dict[str, Tuple[float, float]]) -> Tuple[float, float]:
+    """The highest CPU and memory use of any node, as fractions of what it can allocate."""
+    cpu = memory = 0.0
+    for item in metrics.get("items", []):
+        name = item["metadata"]["name"]
+        if name not in allocatable:
+            continue
+        cores, size = allocatable[name]
+        cpu = max(cpu, parse_quantity(item["usage"]["cpu"]) / cores if cores else 0.0)
+        memory = max(memory, parse_quantity(item["usage"]["memory"]) / size if size else 0.0)
+    return cpu, memory
+
+
+def allocatable_of(nodes: dict) -> Dict[str, Tuple[float, float]]:
+    """The CPU cores and memory bytes each node can allocate."""
+    return {
+        node["metadata"]["name"]: (
+            parse_quantity(node["status"]["allocatable"]["cpu"]),
+            parse_quantity(node["status"]["allocatable"]["memory"]),
+        )
+        for node in nodes.get("items", [])
+    }
+
+
+def pressured(nodes: dict) -> int:
+    """How many nodes are not ready or report a pressure condition."""
+    count = 0
+    for node in nodes.get("items", []):
+        conditions = {c["type"]: c["status"] for c in node["status"].get("conditions", [])}
+        if conditions.get("Ready") != "True" or any(
+            conditions.get(kind) == "True" for kind in PRESSURE_CONDITIONS
+        ):
+            count += 1
+    return count
+
+
+def parse_histogram(lines: Iterable[str]) -> Tuple[Dict[float, float], float]:
+    """Sum the API server's request duration buckets and total over every series."""
+    buckets: Dict[float, float] = defaultdict(float)
+    total = 0.0
+    for line in lines:
+        if not line.startswith(HISTOGRAM):
+            continue
+        if not (match := SERIES.match(line)):
+            continue
+        labels = dict(LABEL.findall(match["labels"] or ""))
+        if labels.get("verb") in LONG_RUNNING_VERBS:
+            continue
+        if match["name"] == f"{HISTOGRAM}_bucket":
+            buckets[float(labels["le"])] += float(match["value"])
+        elif match["name"] == f"{HISTOGRAM}_sum":
+            total += float(match["value"])
+    return dict(buckets), total
+
+
+def latency(
+    before: Tuple[Dict[float, float], float], after: Tuple[Dict[float, float], float]
+) -> Tuple[float, float, float]:
+    """The requests served between two histograms, their mean and their 99th percentile."""
+    buckets = {le: after[0][le] - before[0].get(le, 0.0) for le in after[0]}
+    requests = buckets.get(math.inf, 0.0)
+    if requests <= 0:
+        return 0.0, 0.0, 0.0
+    mean = (after[1] - before[1]) / requests
+    p99 = math.inf
+    for le in sorted(buckets):
+        if buckets[le] >= 0.99 * requests:
+            p99 = le
+            break
+    if math.isinf(p99):
+        # Past the largest finite bucket all there is to tell is that bound.
+        p99 = max((le for le in buckets if not math.isinf(le)), default=0.0)
+    return requests, mean, p99
+
+
+class ResourceSampler(RunObserver):
+    """Sample in a background thread while used as a context manager.
+
+    Added to the observers of a runner, it also notes when each spec ends so
+    the summary can say what the slowest specs ran into.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        interval: float,
+        run: Callable[..., str] = kubectl.kubectl,
+        proc: Path = Path("/proc"),
+    ):
+        self.path = path
+        self.interval = interval
+        self.rows: List[Dict[str, float]] = []
+        self._kubectl = run
+        self._proc = proc
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._specs: List[Tuple[float, SpecReport]] = []
+        self._allocatable: Dict[str, Tuple[float, float]] = {}
+        self._metrics_api = True
+        self._api_metrics = True
+        self._histogram: Optional[Tuple[Dict[float, float], float]] = None
+        self._cpu: Optional[Tuple[float, float]] = None
+
+    def __enter__(self) -> "ResourceSampler":
+        self._file = self.path.open("w", encoding="utf-8")
+        self._file.write("\t".join(COLUMNS) + "\n")
+        self._thread = threading.Thread(target=self._loop, name="sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._file.close()
+
+    def on_spec(self, report: SpecReport) -> None:
+        """Note when a spec finished."""
+        self._specs.append((time.time(), report))
+
+    def _loop(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                row = self.sample()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to sample resources")
+            else:
+                self.rows.append(row)
+                self._file.write("\t".join(_format(row.get(c)) for c in COLUMNS) + "\n")
+                self._file.flush()
+            if self._stop.wait(max(self.interval - (time.monotonic() - started), 0)):
+                return
+
+    def sample(self) -> Dict[str, float]:
+        """Take one sample of everything that can be sampled."""
+        row = {"time": time.time()}
+        row.update(self._runner())
+        row.update(self._nodes())
+        row.update(self._api())
+        return row
+
+    def _read(self, name: str) -> str:
+        return (self._proc / name).read_text()
+
+    def _runner(self) -> Dict[str, float]:
+        row: Dict[str, float] = {"runner-load": os.getloadavg()[0]}
+        try:
+            times = [float(v) for v in self._read("stat").split("\n", 1)[0].split()[1:]]
+            # The idle and iowait columns.
+            idle, total = times[3] + times[4], sum(times)
+            if self._cpu and total > self._cpu[1]:
+                row["runner-cpu"] = 1 - (idle - self._cpu[0]) / (total - self._cpu[1])
+            self._cpu = (idle, total)
+            meminfo = dict(line.split(":", 1) for line in self._read("meminfo").splitlines())
+            available = float(meminfo["MemAvailable"].split()[0])
+            row["runner-memory"] = 1 - available / float(meminfo["MemTotal"].split()[0])
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+        for resource in ("cpu", "io"):
+            try:
+                some = self._read(f"pressure/{resource}").split("\n", 1)[0]
+                row[f"runner-{resource}-pressure"] = (
+                    float(some.split("avg10=")[1].split()[0]) / 100
+                )
+            except (OSError, ValueError, IndexError):
+                pass
+        return row
+
+    def _get_json(self, *args: str) -> dict:
+        return json.loads(self._kubectl(*args, timeout=max(self.interval, 10)))
+
+    def _nodes(self) -> Dict[str, float]:
+        try:
+            if self._metrics_api:
+                if not self._allocatable:
+                    self._allocatable = allocatable_of(
+                        self._get_json("get", "nodes", "-o", "json")
+                    )
+                metrics = self._get_json("get", "--raw", "/apis/metrics.k8s.io/v1beta1/nodes")
+                cpu, memory = node_usage(metrics, self._allocatable)
+                return {"node-cpu": cpu, "node-memory": memory}
+            return {"nodes-pressured": pressured(self._get_json("get", "nodes", "-o", "json"))}
+        except subprocess.CalledProcessError as e:
+            if self._metrics_api and unavailable(e):
+                logger.info("No metrics API, sampling node conditions instead")
+                self._metrics_api = False
+            else:
+                logger.debug("Failed to sample nodes: %s", e.stderr)
+        except (subprocess.SubprocessError, OSError, ValueError, KeyError):
+            logger.debug("Failed to sample nodes", exc_info=True)
+        return {}
+
+    def _api(self) -> Dict[str, float]:
+        if not self._api_metrics:
+            return {}
+        try:
+            text = self._kubectl("get", "--raw", "/metrics", timeout=max(self.interval, 10))
+        except subprocess.CalledProcessError as e:
+            if unavailable(e):
+                logger.info("API server metrics are not readable, not sampling latency")
+                self._api_metrics = False
+            else:
+                logger.debug("Failed to sample API server metrics: %s", e.stderr)
+            return {}
+        except (subprocess.SubprocessError, OSError):
+            return {}
+        histogram = parse_histogram(text.splitlines())
+        before, self._histogram = self._histogram, histogram
+        if before is None:
+            return {}
+        requests, mean, p99 = latency(before, histogram)
+        return {"api-requests": requests, "api-mean-ms": mean * 1000, "api-p99-ms": p99 * 1000}
+
+    def summary(self) -> Dict[str, str]:
+        """Peaks and means of the samples, and what the slowest specs ran into."""
+        if not self.rows:
+            return {}
+        summary = {"samples": str(len(self.rows)), "file": str(self.path)}
+        for column in COLUMNS[1:]:
+            values = [row[column] for row in self.rows if column in row]
+            if values:
+                mean = sum(values) / len(values)
+                summary[column] = f"max {_format(max(values))} mean {_format(mean)}"
+        slow = sorted(self._specs, key=lambda spec: spec[1].seconds, reverse=True)[:SLOW_SPECS]
+        lines = []
+        for ended, report in slow:
+            window = [row for row in self.rows if ended - report.seconds <= row["time"] <= ended]
+            seen = [
+                f"{column} {_format(max(row[column] for row in window if column in row))}"
+                for column in ("runner-cpu", "node-cpu", "nodes-pressured", "api-p99-ms")
+                if any(column in row for row in window)
+            ]
+            lines.append(
+                f"{report.name} [{report.seconds:.0f}s]: {', '.join(seen) or 'no samples'}"
+            )
+        if lines:
+            summary["slow-specs"] = "\n".join(lines)
+        return summary
+
+
+def _format(value: Optional[float]) -> str:
+    if value is None:
+        return ""
+    return f"{value:.3f}".rstrip("0").rstrip(".") if abs(value) < 1e6 else f"{value:.0f}"
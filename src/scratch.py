@@ -0,0 +1,207 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Stage the output of a run in memory and move it to disk in large writes.
+
+With a scratch size configured, scripts/test.sh tees the run log and has
+ginkgo write its JUnit reports into a tmpfs mounted for the run instead of
+/home/ubuntu. While the suite runs, a thread appends the log to its file in
+/home/ubuntu in large chunks and punches what it copied out of the tmpfs, so
+the log never holds more than a chunk of memory. Once the suite is over
+scripts/test.sh appends the rest and moves the reports, before packing them.
+Both lock the log in /home/ubuntu while appending, so each byte lands once.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from runner import RunObserver
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_ROOT = Path("/run/kubernetes-e2e/scratch")
+# How much of the log builds up in memory before it is appended to disk.
+SPILL_BYTES = 64 * 2**20
+COPY_BUFFER = 8 * 2**20
+
+
+def available_memory(proc: Path = Path("/proc")) -> int:
+    """The bytes of memory the kernel reckons can be used without swapping."""
+    for line in (proc / "meminfo").read_text().splitlines():
+        if line.startswith("MemAvailable:"):
+            return int(line.split()[1]) * 1024
+    raise ValueError("no MemAvailable in meminfo")
+
+
+def mount_tmpfs(path: Path, size_mib: int) -> None:
+    """Mount a tmpfs of at most the given size."""
+    subprocess.run(
+        ["mount", "-t", "tmpfs", "-o", f"size={size_mib}m,mode=0755", "e2e-scratch", str(path)],
+        check=True,
+        capture_output=True,
+    )
+
+
+def unmount(path: Path) -> None:
+    """Unmount a tmpfs, dropping whatever is left in it."""
+    subprocess.run(["umount", str(path)], check=True, capture_output=True)
+
+
+def punch_hole(path: Path, length: int) -> None:
+    """Free the first bytes of a file while appends carry on at its end."""
+    subprocess.run(
+        ["fallocate", "--punch-hole", "--offset", "0", "--length", str(length), str(path)],
+        check=True,
+        capture_output=True,
+    )
+
+
+def append_missing(source: Path, target: Path) -> int:
+    """Append the bytes of source past the length of target; return the new length."""
+    with target.open("ab", buffering=COPY_BUFFER) as out:
+        fcntl.flock(out, fcntl.LOCK_EX)
+        length = os.fstat(out.fileno()).st_size
+        with source.open("rb") as src:
+            src.seek(length)
+            while chunk := src.read(COPY_BUFFER):
+                out.write(chunk)
+                length += len(chunk)
+        out.flush()
+    return length
+
+
+class ScratchSpace(RunObserver):
+    """A tmpfs for the output of one run, used as a context manager around it.
+
+    When the memory for the tmpfs is short or it cannot be mounted, the run
+    writes to disk as it always has and ``fallback`` says why.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        size_mib: int,
+        home: Path,
+        root: Path = SCRATCH_ROOT,
+        proc: Path = Path("/proc"),
+    ):
+        self.run_id = run_id
+        self.size_mib = size_mib
+        self.home = home
+        self.path = home
+        self.fallback: Optional[str] = None
+        self.chunk = min(SPILL_BYTES, size_mib * 2**20 // 4)
+        self._mount_point = root / run_id
+        self._proc = proc
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def tmpfs(self) -> bool:
+        """Whether the run writes to the tmpfs."""
+        return self.path != self.home
+
+    def env(self) -> Dict[str, str]:
+        """The environment telling scripts/test.sh where to write."""
+        return {"E2E_SCRATCH": str(self.path)}
+
+    def __enter__(self) -> "ScratchSpace":
+        if self.size_mib <= 0:
+            return self
+        try:
+            available = available_memory(self._proc)
+        except (OSError, ValueError) as e:
+            return self._fall_back(f"cannot tell the memory available: {e}")
+        # Leave at least as much memory to the suite as the tmpfs may take.
+        if 2 * self.size_mib * 2**20 > available:
+            return self._fall_back(
+                f"{available // 2**20} MiB of memory available, "
+                f"less than twice the {self.size_mib} MiB scratch space"
+            )
+        try:
+            self._mount_point.mkdir(parents=True, exist_ok=True)
+            mount_tmpfs(self._mount_point, self.size_mib)
+        except subprocess.CalledProcessError as e:
+            self._mount_point.rmdir()
+            return self._fall_back(f"mount failed: {e.stderr.decode(errors='replace').strip()}")
+        except OSError as e:
+            return self._fall_back(f"mount failed: {e}")
+        self.path = self._mount_point
+        # The log on disk only grows by appends from the one on the tmpfs.
+        (self.home / f"{self.run_id}.log").write_bytes(b"")
+        self._thread = threading.Thread(target=self._loop, name="scratch", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        if not self.tmpfs:
+            return
+        self._stop_spilling()
+        try:
+            unmount(self._mount_point)
+            self._mount_point.rmdir()
+        except (OSError, subprocess.CalledProcessError):
+            logger.exception("Failed to remove the scratch space of run %s", self.run_id)
+
+    def _fall_back(self, reason: str) -> "ScratchSpace":
+        logger.warning("Run %s writes to disk: %s", self.run_id, reason)
+        self.fallback = reason
+        return self
+
+    def on_line(self, line: str, offset: int) -> None:
+        """Wake the spilling thread once another chunk of the log has built up."""
+        if not self.tmpfs:
+            return
+        if offset - self._pending >= self.chunk:
+            self._pending = offset
+            self._wake.set()
+
+    def close(self) -> None:
+        """Move whatever scripts/test.sh did not, should it have stopped short."""
+        if not self.tmpfs:
+            return
+        self._stop_spilling()
+        try:
+            self.spill()
+            junit = self.path / f"{self.run_id}-junit"
+            if junit.exists() and not (self.home / junit.name).exists():
+                shutil.move(str(junit), str(self.home / junit.name))
+        except OSError:
+            logger.exception("Failed to move the output of run %s to disk", self.run_id)
+
+    def spill(self) -> None:
+        """Append the log so far to disk and free it from the tmpfs."""
+        log = self.path / f"{self.run_id}.log"
+        if not log.exists():
+            return
+        length = append_missing(log, self.home / log.name)
+        try:
+            punch_hole(log, length)
+        except (OSError, subprocess.CalledProcessError):
+            logger.debug("Failed to free the spilled log", exc_info=True)
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait()
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            try:
+                self.spill()
+            except OSError:
+                logger.exception("Failed to spill the log of run %s", self.run_id)
+
+    def _stop_spilling(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,97 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Install the snaps of the charm from its resources instead of the Snap Store.
+
+Sites without a route to the store attach the kubectl and kubernetes-test
+snaps as resources. The SHA-256 of each snap installed from a resource is kept
+with the revision snapd gave it, so that hooks seeing the same resource again
+leave the installed snap alone rather than reinstalling it. Hashing a snap of a
+few hundred MiB on every hook is not free either, so the hash of a resource is
+reused for as long as its file keeps its size and modification time.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from charms.operator_libs_linux.v2 import snap
+
+from history import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+SNAP_STATE = STATE_DIR / "snaps.json"
+HASH_BUFFER = 1024 * 1024
+
+
+def sha256(path: Path) -> str:
+    """The SHA-256 of a file, read in large blocks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(HASH_BUFFER):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _installed_revision(name: str) -> Optional[str]:
+    try:
+        installed = snap.SnapCache()[name]
+    except snap.Error:
+        return None
+    return installed.revision if installed.present else None
+
+
+class LocalSnaps:
+    """The snaps installed from resources, by the hash of their content."""
+
+    def __init__(self, state_path: Path = SNAP_STATE):
+        self.state_path = state_path
+        self.state: Dict[str, dict] = {}
+        if state_path.exists():
+            try:
+                self.state = json.loads(state_path.read_text())
+            except (OSError, ValueError):
+                logger.warning("Ignoring unreadable snap state %s", state_path)
+
+    def digest(self, name: str, path: Path) -> str:
+        """The SHA-256 of a resource, hashed again only if its file changed."""
+        info = path.stat()
+        entry = self.state.get(name, {})
+        if entry.get("size") == info.st_size and entry.get("mtime-ns") == info.st_mtime_ns:
+            return entry["sha256"]
+        return sha256(path)
+
+    def install(self, name: str, path: Path, classic: bool = False) -> bool:
+        """Install a snap from a resource unless it already is; tell whether it was.
+
+        A local file does not carry its confinement, which the caller tells.
+
+        Raises snap.SnapError should snapd fail to install it.
+        """
+        digest = self.digest(name, path)
+        entry = self.state.get(name, {})
+        if entry.get("sha256") == digest and entry.get("revision") == _installed_revision(name):
+            logger.info("The %s snap from resource %s is already installed", name, digest[:12])
+            return False
+        # Nor does it carry a store signature.
+        installed = snap.install_local(str(path), classic=classic, dangerous=True)
+        info = path.stat()
+        self.state[name] = {
+            "sha256": digest,
+            "size": info.st_size,
+            "mtime-ns": info.st_mtime_ns,
+            "revision": installed.revision,
+        }
+        self.save()
+        logger.info("Installed the %s snap from resource %s", name, digest[:12])
+        return True
+
+    def save(self) -> None:
+        """Write the state where the next hook finds it."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state))
+        tmp.replace(self.state_path)
@@ -0,0 +1,262 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Content-addressed store deduplicating the logs and reports of runs.
+
+Files are cut into chunks at line boundaries chosen from the content itself,
+so output which repeats from run to run yields the same chunks even when it
+moves around in the file. Each chunk is compressed and stored once under its
+SHA-256, and a manifest per run lists the chunks of every file with their
+sizes, so a byte range of a file can be read by decompressing only the chunks
+it spans.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from history import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = STATE_DIR / "store"
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 256 * 1024
+# A line ends a chunk when the low bits of its hash are zero: one in 64 lines.
+BOUNDARY_MASK = 0x3F
+# Digits are left out of the boundary hash so that timestamps, durations and
+# generated names do not move the chunk boundaries between runs.
+DIGITS = b"0123456789"
+COMPRESS_LEVEL = 6
+
+
+def chunks(stream: BinaryIO) -> Iterator[bytes]:
+    """Cut a stream into content-defined chunks at line boundaries."""
+    lines: List[bytes] = []
+    size = 0
+    for line in stream:
+        lines.append(line)
+        size += len(line)
+        if size >= MAX_CHUNK or (
+            size >= MIN_CHUNK and zlib.crc32(line.translate(None, DIGITS)) & BOUNDARY_MASK == 0
+        ):
+            yield b"".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines)
+
+
+def chunk_sizes(manifest: dict) -> Dict[str, int]:
+    """The stored size of every chunk a run's manifest refers to."""
+    return {
+        digest: size for entry in manifest["files"].values() for digest, size, _ in entry["chunks"]
+    }
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class ArtifactStore:
+    """Chunks under objects/, one JSON manifest per run under manifests/."""
+
+    def __init__(self, root: Path = STORE_DIR):
+        self.root = root
+        self.objects = root / "objects"
+        self.manifests = root / "manifests"
+
+    def _object(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest[2:]
+
+    def _manifest(self, run_id: str) -> Path:
+        return self.manifests / f"{run_id}.json"
+
+    def _put_chunk(self, chunk: bytes) -> Tuple[str, int, bool]:
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._object(digest)
+        try:
+            return digest, path.stat().st_size, False
+        except FileNotFoundError:
+            data = zlib.compress(chunk, COMPRESS_LEVEL)
+            _write_atomic(path, data)
+            return digest, len(data), True
+
+    def put(self, run_id: str, files: Dict[str, Path]) -> dict:
+        """Store files under the given names as one run and report what it cost."""
+        manifest = {"run": run_id, "created": time.time(), "files": {}}
+        stats = {"files": 0, "bytes": 0, "chunks": 0, "new-chunks": 0, "stored": 0}
+        for name, path in sorted(files.items()):
+            try:
+                info = path.stat()
+                with path.open("rb") as stream:
+                    entries = []
+                    for chunk in chunks(stream):
+                        digest, size, new = self._put_chunk(chunk)
+                        entries.append([digest, size, len(chunk)])
+                        stats["chunks"] += 1
+                        if new:
+                            stats["new-chunks"] += 1
+                            stats["stored"] += size
+            except OSError:
+                logger.exception("Failed to store %s", path)
+                continue
+            manifest["files"][name] = {
+                "size": info.st_size,
+                "mode": info.st_mode & 0o777,
+                "mtime": info.st_mtime,
+                "chunks": entries,
+            }
+            stats["files"] += 1
+            stats["bytes"] += info.st_size
+        _write_atomic(self._manifest(run_id), json.dumps(manifest).encode())
+        return stats
+
+    def manifest(self, run_id: str) -> Optional[dict]:
+        """The manifest of a stored run."""
+        try:
+            return json.loads(self._manifest(run_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def runs(self) -> List[str]:
+        """The ids of every stored run."""
+        try:
+            return sorted(path.stem for path in self.manifests.glob("*.json"))
+        except OSError:
+            return []
+
+    def read(
+        self, run_id: str, name: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """Stream the content of one stored file, or of the bytes from start to end."""
+        manifest = self.manifest(run_id)
+        if not manifest or name not in manifest["files"]:
+            raise FileNotFoundError(f"{name} of run {run_id} is not in the store")
+        position = 0
+        for digest, _, length in manifest["files"][name]["chunks"]:
+            if end is not None and position >= end:
+                return
+            if position + length <= start:
+                position += length
+                continue
+            data = zlib.decompress(self._object(digest).read_bytes())
+            offset, position = position, position + len(data)
+            if offset < start or (end is not None and position > end):
+                data = data[max(start - offset, 0) : None if end is None else end - offset]
+            if data:
+                yield data
+
+    def restore(self, run_id: str, name: str, dest: Path) -> Path:
+        """Rebuild one stored file."""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with dest.open("wb") as f:
+            for data in self.read(run_id, name):
+                f.write(data)
+        return dest
+
+    def tarball(self, run_id: str, prefix: str, dest: Path) -> Path:
+        """Rebuild a gzipped tarball of the stored files whose names start with prefix.
+
+        Member names are relative to the prefix, as scripts/test.sh packs them.
+        """
+        manifest = self.manifest(run_id)
+        if not manifest:
+            raise FileNotFoundError(f"Run {run_id} is not in the store")
+        names = [name for name in sorted(manifest["files"]) if name.startswith(prefix)]
+        if not names:
+            raise FileNotFoundError(f"No {prefix} files of run {run_id} in the store")
+        with tarfile.open(dest, "w:gz") as tar:
+            for name in names:
+                entry = manifest["files"][name]
+                info = tarfile.TarInfo(name[len(prefix) :].lstrip("/") or Path(name).name)
+                info.size, info.mode, info.mtime = entry["size"], entry["mode"], entry["mtime"]
+                tar.addfile(info, _ChunkReader(self.read(run_id, name)))
+        return dest
+
+    def rebuild(self, run_id: str, home: Path) -> List[Path]:
+        """Rebuild the artifacts of a run the way scripts/test.sh leaves them.
+
+        Logs and report directories come back as the tarballs the action
+        results point at, anything else as the file itself.
+        """
+        manifest = self.manifest(run_id)
+        if not manifest:
+            raise FileNotFoundError(f"Run {run_id} is not in the store")
+        rebuilt = []
+        for name in sorted({name.split("/", 1)[0] for name in manifest["files"]}):
+            if name not in manifest["files"]:
+                rebuilt.append(self.tarball(run_id, f"{name}/", home / f"{name}.tar.gz"))
+            elif name.endswith(".log"):
+                rebuilt.append(self.tarball(run_id, name, home / f"{name}.tar.gz"))
+            else:
+                rebuilt.append(self.restore(run_id, name, home / name))
+        return rebuilt
+
+    def drop(self, run_ids: Iterable[str]) -> int:
+        """Forget runs and delete the chunks no other run refers to; return bytes freed."""
+        for run_id in run_ids:
+            self._manifest(run_id).unlink(missing_ok=True)
+        referenced = set()
+        for run_id in self.runs():
+            referenced.update(chunk_sizes(self.manifest(run_id) or {"files": {}}))
+        freed = 0
+        if not self.objects.exists():
+            return freed
+        for prefix in self.objects.iterdir():
+            for path in prefix.iterdir():
+                if prefix.name + path.name in referenced:
+                    continue
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                except OSError:
+                    logger.exception("Failed to remove %s", path)
+                    continue
+                freed += size
+        return freed
+
+    def size(self) -> int:
+        """Bytes the store takes up on disk."""
+        total = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+
+class _ChunkReader:
+    """File-like view of a stream of chunks, as tarfile.addfile reads it."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -0,0 +1,125 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Span based tracing of hooks and actions, written in Chrome trace event format.
+
+The trace files load in chrome://tracing or Perfetto.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# scripts/test.sh appends "<phase> <begin|end> <unix time>" lines to this file.
+PHASES_ENV = "E2E_TRACE_PHASES"
+SCRIPT_TID = 2
+
+
+class Span:
+    """One timed phase."""
+
+    def __init__(self, name: str, start: float, tid: int = 1, **args: Any):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.tid = tid
+        self.args = args
+
+    @property
+    def seconds(self) -> float:
+        """How long the span lasted."""
+        return self.end - self.start
+
+    def event(self, pid: int) -> Dict[str, Any]:
+        """The span as a complete ("X") trace event."""
+        return {
+            "name": self.name,
+            "ph": "X",
+            "ts": int(self.start * 1e6),
+            "dur": int(self.seconds * 1e6),
+            "pid": pid,
+            "tid": self.tid,
+            "args": self.args,
+        }
+
+
+class Tracer:
+    """Collect spans for the current dispatch."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Span]:
+        """Time the body of a with statement."""
+        span = Span(name, time.time(), **args)
+        try:
+            yield span
+        finally:
+            span.end = time.time()
+            with self._lock:
+                self.spans.append(span)
+
+    def import_phases(self, path: Path) -> None:
+        """Turn the phase markers written by scripts/test.sh into spans."""
+        try:
+            lines = path.read_text().splitlines()
+        except OSError:
+            return
+        open_phases: Dict[str, float] = {}
+        for line in lines:
+            try:
+                name, edge, stamp = line.split()
+                moment = float(stamp)
+            except ValueError:
+                continue
+            if edge == "begin":
+                open_phases[name] = moment
+            elif edge == "end" and name in open_phases:
+                span = Span(name, open_phases.pop(name), tid=SCRIPT_TID)
+                span.end = moment
+                self.spans.append(span)
+
+    def summary(self) -> Dict[str, float]:
+        """Total seconds spent per span name."""
+        totals: Dict[str, float] = defaultdict(float)
+        for span in self.spans:
+            totals[span.name] += span.seconds
+        return dict(totals)
+
+    def write(self, path: Path) -> None:
+        """Write the spans as a Chrome trace event file."""
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [span.event(pid) for span in sorted(self.spans, key=lambda s: s.start)],
+            "displayTimeUnit": "ms",
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(trace))
+        except OSError:
+            logger.exception("Failed to write trace to %s", path)
+
+
+def traced(name: str) -> Callable:
+    """Decorate a charm method so each call is recorded as a span."""
+
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
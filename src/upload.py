@@ -0,0 +1,337 @@
+# Copyright 2024 Canonical
+# See LICENSE file for licensing details.
+
+"""Upload run artifacts to S3 compatible object storage.
+
+Requests are signed with AWS Signature Version 4 using only the standard
+library. Files larger than a part go up as multipart uploads whose parts are
+sent in parallel; the parts already uploaded are kept in a state file, so an
+upload which fails part way resumes where it stopped on the next attempt.
+"""
+
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import math
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from history import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_STATE_DIR = STATE_DIR / "uploads"
+# S3 takes parts of 5 MiB and more, except for the last one, and at most 10000 of them.
+PART_SIZE = 8 * 2**20
+MAX_PARTS = 10000
+ATTEMPTS = 5
+BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+TIMEOUT = 60
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class S3Error(Exception):
+    """A request the storage refused."""
+
+    def __init__(self, status: int, code: str, message: str = ""):
+        super().__init__(f"{status} {code}: {message}" if message else f"{status} {code}")
+        self.status = status
+        self.code = code
+
+
+@dataclass
+class S3Config:
+    """Where to upload and with which credentials."""
+
+    endpoint: str
+    bucket: str
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+
+
+def _encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def sign(
+    method: str,
+    path: str,
+    query: Dict[str, str],
+    headers: Dict[str, str],
+    payload_hash: str,
+    config: S3Config,
+    moment: datetime,
+) -> str:
+    """The Authorization header of a request; headers must hold every header to sign."""
+    canonical_headers = {name.lower(): " ".join(value.split()) for name, value in headers.items()}
+    signed = ";".join(sorted(canonical_headers))
+    canonical_request = "\n".join(
+        [
+            method,
+            _encode(path, safe="-_.~/"),
+            "&".join(f"{_encode(k)}={_encode(v)}" for k, v in sorted(query.items())),
+            "".join(f"{name}:{canonical_headers[name]}\n" for name in sorted(canonical_headers)),
+            signed,
+            payload_hash,
+        ]
+    )
+    day = moment.strftime("%Y%m%d")
+    scope = f"{day}/{config.region}/s3/aws4_request"
+    string_to_sign = "\n".join(
+        [
+            "AWS4-HMAC-SHA256",
+            moment.strftime("%Y%m%dT%H%M%SZ"),
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+    key = f"AWS4{config.secret_key}".encode()
+    for part in (day, config.region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return (
+        f"AWS4-HMAC-SHA256 Credential={config.access_key}/{scope},"
+        f"SignedHeaders={signed},Signature={signature}"
+    )
+
+
+def _find(body: bytes, tag: str) -> str:
+    try:
+        element = ET.fromstring(body).find(f".//{{*}}{tag}")
+    except ET.ParseError:
+        return ""
+    return element.text or "" if element is not None else ""
+
+
+class S3Client:
+    """Path style requests to one bucket, retried with exponential backoff.
+
+    Each thread keeps its own connection to the endpoint.
+    """
+
+    def __init__(self, config: S3Config, attempts: int = ATTEMPTS, backoff: float = BACKOFF):
+        self.config = config
+        self.attempts = attempts
+        self.backoff = backoff
+        endpoint = urlsplit(config.endpoint)
+        self._https = endpoint.scheme == "https"
+        self._host = endpoint.netloc
+        self._base = endpoint.path.rstrip("/")
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if getattr(self._local, "connection", None) is None:
+            kind = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            self._local.connection = kind(self._host, timeout=TIMEOUT)
+        return self._local.connection
+
+    def _reset(self) -> None:
+        if connection := getattr(self._local, "connection", None):
+            connection.close()
+        self._local.connection = None
+
+    def request(
+        self,
+        method: str,
+        key: str,
+        query: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a signed request, retrying connection errors and server errors."""
+        query = query or {}
+        path = f"{self._base}/{self.config.bucket}/{key}"
+        url = _encode(path, safe="-_.~/")
+        if query:
+            url += "?" + "&".join(f"{_encode(k)}={_encode(v)}" for k, v in sorted(query.items()))
+        payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+        for attempt in range(self.attempts):
+            moment = datetime.now(timezone.utc)
+            headers = {
+                "Host": self._host,
+                "x-amz-content-sha256": payload_hash,
+                "x-amz-date": moment.strftime("%Y%m%dT%H%M%SZ"),
+            }
+            headers["Authorization"] = sign(
+                method, path, query, headers, payload_hash, self.config, moment
+            )
+            headers["Content-Length"] = str(len(body))
+            try:
+                connection = self._connection()
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self._reset()
+                error: Exception = e
+            else:
+                if response.status < 300:
+                    return response.status, dict(response.getheaders()), data
+                error = S3Error(response.status, _find(data, "Code"), _find(data, "Message"))
+                if response.status < 500 and response.status != 429:
+                    raise error
+            if attempt + 1 < self.attempts:
+                delay = min(self.backoff * 2**attempt, MAX_BACKOFF)
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, key, error, delay)
+                time.sleep(delay)
+        raise error
+
+    def put_object(self, key: str, body: bytes) -> str:
+        """Upload a whole object and return its ETag."""
+        _, headers, _ = self.request("PUT", key, body=body)
+        return headers.get("ETag", "")
+
+    def create_multipart_upload(self, key: str) -> str:
+        """Start a multipart upload and return its id."""
+        _, _, data = self.request("POST", key, {"uploads": ""})
+        if not (upload_id := _find(data, "UploadId")):
+            raise S3Error(200, "InvalidResponse", "no UploadId in the response")
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> str:
+        """Upload one part and return its ETag."""
+        query = {"partNumber": str(number), "uploadId": upload_id}
+        _, headers, _ = self.request("PUT", key, query, body)
+        return headers.get("ETag", "")
+
+    def complete_multipart_upload(self, key: str, upload_id: str, etags: Dict[int, str]) -> None:
+        """Assemble the uploaded parts into the object."""
+        root = ET.Element("CompleteMultipartUpload")
+        for number in sorted(etags):
+            part = ET.SubElement(root, "Part")
+            ET.SubElement(part, "PartNumber").text = str(number)
+            ET.SubElement(part, "ETag").text = etags[number]
+        _, _, data = self.request("POST", key, {"uploadId": upload_id}, ET.tostring(root))
+        # The storage may report a failure after it has started to answer 200 OK.
+        if code := _find(data, "Code"):
+            raise S3Error(200, code, _find(data, "Message"))
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """Discard a multipart upload and its parts."""
+        self.request("DELETE", key, {"uploadId": upload_id})
+
+
+class Uploader:
+    """Upload files in the background, the parts of large files in parallel."""
+
+    def __init__(
+        self,
+        client: S3Client,
+        workers: int = 4,
+        part_size: int = PART_SIZE,
+        state_dir: Path = UPLOAD_STATE_DIR,
+    ):
+        self.client = client
+        self.part_size = part_size
+        self.state_dir = state_dir
+        self._files = ThreadPoolExecutor(max(workers // 2, 1), thread_name_prefix="upload")
+        self._parts = ThreadPoolExecutor(max(workers, 1), thread_name_prefix="upload-part")
+        self._uploads: Dict[Path, Tuple[str, Future]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, path: Path, key: str) -> None:
+        """Start uploading a file unless it already is."""
+        with self._lock:
+            if path not in self._uploads:
+                self._uploads[path] = (key, self._files.submit(self.upload, path, key))
+
+    def wait(self) -> Dict[str, List[str]]:
+        """Wait for every upload and report which keys went up and which failed."""
+        done: Dict[str, List[str]] = {"uploaded": [], "failed": []}
+        for path, (key, future) in self._uploads.items():
+            try:
+                future.result()
+            except (S3Error, OSError, http.client.HTTPException) as e:
+                logger.error("Failed to upload %s to %s: %s", path, key, e)
+                done["failed"].append(key)
+            else:
+                done["uploaded"].append(key)
+        self._files.shutdown()
+        self._parts.shutdown()
+        return done
+
+    def upload(self, path: Path, key: str) -> int:
+        """Upload one file and return its size."""
+        size = path.stat().st_size
+        if size <= self.part_size:
+            self.client.put_object(key, path.read_bytes())
+            return size
+        try:
+            self._multipart(path, key, size)
+        except S3Error as e:
+            if e.code != "NoSuchUpload":
+                raise
+            # The storage forgot the upload being resumed, e.g. it expired.
+            self._state_path(key).unlink(missing_ok=True)
+            self._multipart(path, key, size)
+        return size
+
+    def _state_path(self, key: str) -> Path:
+        digest = hashlib.sha256(f"{self.client.config.bucket}/{key}".encode()).hexdigest()
+        return self.state_dir / f"{digest}.json"
+
+    def _multipart(self, path: Path, key: str, size: int) -> None:
+        mtime = path.stat().st_mtime
+        part_size = max(self.part_size, math.ceil(size / MAX_PARTS))
+        state_path = self._state_path(key)
+        try:
+            state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            state = {}
+        if (state.get("size"), state.get("mtime"), state.get("part-size")) != (
+            size,
+            mtime,
+            part_size,
+        ):
+            state = {
+                "key": key,
+                "upload-id": self.client.create_multipart_upload(key),
+                "size": size,
+                "mtime": mtime,
+                "part-size": part_size,
+                "parts": {},
+            }
+        else:
+            logger.info("Resuming upload of %s with %d parts done", key, len(state["parts"]))
+        self._save(state_path, state)
+
+        lock = threading.Lock()
+        upload_id = state["upload-id"]
+
+        def send(number: int) -> None:
+            with path.open("rb") as f:
+                f.seek((number - 1) * part_size)
+                body = f.read(part_size)
+            etag = self.client.upload_part(key, upload_id, number, body)
+            with lock:
+                state["parts"][str(number)] = etag
+                self._save(state_path, state)
+
+        numbers = range(1, math.ceil(size / part_size) + 1)
+        futures = [
+            self._parts.submit(send, number)
+            for number in numbers
+            if str(number) not in state["parts"]
+        ]
+        for future in futures:
+            future.result()
+        etags = {int(number): etag for number, etag in state["parts"].items()}
+        self.client.complete_multipart_upload(key, upload_id, etags)
+        state_path.unlink(missing_ok=True)
+
+    def _save(self, path: Path, state: dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, path)
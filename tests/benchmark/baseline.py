@@ -0,0 +1,64 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Stored benchmark baselines and the comparison against them.
+
+Counts (subprocesses, snapd requests, bytes written) are deterministic, so
+any real increase is a regression. Times depend on the machine and are only
+flagged past BENCHMARK_TIME_TOLERANCE times the baseline.
+"""
+
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+# Slack for counts which vary a little between runs, such as bytes of timestamps.
+COUNT_SLACK = 1.1
+TIMED_SUFFIX = "-ms"
+# Sub-millisecond hooks would otherwise trip over scheduling noise.
+MIN_TIME_SLACK_MS = 5.0
+
+
+class Baselines:
+    """Baselines kept as one JSON file per benchmark suite."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.tolerance = float(os.environ.get("BENCHMARK_TIME_TOLERANCE", "3"))
+        self.measured: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self._stored: Dict[str, Dict[str, dict]] = {}
+
+    def stored(self, suite: str) -> Dict[str, dict]:
+        """The baselines of one suite."""
+        if suite not in self._stored:
+            try:
+                self._stored[suite] = json.loads((self.directory / f"{suite}.json").read_text())
+            except OSError:
+                self._stored[suite] = {}
+        return self._stored[suite]
+
+    def check(self, suite: str, name: str, measured: Dict[str, float]) -> List[str]:
+        """Record a measurement and describe any regression against its baseline."""
+        self.measured[suite][name] = measured
+        baseline = self.stored(suite).get(name, {})
+        regressions = []
+        for key, value in measured.items():
+            if key not in baseline:
+                continue
+            if key.endswith(TIMED_SUFFIX):
+                limit = max(baseline[key] * self.tolerance, baseline[key] + MIN_TIME_SLACK_MS)
+            else:
+                limit = baseline[key] * COUNT_SLACK
+            if value > limit:
+                regressions.append(f"{name} {key}: {value} > baseline {baseline[key]}")
+        return regressions
+
+    def save(self) -> None:
+        """Replace the stored baselines with this session's measurements."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for suite, measured in self.measured.items():
+            baselines = {**self.stored(suite), **measured}
+            path = self.directory / f"{suite}.json"
+            path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
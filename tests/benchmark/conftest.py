@@ -0,0 +1,154 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures running the charm against fakes of the e2e suite, the kube API and snapd.
+
+Nothing here needs a cluster or snapd: scripts/test.sh runs for real, but
+finds stand-ins for kubernetes-test.e2e, kubectl, snap and action-set on its
+PATH, and every path the charm writes to is moved under a temporary directory.
+"""
+
+import functools
+import json
+import os
+import sys
+from pathlib import Path
+
+import ops.testing
+import pytest
+from baseline import Baselines
+from charms.operator_libs_linux.v2 import snap
+from fake_apiserver import FakeAPIServer
+from fake_snapd import FakeSnapd
+
+import charm
+import coalesce
+import health
+import runner
+from charm import KubernetesE2ECharm
+from history import RunHistory
+from metrics import Metrics
+from snaps import LocalSnaps
+from store import ArtifactStore
+
+REPO = Path(__file__).parents[2]
+HERE = Path(__file__).parent
+KUBE_CONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- cluster:
+    server: {server}
+  name: bench
+"""
+RESULTS_KEY = pytest.StashKey[list]()
+
+
+def _executable(path: Path, body: str) -> None:
+    path.write_text(f"#!/bin/sh\n{body}\n")
+    path.chmod(0o755)
+
+
+@pytest.fixture
+def charm_root(tmp_path, monkeypatch):
+    """Move everything the charm writes under a temporary directory."""
+    home = tmp_path / "home"
+    home.mkdir()
+    (tmp_path / "bin").mkdir()
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(runner, "ACTION_HOME", home)
+    monkeypatch.setattr(charm, "ACTION_HOME", home)
+    monkeypatch.setattr(charm, "KUBE_CONFIG_PATH", str(home / ".kube" / "config"))
+    monkeypatch.setattr(charm, "ROOT_KUBE_CONFIG_PATH", str(tmp_path / ".kube" / "config"))
+    monkeypatch.setattr(charm, "TRACE_DIR", tmp_path / "traces")
+    monkeypatch.setattr(charm, "RunHistory", functools.partial(RunHistory, tmp_path / "h.db"))
+    monkeypatch.setattr(charm, "Metrics", functools.partial(Metrics, tmp_path / "metrics.json"))
+    monkeypatch.setattr(
+        charm, "ArtifactStore", functools.partial(ArtifactStore, tmp_path / "store")
+    )
+    monkeypatch.setattr(
+        coalesce, "RequestLog", functools.partial(coalesce.RequestLog, tmp_path / "requests.json")
+    )
+    monkeypatch.setattr(
+        health, "HealthState", functools.partial(health.HealthState, tmp_path / "health.json")
+    )
+    monkeypatch.setattr(
+        charm, "LocalSnaps", functools.partial(LocalSnaps, tmp_path / "snaps.json")
+    )
+    monkeypatch.setattr(KubernetesE2ECharm, "CA_CERT_PATH", tmp_path / "srv" / "ca.crt")
+    # The charm runs scripts/test.sh relative to the charm directory.
+    monkeypatch.chdir(REPO)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def api_server():
+    """A fake kube API server shared by the whole session."""
+    server = FakeAPIServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def action_home(charm_root, monkeypatch, api_server):
+    """Put the fake suite, kubectl and action-set in front of scripts/test.sh."""
+    bin_dir = charm_root / "bin"
+    _executable(
+        bin_dir / "kubernetes-test.e2e", f'exec {sys.executable} {HERE / "fake_e2e.py"} "$@"'
+    )
+    _executable(bin_dir / "kubectl", f'exec {sys.executable} {HERE / "fake_kubectl.py"} "$@"')
+    _executable(bin_dir / "action-set", f'echo "$@" >> {charm_root / "action-set.log"}')
+    kube_config = Path(charm.KUBE_CONFIG_PATH)
+    kube_config.parent.mkdir(parents=True)
+    kube_config.write_text(KUBE_CONFIG.format(server=api_server.url))
+    monkeypatch.setattr(KubernetesE2ECharm, "_snap_revision", lambda self, name: "bench")
+    return runner.ACTION_HOME
+
+
+@pytest.fixture
+def snapd(charm_root, monkeypatch):
+    """Answer the snap library from a fake snapd and a fake snap command."""
+    fake = FakeSnapd(charm_root / "snaps-installed")
+    _executable(charm_root / "bin" / "snap", fake.script())
+    monkeypatch.setattr(snap.SnapClient, "_request_raw", fake.request_raw)
+    monkeypatch.setattr(snap.SnapCache, "snapd_installed", property(lambda self: True))
+    snap._Cache.cache = None
+    yield fake
+    snap._Cache.cache = None
+
+
+@pytest.fixture
+def harness(charm_root):
+    """A harness for the charm with its paths moved under charm_root."""
+    harness = ops.testing.Harness(KubernetesE2ECharm)
+    harness.begin()
+    yield harness
+    harness.cleanup()
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request):
+    """Collect the measurements of the session and report them at the end."""
+    results = request.config.stash.setdefault(RESULTS_KEY, [])
+    yield results
+    if path := os.environ.get("BENCHMARK_REPORT"):
+        Path(path).write_text(json.dumps(results, indent=2))
+
+
+@pytest.fixture(scope="session")
+def baselines():
+    """Stored baselines, rewritten at the end when BENCHMARK_UPDATE_BASELINES is set."""
+    stored = Baselines(HERE / "baselines")
+    yield stored
+    if os.environ.get("BENCHMARK_UPDATE_BASELINES"):
+        stored.save()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """Print one line per benchmark."""
+    results = config.stash.get(RESULTS_KEY, [])
+    if not results:
+        return
+    terminalreporter.section("benchmarks")
+    for result in results:
+        metrics = ", ".join(f"{k}={v}" for k, v in result.items() if k != "name")
+        terminalreporter.write_line(f"{result['name']}: {metrics}")
@@ -0,0 +1,115 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Stand-in for kubernetes-test.e2e which emits ginkgo output at a configurable scale.
+
+The scale is read from the environment:
+
+* E2E_BENCH_SPECS: number of specs to report.
+* E2E_BENCH_LINES: lines of spec output (STEP lines) per spec.
+* E2E_BENCH_FAIL_EVERY: every Nth spec fails, 0 for none.
+
+The number of parallel nodes comes from GINKGO_ARGS (-nodes=N), as with the
+real suite. Specs take no real time, so the run measures the charm alone.
+"""
+
+import json
+import os
+import random
+import sys
+import urllib.request
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+SEPARATOR = "------------------------------"
+SIGS = ["sig-apps", "sig-network", "sig-node", "sig-storage", "sig-auth", "sig-cli"]
+
+
+def _arg(args, name, default=""):
+    if name in args:
+        return args[args.index(name) + 1]
+    return default
+
+
+def _spec(index, failed, lines, rng):
+    sig = SIGS[index % len(SIGS)]
+    name = f"[{sig}] Benchmark spec {index} should do its thing [Conformance]"
+    seconds = rng.uniform(0.5, 60)
+    output = [SEPARATOR]
+    if failed:
+        output += [f"• [FAILED] [{seconds:.3f} seconds]", name, "test/e2e/bench/spec.go:42"]
+    else:
+        output += [name, "test/e2e/bench/spec.go:42"]
+    output += [
+        f"  STEP: step {step} of spec {index} @ 01/01/25 00:00:{step % 60:02d}.000"
+        for step in range(lines)
+    ]
+    if failed:
+        output += ["", "  [FAILED] timed out waiting for the condition"]
+    else:
+        output.append(f"• [{seconds:.3f} seconds]")
+    return name, seconds, output
+
+
+def main():
+    """Print the suite output and write a JUnit report like the real suite."""
+    args = sys.argv[1:]
+    specs = int(os.environ.get("E2E_BENCH_SPECS", "100"))
+    lines = int(os.environ.get("E2E_BENCH_LINES", "20"))
+    fail_every = int(os.environ.get("E2E_BENCH_FAIL_EVERY", "0"))
+    nodes = 1
+    for arg in os.environ.get("GINKGO_ARGS", "").split():
+        if arg.startswith("-nodes="):
+            nodes = max(1, int(arg.split("=", 1)[1]))
+
+    # The real suite checks the server version before running any spec.
+    with urllib.request.urlopen(f"{_arg(args, '-host')}/version", timeout=10) as response:
+        version = json.load(response)["gitVersion"]
+
+    rng = random.Random(specs)
+    out = sys.stdout
+    out.write(f"Running Suite: Kubernetes e2e suite - {version}\n")
+    out.write(f"Will run {specs} of {specs} specs\n")
+    results = []
+    # Parallel nodes stream their output interleaved, one spec per node at a time.
+    for first in range(0, specs, nodes):
+        batch = []
+        for node, index in enumerate(range(first, min(first + nodes, specs)), start=1):
+            failed = bool(fail_every) and (index + 1) % fail_every == 0
+            name, seconds, output = _spec(index, failed, lines, rng)
+            results.append((name, seconds, failed))
+            batch.append((node, output))
+        for row in range(max(len(output) for _, output in batch)):
+            for node, output in batch:
+                if row < len(output):
+                    prefix = f"[{node}] " if nodes > 1 else ""
+                    out.write(f"{prefix}{output[row]}\n")
+    out.write(f"{SEPARATOR}\n")
+
+    failures = sum(failed for _, _, failed in results)
+    out.write(f"Ran {specs} of {specs} Specs\n")
+    if failures:
+        out.write(f"FAIL! -- {specs - failures} Passed | {failures} Failed\n")
+        out.write("Test Suite Failed\n")
+    else:
+        out.write(f"SUCCESS! -- {specs} Passed | 0 Failed\n")
+        out.write("Test Suite Passed\n")
+    out.flush()
+
+    report_dir = Path(_arg(args, "-report-dir", "."))
+    report_dir.mkdir(parents=True, exist_ok=True)
+    with (report_dir / "junit_01.xml").open("w") as junit:
+        junit.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        junit.write(f'<testsuite name="Kubernetes e2e suite" tests="{specs}" ')
+        junit.write(f'failures="{failures}">\n')
+        for name, seconds, failed in results:
+            junit.write(f'  <testcase name={quoteattr(name)} time="{seconds:.3f}">')
+            if failed:
+                junit.write('<failure message="timed out waiting for the condition"></failure>')
+            junit.write("</testcase>\n")
+        junit.write("</testsuite>\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
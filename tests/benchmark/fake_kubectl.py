@@ -0,0 +1,33 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Stand-in for kubectl supporting the version probe in scripts/test.sh."""
+
+import json
+import os
+import re
+import sys
+import urllib.request
+
+
+def main():
+    """Print the server version in the format scripts/test.sh parses."""
+    args = sys.argv[1:]
+    if not args or args[0] != "version":
+        sys.stderr.write(f"fake kubectl: unsupported command {args}\n")
+        return 1
+    config = os.environ.get("E2E_KUBE_CONFIG") or os.environ["KUBECONFIG"]
+    with open(config) as f:
+        server = re.search(r"server: (\S+)", f.read())[1]
+    with urllib.request.urlopen(f"{server}/version", timeout=10) as response:
+        version = json.load(response)
+    print('Client Version: version.Info{Major:"1", Minor:"31", GitVersion:"v1.31.0"}')
+    print(
+        f'Server Version: version.Info{{Major:"{version["major"]}", '
+        f'Minor:"{version["minor"]}", GitVersion:"{version["gitVersion"]}", Platform:"linux"}}'
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Stand-in for the snapd REST API and the snap command.
+
+The fake snap command records installs in a state file, which the fake API
+reads back, so the first hook installs the snaps and later ones refresh them.
+"""
+
+import io
+import json
+from pathlib import Path
+
+SNAPS = {
+    "kubectl": {"confinement": "classic", "revision": "3446"},
+    "kubernetes-test": {"confinement": "classic", "revision": "612"},
+}
+
+
+class FakeSnapd:
+    """Answer the requests the snap library makes over the snapd socket."""
+
+    def __init__(self, state: Path):
+        self.state = state
+        self.requests = 0
+
+    def script(self) -> str:
+        """Body of the fake snap command."""
+        return f'[ "$1" = install ] && echo "$2" >> {self.state}\nexit 0'
+
+    def _installed(self):
+        try:
+            return set(self.state.read_text().split())
+        except OSError:
+            return set()
+
+    def _snap(self, name: str) -> dict:
+        return {"name": name, "channel": "latest/stable", **SNAPS[name]}
+
+    def request_raw(self, method, path, query=None, headers=None, data=None):
+        """Replacement for SnapClient._request_raw."""
+        self.requests += 1
+        query = query or {}
+        if path == "snaps":
+            result = [self._snap(name) for name in sorted(self._installed())]
+        elif path == "find":
+            result = [self._snap(query["name"])]
+        elif path == "apps":
+            result = []
+        else:
+            result = {}
+        return io.BytesIO(json.dumps({"result": result}).encode())
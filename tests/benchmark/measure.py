@@ -0,0 +1,65 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Resource measurements shared by the benchmarks."""
+
+import resource
+import sys
+import time
+from pathlib import Path
+
+
+def reset_peak_rss() -> None:
+    """Reset the peak resident set size of this process, where Linux allows it."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+_subprocesses = [0]
+
+
+def _audit(event: str, args: tuple) -> None:
+    if event == "subprocess.Popen":
+        _subprocesses[0] += 1
+
+
+sys.addaudithook(_audit)
+
+
+def bytes_written() -> int:
+    """Bytes this process has passed to write calls so far, log output included."""
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class Measurement:
+    """Wall time, subprocesses started and bytes written within a with block."""
+
+    def __enter__(self) -> "Measurement":
+        self._subprocesses = _subprocesses[0]
+        self._written = bytes_written()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.seconds = time.perf_counter() - self._started
+        self.subprocesses = _subprocesses[0] - self._subprocesses
+        self.bytes_written = bytes_written() - self._written
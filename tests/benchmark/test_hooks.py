@@ -0,0 +1,121 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Benchmark the charm's relation and config hooks."""
+
+import json
+import statistics
+from collections import defaultdict
+
+from charms.operator_libs_linux.v2 import snap
+from measure import Measurement
+
+# A cluster change reaches the unit as a burst of relation-changed events.
+ROUNDS = 20
+CA = "-----BEGIN CERTIFICATE-----\nMIIBbench\n-----END CERTIFICATE-----\n"
+UNIT = "kubernetes-e2e/0"
+
+
+def _kube_control_data(secret_id: str, token: str) -> dict:
+    creds = {"client_token": token, "kubelet_token": token, "proxy_token": token, "scope": UNIT}
+    return {
+        "api-endpoints": json.dumps(["https://10.0.0.1:6443"]),
+        "ca-certificate-secret-id": secret_id,
+        "cluster-tag": "kubernetes-bench",
+        "creds": json.dumps({UNIT: creds}),
+        "default-cni": json.dumps(""),
+        "domain": "cluster.local",
+        "enable-kube-dns": "true",
+        "has-xcp": json.dumps(False),
+        "port": json.dumps(53),
+        "registry-location": "rocks.canonical.com/cdk",
+    }
+
+
+class Replay:
+    """Dispatch events through the harness and measure each one."""
+
+    def __init__(self, harness, snapd):
+        self.harness = harness
+        self.snapd = snapd
+        self.measured = defaultdict(list)
+
+    def _fresh_process(self):
+        # Each hook is a new process, so nothing cached by a previous hook survives.
+        snap._Cache.cache = None
+        for requirer in (self.harness.charm.kube_control, self.harness.charm.certificates):
+            for name, attribute in vars(type(requirer)).items():
+                if type(attribute).__name__ == "cached_property":
+                    vars(requirer).pop(name, None)
+
+    def __call__(self, event, dispatch, *args):
+        self._fresh_process()
+        requests = self.snapd.requests
+        with Measurement() as measurement:
+            result = dispatch(*args)
+        measurement.snapd_requests = self.snapd.requests - requests
+        self.measured[event].append(measurement)
+        return result
+
+
+def test_hook_latency(harness, snapd, benchmark_results, baselines):
+    replay = Replay(harness, snapd)
+    replay("config-changed", harness.update_config, {"channel": "1.31/stable"})
+
+    kube_control = replay(
+        "kube-control-created", harness.add_relation, "kube-control", "kubernetes-control-plane"
+    )
+    secret_id = harness.add_model_secret("kubernetes-control-plane", {"ca-certificate": CA})
+    harness.grant_secret(secret_id, harness.charm.app)
+    replay(
+        "kube-control-joined",
+        harness.add_relation_unit,
+        kube_control,
+        "kubernetes-control-plane/0",
+    )
+    for i in range(ROUNDS):
+        replay(
+            "kube-control-changed",
+            harness.update_relation_data,
+            kube_control,
+            "kubernetes-control-plane/0",
+            _kube_control_data(secret_id, f"token-{i}"),
+        )
+    assert harness.charm.unit.status.name == "active", harness.charm.unit.status
+
+    certificates = replay("certificates-created", harness.add_relation, "certificates", "easyrsa")
+    replay("certificates-joined", harness.add_relation_unit, certificates, "easyrsa/0")
+    for i in range(ROUNDS):
+        replay(
+            "certificates-changed",
+            harness.update_relation_data,
+            certificates,
+            "easyrsa/0",
+            {"ca": CA, "serial": str(i)},
+        )
+    for i in range(ROUNDS):
+        replay("config-changed", harness.update_config, {"channel": f"1.{30 + i % 2}/stable"})
+    replay("certificates-broken", harness.remove_relation, certificates)
+    replay("kube-control-broken", harness.remove_relation, kube_control)
+    assert harness.charm.unit.status.name == "blocked", harness.charm.unit.status
+
+    regressions = []
+    for event, measurements in replay.measured.items():
+        seconds = [m.seconds for m in measurements]
+        result = {
+            "mean-ms": round(statistics.fmean(seconds) * 1000, 2),
+            "subprocesses": max(m.subprocesses for m in measurements),
+            "snapd-requests": max(m.snapd_requests for m in measurements),
+            "bytes-written": max(m.bytes_written for m in measurements),
+        }
+        benchmark_results.append(
+            {
+                "name": f"hook[{event}]",
+                "events": len(seconds),
+                "max-ms": round(max(seconds) * 1000, 2),
+                **result,
+            }
+        )
+        regressions += baselines.check("hooks", event, result)
+    assert not regressions, "\n".join(regressions)
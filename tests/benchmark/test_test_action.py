@@ -0,0 +1,68 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Benchmark the test action end to end against the fake suite."""
+
+import time
+
+import ops.testing
+import pytest
+from measure import peak_rss, reset_peak_rss
+
+import checkpoint
+
+# specs, STEP lines per spec, parallel nodes, every Nth spec fails
+SCALES = {
+    "small": (200, 20, 1, 0),
+    "parallel": (1000, 20, 4, 0),
+    "verbose": (300, 500, 2, 0),
+    "failing": (1000, 20, 4, 10),
+}
+PARAMS = {"focus": "", "skip": "", "timeout": 300, "extra": ""}
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def test_test_action(harness, action_home, monkeypatch, benchmark_results, scale):
+    specs, lines, nodes, fail_every = SCALES[scale]
+    monkeypatch.setenv("E2E_BENCH_SPECS", str(specs))
+    monkeypatch.setenv("E2E_BENCH_LINES", str(lines))
+    monkeypatch.setenv("E2E_BENCH_FAIL_EVERY", str(fail_every))
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    try:
+        output = harness.run_action("test", {**PARAMS, "parallelism": nodes})
+        verdict = "passed"
+    except ops.testing.ActionFailed as e:
+        output = e.output
+        verdict = "failed"
+    to_verdict = time.perf_counter() - started
+    rss = peak_rss()
+
+    assert verdict == ("failed" if fail_every else "passed"), output.results
+    (log,) = action_home.glob("*.log")
+    run_id = log.stem
+    _, reports = checkpoint.load(checkpoint.checkpoint_path(run_id))
+    assert len(reports) == specs
+    assert sum(report.failed for report in reports.values()) == (
+        specs // fail_every if fail_every else 0
+    )
+
+    timings = harness.charm.tracer.summary()
+    log_bytes = log.stat().st_size
+    suite = timings.get("suite", timings["run"])
+    benchmark_results.append(
+        {
+            "name": f"test-action[{scale}]",
+            "specs": specs,
+            "log-mib": round(log_bytes / 2**20, 2),
+            "time-to-verdict-s": round(to_verdict, 3),
+            "suite-s": round(suite, 3),
+            "after-suite-s": round(to_verdict - timings["run"], 3),
+            "package-s": round(timings.get("package", 0), 3),
+            "throughput-mib-s": round(log_bytes / 2**20 / suite, 2),
+            "specs-per-s": round(specs / suite, 1),
+            "peak-rss-mib": round(rss / 2**20, 1),
+        }
+    )
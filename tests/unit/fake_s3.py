@@ -0,0 +1,132 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Minimal stand-in for S3 compatible storage such as MinIO.
+
+It checks request signatures and keeps objects in memory. Failures can be
+injected to exercise retries and resumed uploads.
+"""
+
+import hashlib
+import re
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from upload import S3Config, sign
+
+AUTHORIZATION = re.compile(r"Credential=[^,]+,SignedHeaders=(?P<signed>[^,]+),Signature=")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def _reply(self, status: int, body: bytes = b"", headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, code: str):
+        self._reply(status, f"<Error><Code>{code}</Code></Error>".encode())
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        path, query = unquote(url.path), dict(parse_qsl(url.query, keep_blank_values=True))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests[self.command] += 1
+
+        match = AUTHORIZATION.search(self.headers.get("Authorization", ""))
+        if not match:
+            return self._error(403, "AccessDenied")
+        headers = {name: self.headers[name] for name in match["signed"].split(";")}
+        moment = datetime.strptime(self.headers["x-amz-date"], "%Y%m%dT%H%M%SZ")
+        moment = moment.replace(tzinfo=timezone.utc)
+        payload_hash = hashlib.sha256(body).hexdigest()
+        expected = sign(self.command, path, query, headers, payload_hash, fake.config, moment)
+        if self.headers["Authorization"] != expected:
+            return self._error(403, "SignatureDoesNotMatch")
+
+        _, bucket, key = path.split("/", 2)
+        if bucket != fake.config.bucket:
+            return self._error(404, "NoSuchBucket")
+        if self.command == "PUT" and "partNumber" in query:
+            return self._put_part(key, query, body)
+        if self.command == "PUT":
+            fake.objects[key] = body
+            return self._reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if self.command == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            fake.uploads[upload_id] = {}
+            return self._reply(200, f"<R><UploadId>{upload_id}</UploadId></R>".encode())
+        if self.command == "POST" and "uploadId" in query:
+            parts = fake.uploads.pop(query["uploadId"], None)
+            if parts is None:
+                return self._error(404, "NoSuchUpload")
+            numbers = [int(e.text) for e in ET.fromstring(body).iter("PartNumber")]
+            fake.objects[key] = b"".join(parts[number] for number in sorted(numbers))
+            return self._reply(200, b"<CompleteMultipartUploadResult/>")
+        if self.command == "DELETE" and "uploadId" in query:
+            fake.uploads.pop(query["uploadId"], None)
+            return self._reply(204)
+        return self._error(400, "NotImplemented")
+
+    def _put_part(self, key: str, query: Dict[str, str], body: bytes):
+        fake = self.server.fake
+        number = int(query["partNumber"])
+        with fake.lock:
+            if fake.fail_parts[number] > 0:
+                fake.fail_parts[number] -= 1
+                return self._error(503, "SlowDown")
+        parts = fake.uploads.get(query["uploadId"])
+        if parts is None:
+            return self._error(404, "NoSuchUpload")
+        parts[number] = body
+        fake.parts_received += 1
+        self._reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+    do_GET = do_PUT = do_POST = do_DELETE = _handle  # noqa: N815
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    fake: "FakeS3"
+
+
+class FakeS3:
+    """Serve one bucket on a free local port in a background thread."""
+
+    def __init__(self, bucket: str = "artifacts"):
+        self.httpd = _Server(("127.0.0.1", 0), _Handler)
+        self.httpd.fake = self
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.fail_parts: Counter = Counter()
+        self.parts_received = 0
+        self.requests: Counter = Counter()
+        self.lock = threading.Lock()
+        host, port = self.httpd.server_address[:2]
+        self.config = S3Config(f"http://{host}:{port}", bucket, "minio", "minio123")
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self) -> "FakeS3":
+        """Start serving."""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,132 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Stand-in for scripts/test.sh which runs a handful of specs without a cluster.
+
+It is called with the arguments of scripts/test.sh and writes what the script
+would: the run log with its JUJU_E2E_* markers, the JUnit directory with a
+report per node, their merge and the ginkgo report, and the tarballs of both.
+The specs come from E2E_FAKE_SPECS, a JSON object of spec names and their
+states, and follow -ginkgo.focus and -ginkgo.skip the way ginkgo v2 does.
+"""
+
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import tarfile
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+SEPARATOR = "------------------------------"
+SUITE = "Kubernetes e2e suite"
+SPECS = {"[sig-node] Pods should be submitted and removed": "passed"}
+START = 1714644000
+
+
+def _selected(name, focus, skips):
+    text = f"{SUITE} {name}"
+    if focus and not re.search(focus, text):
+        return False
+    return not any(skip and re.search(skip, text) for skip in skips)
+
+
+def _junit(specs):
+    cases = []
+    for name, state in specs.items():
+        body = {"failed": '<failure message="failed"/>', "skipped": "<skipped/>"}.get(state, "")
+        cases.append(f'<testcase name={quoteattr("[It] " + name)} time="1">{body}</testcase>')
+    return f'<testsuites><testsuite name="{SUITE}">{"".join(cases)}</testsuite></testsuites>\n'
+
+
+def _report(specs, nodes):
+    reports = []
+    for index, (name, state) in enumerate(specs.items()):
+        reports.append(
+            {
+                "ContainerHierarchyTexts": None,
+                "LeafNodeType": "It",
+                "LeafNodeText": name,
+                "State": state,
+                "StartTime": f"2024-05-02T10:00:{index:02d}Z",
+                "EndTime": f"2024-05-02T10:00:{index + 1:02d}Z",
+                "RunTime": 10**9,
+                "ParallelProcess": index % nodes + 1,
+            }
+        )
+    return [
+        {
+            "SuiteDescription": SUITE,
+            "StartTime": "2024-05-02T10:00:00Z",
+            "EndTime": f"2024-05-02T10:00:{len(specs):02d}Z",
+            "SpecReports": reports,
+        }
+    ]
+
+
+def main():
+    """Run the specs picked by the arguments and write the artifacts of the run."""
+    focus, skip, parallelism, _, *extra = sys.argv[1:]
+    skips = [skip] + [extra[i + 1] for i, arg in enumerate(extra[:-1]) if arg == "-ginkgo.skip"]
+    home = Path(os.environ["E2E_ACTION_HOME"])
+    run_id = os.environ["E2E_RUN_ID"]
+    scratch = Path(os.environ.get("E2E_SCRATCH") or home)
+    specs = {
+        name: state
+        for name, state in json.loads(os.environ.get("E2E_FAKE_SPECS", json.dumps(SPECS))).items()
+        if _selected(name, focus, skips)
+    }
+
+    # Like ginkgo, an interrupt stops the specs but not the reports.
+    interrupted = []
+    signal.signal(signal.SIGINT, lambda *_: interrupted.append(True))
+    ran = {}
+    with (scratch / f"{run_id}.log").open("a") as log:
+
+        def emit(*lines):
+            for line in lines:
+                print(line, flush=True)
+                log.write(line + "\n")
+
+        emit(f"JUJU_E2E_START={START}", "JUJU_E2E_VERSION=v1.31.0")
+        for name, state in specs.items():
+            if interrupted:
+                break
+            label = "" if state == "passed" else f"[{state.upper()}] "
+            emit(SEPARATOR, name, "test/e2e/fake.go:1", f"• {label}[1.000 seconds]")
+            ran[name] = state
+        emit(SEPARATOR)
+        if "failed" in ran.values():
+            emit("Test Suite Failed")
+        emit(f"JUJU_E2E_END={START + len(ran)}")
+
+    # Each ginkgo node writes a JUnit report of its own specs.
+    nodes = max(int(parallelism), 1)
+    junit = scratch / f"{run_id}-junit"
+    junit.mkdir(parents=True, exist_ok=True)
+    for node in range(nodes):
+        node_specs = dict(list(ran.items())[node::nodes])
+        (junit / f"junit_{node + 1:02d}.xml").write_text(_junit(node_specs))
+    (junit / "ginkgo-report.json").write_text(json.dumps(_report(ran, nodes)))
+
+    if scratch != home:
+        # The charm may have moved the start of the log to disk already.
+        with (home / f"{run_id}.log").open("ab") as log:
+            log.write((scratch / f"{run_id}.log").read_bytes()[log.tell() :])
+        junit = junit.rename(home / f"{run_id}-junit")
+    if merge := os.environ.get("E2E_JUNIT_MERGE"):
+        merged = subprocess.run([*shlex.split(merge), str(junit), f"kubernetes-e2e {run_id}"])
+        if merged.returncode != 0:
+            print("Failed to merge the JUnit reports", flush=True)
+    with tarfile.open(home / f"{run_id}-junit.tar.gz", "w:gz") as tar:
+        for path in junit.iterdir():
+            tar.add(path, path.name)
+    with tarfile.open(home / f"{run_id}.log.tar.gz", "w:gz") as tar:
+        tar.add(home / f"{run_id}.log", f"{run_id}.log")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for measuring cluster latency under an e2e workload."""
+
+import json
+import math
+import subprocess
+
+import pytest
+
+import benchmark
+from benchmark import Histogram, Latency
+
+
+def _series(metric, labels, buckets, count):
+    """Text exposition of one histogram series with cumulative buckets."""
+    lines = []
+    for le, value in buckets.items():
+        lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {value}')
+    lines.append(f"{metric}_sum{{{labels}}} 1.5")
+    lines.append(f"{metric}_count{{{labels}}} {count}")
+    return lines
+
+
+def _apiserver(gets, lists, watches):
+    metric = "apiserver_request_duration_seconds"
+    return "\n".join(
+        [
+            "# HELP apiserver_request_duration_seconds Response latency",
+            *_series(metric, 'verb="GET",resource="pods",scope="namespace"', gets, gets["+Inf"]),
+            *_series(metric, 'verb="GET",resource="pods",scope="cluster"', gets, gets["+Inf"]),
+            *_series(metric, 'verb="LIST",resource="nodes"', lists, lists["+Inf"]),
+            *_series(metric, 'verb="WATCH",resource="pods"', watches, watches["+Inf"]),
+            *_series(
+                "etcd_request_duration_seconds",
+                'operation="get",type="*core.Pod"',
+                {"0.005": gets["0.1"], "+Inf": gets["+Inf"]},
+                gets["+Inf"],
+            ),
+        ]
+    )
+
+
+def test_quantiles_interpolate_within_buckets():
+    histogram = Histogram({0.1: 50.0, 0.5: 90.0, 1.0: 100.0, math.inf: 100.0}, 100.0)
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert histogram.quantile(0.7) == pytest.approx(0.3)
+    assert histogram.quantile(0.99) == pytest.approx(0.95)
+    # Requests beyond the largest finite bucket can only be placed at it.
+    beyond = Histogram({0.1: 10.0, math.inf: 100.0}, 100.0)
+    assert beyond.quantile(0.9) == 0.1
+    assert math.isnan(Histogram().quantile(0.5))
+
+
+def test_measure_groups_requests_by_verb_and_resource():
+    before = benchmark.parse_histograms(
+        _apiserver(
+            {"0.1": 10, "1": 10, "+Inf": 10}, {"0.1": 0, "1": 0, "+Inf": 0}, {"+Inf": 1}
+        ).splitlines(),
+        benchmark.API_METRICS,
+    )
+    after = benchmark.parse_histograms(
+        _apiserver(
+            {"0.1": 60, "1": 110, "+Inf": 110}, {"0.1": 0, "1": 0, "+Inf": 0}, {"+Inf": 9}
+        ).splitlines(),
+        benchmark.API_METRICS,
+    )
+    latencies = benchmark.measure(before, after)
+    assert [(lat.metric, lat.subject, lat.requests) for lat in latencies] == [
+        ("apiserver_request_duration_seconds", "GET pods", 200),
+        ("etcd_request_duration_seconds", "get *core.Pod", 100),
+    ]
+    # Both scopes of GET pods: 100 of 200 requests under 0.1s, the rest under 1s.
+    assert latencies[0].p50 == pytest.approx(0.1)
+    assert latencies[0].p90 == pytest.approx(0.82)
+
+
+def test_snapshot_adds_up_pod_startup_over_kubelets():
+    startup = "kubelet_pod_start_sli_duration_seconds"
+    kubelets = {
+        "a": "\n".join(_series(startup, 'a="b"', {"1": 3, "5": 4, "+Inf": 4}, 4)),
+        # An older kubelet only has the metric including image pulls.
+        "b": "\n".join(
+            _series("kubelet_pod_start_duration_seconds", 'a="b"', {"1": 1, "+Inf": 2}, 2)
+        ),
+    }
+
+    def kubectl(*args, timeout=None):
+        if args[:2] == ("get", "nodes"):
+            return json.dumps({"items": [{"metadata": {"name": n}} for n in ("a", "b", "c")]})
+        path = args[-1]
+        if path == "/metrics":
+            return _apiserver({"0.1": 1, "1": 1, "+Inf": 1}, {"+Inf": 0}, {"+Inf": 0})
+        node = path.split("/")[4]
+        if node not in kubelets:
+            raise subprocess.CalledProcessError(1, "kubectl")
+        return kubelets[node]
+
+    snapshot = benchmark.snapshot(kubectl)
+    pods = snapshot[("pod_start_duration_seconds", ("", ""))]
+    assert pods.count == 6
+    assert pods.buckets == {1.0: 4, 5.0: 4, math.inf: 6}
+    assert snapshot[("apiserver_request_duration_seconds", ("GET", "pods"))].count == 2
+
+
+def test_summary_compares_with_the_baseline():
+    latencies = [
+        Latency("apiserver_request_duration_seconds", "GET pods", 200, 0.01, 0.05, 0.2),
+        Latency("pod_start_duration_seconds", "all", 4, 1.5, 3, 4.5),
+    ]
+    baseline = {
+        ("apiserver_request_duration_seconds", "GET pods"): {"p99": 0.16},
+    }
+    assert benchmark.summarize(latencies, baseline) == {
+        "api-server": "GET pods: p50 10.0ms p90 50.0ms p99 200.0ms (200 requests), "
+        "p99 +25% on the baseline",
+        "pod-startup": "all: p50 1500.0ms p90 3000.0ms p99 4500.0ms (4 requests)",
+    }
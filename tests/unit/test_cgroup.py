@@ -0,0 +1,129 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for running the suite in a systemd scope."""
+
+import subprocess
+import time
+from unittest import mock
+
+import pytest
+
+import cgroup
+
+
+def test_scope_command_sets_the_limits(monkeypatch):
+    monkeypatch.setattr(cgroup.shutil, "which", lambda name: f"/usr/bin/{name}")
+    command = cgroup.scope_command(
+        "3.network", ["scripts/test.sh", "focus"], cpu_weight=50, memory_max="80%"
+    )
+    assert command == [
+        "systemd-run",
+        "--scope",
+        "--quiet",
+        "--collect",
+        "--slice=system.slice",
+        "--unit=kubernetes-e2e-3.network.scope",
+        "-p",
+        "CPUAccounting=yes",
+        "-p",
+        "MemoryAccounting=yes",
+        "-p",
+        "IOAccounting=yes",
+        "-p",
+        "CPUWeight=50",
+        "-p",
+        "MemoryMax=80%",
+        "--",
+        "choom",
+        "-n",
+        "500",
+        "--",
+        "scripts/test.sh",
+        "focus",
+    ]
+
+
+@pytest.mark.parametrize(
+    "limits",
+    [{"cpu_weight": 20000}, {"memory_high": "6 GB"}, {"memory_max": "1000%"}],
+)
+def test_scope_command_rejects_bad_limits(limits):
+    with pytest.raises(ValueError):
+        cgroup.scope_command("1", ["true"], **limits)
+
+
+def test_probe_makes_a_scope_with_the_same_limits(monkeypatch):
+    run = mock.MagicMock()
+    monkeypatch.setattr(cgroup.subprocess, "run", run)
+    cgroup.probe_scope("3", cpu_weight=50, memory_max="80%")
+    (command,), _ = run.call_args
+    assert "--unit=kubernetes-e2e-3-probe.scope" in command
+    assert "MemoryMax=80%" in command
+    assert command[-1] == "true"
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        subprocess.CalledProcessError(
+            1, "systemd-run", stderr="Failed to start transient scope\n"
+        ),
+        subprocess.TimeoutExpired("systemd-run", 60),
+        FileNotFoundError("systemd-run"),
+    ],
+)
+def test_probe_fails_when_the_scope_cannot_be_made(monkeypatch, error):
+    monkeypatch.setattr(cgroup.subprocess, "run", mock.MagicMock(side_effect=error))
+    with pytest.raises(ValueError, match="^systemd-run failed: "):
+        cgroup.probe_scope("3")
+
+
+def test_accounting_follows_the_scope_until_it_goes(tmp_path):
+    scope = tmp_path / "system.slice" / "kubernetes-e2e-1.scope"
+    scope.mkdir(parents=True)
+
+    def write(usage_usec, memory, rbytes, wbytes, oom_kills=0):
+        (scope / "cpu.stat").write_text(f"usage_usec {usage_usec}\nuser_usec 1\nsystem_usec 1\n")
+        (scope / "memory.current").write_text(f"{memory}\n")
+        (scope / "memory.events").write_text(
+            f"low 0\nhigh 4\nmax 2\noom 1\noom_kill {oom_kills}\n"
+        )
+        (scope / "io.stat").write_text(
+            f"8:0 rbytes={rbytes} wbytes={wbytes} rios=1 wios=1 dbytes=0 dios=0\n"
+            f"259:0 rbytes={rbytes} wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n"
+        )
+
+    now = [100.0]
+    write(1_000_000, 512 * 2**20, 2**20, 2**20)
+    accounting = cgroup.ScopeAccounting("1", interval=3600, root=tmp_path, clock=lambda: now[0])
+    accounting.sample()
+    now[0] += 2
+    write(4_000_000, 2048 * 2**20, 4 * 2**20, 8 * 2**20, oom_kills=1)
+    accounting.sample()
+    # Too soon after the last sample to tell a rate from.
+    now[0] += 0.1
+    write(4_500_000, 256 * 2**20, 5 * 2**20, 9 * 2**20, oom_kills=1)
+    accounting.sample()
+    # The scope is gone by the time the run has exited.
+    for child in scope.iterdir():
+        child.unlink()
+    scope.rmdir()
+    accounting.close()
+
+    summary = accounting.summary()
+    assert summary["scope"] == "kubernetes-e2e-1.scope"
+    assert summary["cpu-seconds"] == "4.5"
+    assert summary["peak-cpu"] == "1.50"
+    assert summary["peak-memory-mib"] == "2048"
+    assert summary["io-read-mib"] == "10"
+    assert summary["io-write-mib"] == "9"
+    assert summary["oom-kills"] == "1"
+
+
+def test_accounting_without_a_scope_reports_nothing(tmp_path):
+    accounting = cgroup.ScopeAccounting("1", interval=0.01, root=tmp_path)
+    time.sleep(0.05)
+    accounting.close()
+    assert accounting.summary() == {}
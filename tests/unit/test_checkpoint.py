@@ -0,0 +1,66 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for run checkpoints."""
+
+import re
+
+import checkpoint
+from ginkgo import SUITE_DESCRIPTION, SpecReport
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = tmp_path / "run-checkpoint.jsonl"
+    progress = checkpoint.Checkpoint(path, {"run": "1", "params": {"focus": "x"}})
+    progress.on_spec(SpecReport("spec a", "passed", 1.0))
+    progress.on_spec(SpecReport("spec b", "failed", 2.0))
+    progress.on_spec(SpecReport("spec c", "interrupted", 3.0))
+    # Simulate the unit going down half way through a write.
+    progress._file.write('{"name": "spec')
+    progress.close()
+
+    header, reports = checkpoint.load(path)
+    assert header["params"] == {"focus": "x"}
+    assert sorted(reports) == ["spec a", "spec b"]
+    assert reports["spec b"].failed
+
+
+def test_append_overrides_earlier_results(tmp_path):
+    path = tmp_path / "run-checkpoint.jsonl"
+    progress = checkpoint.Checkpoint(path, {"run": "1"})
+    progress.on_spec(SpecReport("spec a", "failed", 1.0))
+    progress.close()
+
+    checkpoint.append(path, [SpecReport("spec a", "passed", 1.5)])
+    _, reports = checkpoint.load(path)
+    assert reports["spec a"].state == "passed"
+
+
+def test_skip_args_match_only_finished_specs(monkeypatch):
+    monkeypatch.setattr(checkpoint, "MAX_SKIP_ARG_LENGTH", 40)
+    names = ["[sig-a] spec (one) [Conformance]", "[sig-b] spec two", "[sig-c] three"]
+    args = checkpoint.skip_args(names)
+
+    assert args[::2] == ["-ginkgo.skip"] * (len(args) // 2)
+    assert len(args) > 2
+    patterns = [re.compile(pattern) for pattern in args[1::2]]
+    for name in names:
+        assert any(pattern.search(name) for pattern in patterns)
+    assert not any(pattern.search("[sig-a] spec one") for pattern in patterns)
+
+
+def test_skip_args_do_not_skip_specs_a_finished_name_is_a_prefix_of():
+    args = checkpoint.skip_args(["[sig-apps] Job should run"])
+    pattern = re.compile(args[1])
+    assert pattern.search("[sig-apps] Job should run")
+    assert not pattern.search("[sig-apps] Job should run a job to completion")
+    assert not pattern.search("[sig-x] [sig-apps] Job should run")
+
+
+def test_skip_args_match_the_text_ginkgo_v2_matches_against():
+    name = "[sig-apps] Job should run a job to completion when tasks succeed"
+    pattern = re.compile(checkpoint.skip_args([name])[1])
+    assert pattern.search(f"{SUITE_DESCRIPTION} {name}")
+    assert not pattern.search(f"{SUITE_DESCRIPTION} {name} [Slow]")
+    assert not pattern.search(f"Other suite {name}")
@@ -0,0 +1,73 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for leftover e2e object cleanup."""
+
+import time
+from unittest import mock
+
+import cleanup
+
+NOW = 1714644000
+
+
+def _item(name, age):
+    created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(NOW - age))
+    return {"metadata": {"name": name, "creationTimestamp": created}}
+
+
+def _kubectl(*args, **_kwargs):
+    if args[:2] == ("get", "namespaces"):
+        return "namespace/default\n"
+    return ""
+
+
+def _kubectl_json(*args, **_kwargs):
+    if args == ("get", "namespaces", "-l", "e2e-run"):
+        items = [_item("pods-1234", 7200), _item("pods-5678", 60)]
+    elif args[:3] == ("get", "namespaces", "--field-selector"):
+        items = [_item("kubernetes-e2e-prepull", 7200)]
+    elif args == ("get", "clusterroles"):
+        items = [_item("admin", 7200), _item("e2e-test-role-abc", 7200)]
+    elif args == ("get", "priorityclasses"):
+        items = [_item("e2e-test-priority-def", 60)]
+    else:
+        items = []
+    return {"items": items}
+
+
+@mock.patch("cleanup.time.time", return_value=NOW)
+@mock.patch("cleanup.kubectl_json", side_effect=_kubectl_json)
+def test_find_leftovers(mock_kubectl_json, _):
+    assert cleanup.find_leftovers() == {
+        "namespaces": ["pods-1234", "kubernetes-e2e-prepull"],
+        "clusterroles": ["e2e-test-role-abc"],
+    }
+    # Objects of a run which may still be going on elsewhere are only taken when asked.
+    assert cleanup.find_leftovers(min_age=0) == {
+        "namespaces": ["pods-1234", "pods-5678", "kubernetes-e2e-prepull"],
+        "clusterroles": ["e2e-test-role-abc"],
+        "priorityclasses": ["e2e-test-priority-def"],
+    }
+
+
+@mock.patch("cleanup.time.sleep")
+@mock.patch("cleanup.find_leftovers")
+@mock.patch("cleanup.kubectl", side_effect=_kubectl)
+def test_cleanup_waits_for_namespaces(mock_kubectl, mock_find_leftovers, mock_sleep):
+    mock_find_leftovers.return_value = {
+        "namespaces": ["pods-1234", "svc-5678"],
+        "clusterroles": ["e2e-test-role-abc"],
+    }
+    summary = cleanup.cleanup(concurrency=2, timeout=60)
+
+    deleted = {c.args[1:3] for c in mock_kubectl.call_args_list if c.args[0] == "delete"}
+    assert deleted == {
+        ("namespaces", "pods-1234"),
+        ("namespaces", "svc-5678"),
+        ("clusterroles", "e2e-test-role-abc"),
+    }
+    assert summary["objects"] == "3"
+    assert summary["failed"] == "0"
+    assert summary["remaining"] == "0"
@@ -0,0 +1,78 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for answering queued identical requests."""
+
+import coalesce
+
+
+def test_request_key_covers_params_cluster_and_snap():
+    key = coalesce.request_key({"focus": "sig-network", "parallelism": 4}, b"config", "42")
+    assert key == coalesce.request_key({"parallelism": 4, "focus": "sig-network"}, b"config", "42")
+    assert key != coalesce.request_key({"focus": "sig-network", "parallelism": 8}, b"config", "42")
+    assert key != coalesce.request_key({"focus": "sig-network", "parallelism": 4}, b"other", "42")
+    assert key != coalesce.request_key({"focus": "sig-network", "parallelism": 4}, b"config", "43")
+
+
+def test_requests_queued_behind_an_identical_run_are_answered_by_it(tmp_path):
+    now = [1000.0]
+
+    def log():
+        return coalesce.RequestLog(tmp_path / "requests.json", clock=lambda: now[0])
+
+    assert log().start("10", "a") is None
+    now[0] += 3600
+    log().finish("10", "10")
+    # Queued while 10 ran, and while the request answered by it ended.
+    now[0] += 2
+    assert log().start("11", "a") == "10"
+    log().finish("11", "10")
+    now[0] += 1
+    assert log().start("12", "a") == "10"
+    log().finish("12", "10")
+    # Something else ran in between.
+    now[0] += 1
+    assert log().start("13", "b") is None
+    log().finish("13", "13")
+    now[0] += 1
+    assert log().start("14", "a") is None
+    log().finish("14", "14")
+    # Sent to an idle unit.
+    now[0] += coalesce.QUEUE_GAP + 1
+    assert log().start("15", "a") is None
+
+
+def test_requests_queued_before_the_run_are_not_answered_by_it(tmp_path):
+    log = coalesce.RequestLog(tmp_path / "requests.json", clock=lambda: 1000.0)
+    log.start("20", "a")
+    log.finish("20", "20")
+    # Juju numbers its actions; one numbered before 20 did not queue behind it.
+    assert log.start("19", "a") is None
+    # Nor does a request that comes after one which never finished.
+    assert log.start("21", "a") is None
+
+
+def test_expected_duration_of_identical_runs(tmp_path):
+    log = coalesce.RequestLog(tmp_path / "requests.json", clock=lambda: 1000.0)
+    for action_id, key, run in [
+        ("1", "a", "1"),
+        ("2", "a", "1"),
+        ("3", "b", "3"),
+        ("4", "a", "4"),
+    ]:
+        log.start(action_id, key)
+        log.finish(action_id, run)
+    assert log.runs("a") == ["4", "1"]
+
+    def run(verdict, started=100, ended=None):
+        return {"verdict": verdict, "started_at": started, "ended_at": ended}
+
+    assert (
+        coalesce.expected_duration(
+            [run("passed", ended=700), run("failed", ended=1100), run("passed", ended=400)]
+        )
+        == 600
+    )
+    # Runs gone from the history, cut short or without their markers tell nothing.
+    assert coalesce.expected_duration([None, run("error", ended=200), run("passed")]) is None
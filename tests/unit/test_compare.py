@@ -0,0 +1,104 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for run comparison."""
+
+import io
+import tarfile
+
+import compare
+from ginkgo import SpecReport
+from junit import iter_reports, write_junit
+
+
+def _results(*reports):
+    return compare.load_results(SpecReport(*report) for report in reports)
+
+
+def test_verdict_changes():
+    base = _results(
+        ("[sig-a] fixed", "failed", 1.0),
+        ("[sig-a] broken", "passed", 1.0),
+        ("[sig-b] dropped", "passed", 1.0),
+        ("[sig-b] skipped later", "passed", 1.0),
+    )
+    target = _results(
+        ("[sig-a] fixed", "passed", 1.0),
+        ("[sig-a] broken", "failed", 1.0),
+        ("[sig-b] skipped later", "skipped", 0.0),
+        ("[sig-c] new", "passed", 1.0),
+    )
+    report = compare.compare(base, target)
+    assert report["new-failures"] == ["[sig-a] broken"]
+    assert report["new-passes"] == ["[sig-a] fixed"]
+    assert report["missing"] == ["[sig-b] dropped", "[sig-b] skipped later"]
+    assert report["added"] == ["[sig-c] new"]
+
+
+def test_only_outlying_duration_changes_are_reported():
+    base = _results(*((f"[sig-a] spec {i}", "passed", 10.0 + i % 3) for i in range(20)))
+    # Everything is a little slower, one spec is a lot slower.
+    target = _results(
+        *((f"[sig-a] spec {i}", "passed", (10.0 + i % 3) * 1.1) for i in range(19)),
+        ("[sig-a] spec 19", "passed", 60.0),
+    )
+    report = compare.compare(base, target)
+    assert report["slower"] == ["[sig-a] spec 19: 11.0s -> 60.0s"]
+    assert report["faster"] == []
+    assert report["sigs"]["sig-a"]["significant"]
+
+
+def test_unchanged_sig_is_not_significant():
+    base = _results(*((f"[sig-b] spec {i}", "passed", 5.0 + i) for i in range(5)))
+    target = _results(
+        *((f"[sig-b] spec {i}", "passed", 5.0 + i + (-1) ** i * 0.1) for i in range(5))
+    )
+    assert not compare.compare(base, target)["sigs"]["sig-b"]["significant"]
+
+
+def test_junit_round_trip_through_tarball(tmp_path):
+    reports = [SpecReport("[sig-a] one", "passed", 1.5), SpecReport("[sig-a] two", "failed", 2.0)]
+    write_junit(tmp_path / "junit_01.xml", "suite", reports)
+
+    tarball = tmp_path / "junit.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(tmp_path / "junit_01.xml", arcname="junit_01.xml")
+        readme = b"not a report"
+        info = tarfile.TarInfo("README")
+        info.size = len(readme)
+        tar.addfile(info, io.BytesIO(readme))
+
+    for source in (tmp_path / "junit_01.xml", tmp_path, tarball):
+        assert [(r.name, r.state, r.seconds) for r in iter_reports(source)] == [
+            ("[sig-a] one", "passed", 1.5),
+            ("[sig-a] two", "failed", 2.0),
+        ]
+
+
+def test_per_node_junit_names_compare_with_combined_ones(tmp_path):
+    # As ginkgo v2 names testcases in the JUnit reports of e2e.test.
+    (tmp_path / "junit_01.xml").write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<testsuites><testsuite name="Kubernetes e2e suite" tests="3">\n'
+        '<testcase name="[SynchronizedBeforeSuite]" classname="Kubernetes e2e suite"'
+        ' status="passed" time="1.2"></testcase>\n'
+        '<testcase name="[It] [sig-node] Pods should get a host IP [NodeConformance]'
+        ' [Conformance]" classname="Kubernetes e2e suite" status="passed" time="4.1">'
+        "</testcase>\n"
+        '<testcase name="[It] [sig-network] DNS should provide DNS for services  [Conformance]"'
+        ' classname="Kubernetes e2e suite" status="failed" time="30.5">'
+        '<failure message="timed out" type="failed"></failure></testcase>\n'
+        "</testsuite></testsuites>\n"
+    )
+    base = _results(
+        ("[sig-node] Pods should get a host IP [NodeConformance] [Conformance]", "passed", 4.0),
+        ("[sig-network] DNS should provide DNS for services  [Conformance]", "passed", 9.0),
+    )
+    target = compare.load_results(iter_reports(tmp_path / "junit_01.xml"))
+    report = compare.compare(base, target)
+    assert report["new-failures"] == [
+        "[sig-network] DNS should provide DNS for services  [Conformance]"
+    ]
+    assert report["missing"] == [] and report["added"] == ["[SynchronizedBeforeSuite]"]
+    assert set(report["sigs"]) == {"other", "sig-network", "sig-node"}
@@ -0,0 +1,85 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the ginkgo output parser."""
+
+import pytest
+
+from ginkgo import GinkgoParser, spec_state
+
+OUTPUT = """JUJU_E2E_START=1700000000
+------------------------------
+[sig-node] Pods should get a host IP [NodeConformance] [Conformance]
+test/e2e/common/node/pods.go:204
+  STEP: Creating a kubernetes client @ 01/01/24 00:00:00.000
+• [2.512 seconds]
+------------------------------
+• [FAILED] [30.001 seconds]
+[sig-network] Services [It] should serve a basic endpoint [Conformance]
+test/e2e/network/service.go:787
+
+  [FAILED] timed out waiting for the condition
+------------------------------
+"""
+
+
+def _parse(output):
+    parser, reports, offset = GinkgoParser(), [], 0
+    for line in output.splitlines(keepends=True):
+        length = len(line.encode())
+        reports += parser.feed(line, offset, length)
+        offset += length
+    return reports + parser.close()
+
+
+def test_parses_verbose_and_failure_reports():
+    passed, failed = _parse(OUTPUT)
+    assert passed.name == "[sig-node] Pods should get a host IP [NodeConformance] [Conformance]"
+    assert passed.state == "passed"
+    assert passed.seconds == 2.512
+    assert not passed.failed
+    assert failed.name == "[sig-network] Services should serve a basic endpoint [Conformance]"
+    assert failed.failed
+
+
+def test_offsets_cover_the_spec_output():
+    data = OUTPUT.encode()
+    passed, failed = _parse(OUTPUT)
+    assert data[passed.start : passed.end].decode().startswith("------------------------------")
+    assert "Creating a kubernetes client" in data[passed.start : passed.end].decode()
+    assert "timed out waiting" in data[failed.start : failed.end].decode()
+    assert passed.end == failed.start
+
+
+def test_interleaved_nodes_are_tracked_separately():
+    output = (
+        "[1] ------------------------------\n"
+        "[2] ------------------------------\n"
+        "[1] [sig-apps] Job should run\n"
+        "[2] [sig-apps] Job should fail\n"
+        "[2] • Failure [1.000 seconds]\n"
+        "[1] • [2.000 seconds]\n"
+        "[2] ------------------------------\n"
+        "[1] ------------------------------\n"
+    )
+    failed, passed = _parse(output)
+    assert (failed.node, failed.name, failed.state) == (2, "[sig-apps] Job should fail", "failed")
+    assert (passed.node, passed.name, passed.state) == (1, "[sig-apps] Job should run", "passed")
+
+
+@pytest.mark.parametrize(
+    "mark, label, state",
+    [
+        ("•", "", "passed"),
+        ("•", "[FAILED]", "failed"),
+        ("•", "[PANICKED]", "panicked"),
+        ("•", "[TIMEDOUT]", "timedout"),
+        ("•", "[INTERRUPTED]", "interrupted"),
+        ("S", "[SKIPPED]", "skipped"),
+        ("P", "[PENDING]", "pending"),
+        ("•", "[FLAKEY TEST - TOOK 2 ATTEMPTS TO PASS]", "passed"),
+    ],
+)
+def test_spec_state(mark, label, state):
+    assert spec_state(mark, label) == state
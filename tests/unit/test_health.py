@@ -0,0 +1,126 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for probing the cluster between runs."""
+
+import http.server
+import socket
+import threading
+
+import pytest
+import yaml
+
+import health
+
+
+class FakeAPIServer(http.server.ThreadingHTTPServer):
+    """Answers the probe's requests with fixed statuses and counts connections."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = []
+        self.connections = 0
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Authorization")))
+        status = server.statuses.get(self.path, 200)
+        body = b"ok" if status == 200 else b'{"kind":"Status","message":"etcd is down"}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    servers = []
+
+    def start(statuses=None):
+        server = FakeAPIServer(statuses or {})
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _kubeconfig(tmp_path, server, user=None):
+    path = tmp_path / "config"
+    config = {
+        "apiVersion": "v1",
+        "clusters": [{"name": "juju", "cluster": {"server": server}}],
+        "users": [{"name": "ubuntu", "user": user or {"token": "secret"}}],
+        "contexts": [{"name": "juju", "context": {"cluster": "juju", "user": "ubuntu"}}],
+        "current-context": "juju",
+    }
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+def test_probe_reuses_one_connection(tmp_path, api_server):
+    server = api_server()
+    kubeconfig = _kubeconfig(tmp_path, f"http://127.0.0.1:{server.server_port}/k8s")
+    result = health.probe(kubeconfig)
+    assert result.healthy
+    assert server.connections == 1
+    assert server.requests == [
+        ("/k8s/readyz", "Bearer secret"),
+        ("/k8s/api/v1/namespaces/default", "Bearer secret"),
+    ]
+
+
+def test_probe_tells_refused_credentials_from_an_unready_server(tmp_path, api_server):
+    refusing = api_server({"/api/v1/namespaces/default": 401})
+    result = health.probe(_kubeconfig(tmp_path, f"http://127.0.0.1:{refusing.server_port}"))
+    assert (result.healthy, result.refused, result.reason) == (False, True, "credentials rejected")
+
+    unready = api_server({"/readyz": 500})
+    result = health.probe(_kubeconfig(tmp_path, f"http://127.0.0.1:{unready.server_port}"))
+    assert (result.healthy, result.refused) == (False, False)
+    assert result.reason == "/readyz answered 500 etcd is down"
+
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+    result = health.probe(_kubeconfig(tmp_path, f"http://127.0.0.1:{port}"))
+    assert (result.healthy, result.reason) == (False, "Connection refused")
+
+    plugin = _kubeconfig(tmp_path, "https://10.0.0.1:6443", {"exec": {"command": "aws"}})
+    assert health.probe(plugin) is None
+
+
+def test_failures_back_off_until_the_cluster_is_back(tmp_path):
+    now = [1000.0]
+    path = tmp_path / "health.json"
+    delays = []
+    for _ in range(6):
+        state = health.HealthState(path, clock=lambda: now[0])
+        assert state.due()
+        state.record(health.Probe(False, "timed out"), "Cluster unreachable: timed out")
+        delays.append(state.next - now[0])
+        now[0] = state.next
+    assert delays == [240, 480, 960, 1920, 3600, 3600]
+
+    state = health.HealthState(path, clock=lambda: now[0] - 1)
+    assert not state.due()
+    assert state.status == "Cluster unreachable: timed out"
+    state = health.HealthState(path, clock=lambda: now[0])
+    state.record(health.Probe(True), "Ready to test.")
+    assert (state.failures, health.HealthState(path).due()) == (0, True)
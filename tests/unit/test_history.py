@@ -0,0 +1,125 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the run history."""
+
+from unittest import mock
+
+import pytest
+
+from benchmark import Latency
+from ginkgo import SpecReport
+from history import RunHistory, RunMarkers, parse_time
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = RunHistory(tmp_path / "history.db")
+    yield history
+    history.close()
+
+
+def test_start_and_update(history):
+    history.start("1", {"focus": "x"}, "42")
+    history.update("1", verdict="passed", artifacts={"log": "/home/ubuntu/1.log"})
+    run = history.get("1")
+    assert run["params"] == {"focus": "x"}
+    assert run["snap_revision"] == "42"
+    assert run["verdict"] == "passed"
+    assert run["artifacts"] == {"log": "/home/ubuntu/1.log"}
+    assert history.get("2") is None
+
+
+@mock.patch("history.time.time")
+def test_query_filters_newest_first(mock_time, history):
+    for run_id, verdict in enumerate(["passed", "failed", "passed"]):
+        mock_time.return_value = 1000.0 + run_id
+        history.start(str(run_id), {})
+        history.update(str(run_id), verdict=verdict, server_version=f"v1.3{run_id}.0")
+
+    assert [run["id"] for run in history.query()] == ["2", "1", "0"]
+    assert [run["id"] for run in history.query(verdict="passed")] == ["2", "0"]
+    assert [run["id"] for run in history.query(since="1001")] == ["2", "1"]
+    assert [run["id"] for run in history.query(until="1001")] == ["0"]
+    assert [run["id"] for run in history.query(server_version="v1.31.0")] == ["1"]
+    assert [run["id"] for run in history.query(limit=1)] == ["2"]
+
+
+def test_parse_time():
+    assert parse_time("1700000000") == 1700000000.0
+    assert parse_time("1970-01-02") == 86400.0
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
+
+
+def test_run_markers():
+    markers = RunMarkers()
+    for line in [
+        "JUJU_E2E_START=100\n",
+        "JUJU_E2E_VERSION=v1.31.0\n",
+        "noise\n",
+        "JUJU_E2E_END=200\n",
+    ]:
+        markers.on_line(line, 0)
+    assert markers.fields() == {"server_version": "v1.31.0", "started_at": 100, "ended_at": 200}
+
+
+@mock.patch("history.time.time")
+def test_flakes_follow_fingerprint(mock_time, history):
+    outcomes = [("a", "failed"), ("a", "passed"), ("b", "failed"), ("a", "failed")]
+    for run_id, (fp, state) in enumerate(outcomes):
+        mock_time.return_value = 1000.0 + run_id
+        history.start(str(run_id), {})
+        history.update(str(run_id), fingerprint=fp)
+        history.record_specs(
+            str(run_id), [SpecReport("flaky", state, 1.0), SpecReport("stable", "passed", 1.0)]
+        )
+    # Run 2 failed on another fingerprint, so the pass in run 1 is the only flake.
+    assert history.flakes() == [{"name": "flaky", "runs": 4, "failures": 3, "flakes": 1}]
+    assert history.flakes(since=1002) == []
+
+
+def test_pin_and_touch(history):
+    history.start("1", {})
+    assert history.get("1")["pinned"] == 0
+    assert history.pin("1")
+    assert history.get("1")["pinned"] == 1
+    assert history.pin("1", False)
+    assert history.get("1")["pinned"] == 0
+    assert not history.pin("2")
+
+    history.touch("1")
+    assert history.get("1")["accessed_at"] >= history.get("1")["created_at"]
+
+
+def test_latencies_go_with_their_run(history):
+    history.start("1", {}, action="benchmark")
+    history.record_latencies(
+        "1", [Latency("etcd_request_duration_seconds", "get *core.Pod", 10, 0.001, 0.002, 0.01)]
+    )
+    assert history.latencies("1") == {
+        ("etcd_request_duration_seconds", "get *core.Pod"): {
+            "run_id": "1",
+            "metric": "etcd_request_duration_seconds",
+            "subject": "get *core.Pod",
+            "requests": 10,
+            "p50": 0.001,
+            "p90": 0.002,
+            "p99": 0.01,
+        }
+    }
+    assert history.latencies("2") == {}
+
+
+def test_failed_specs(history):
+    history.start("1", {})
+    history.record_specs(
+        "1",
+        [
+            SpecReport("[sig-b] timed out", "timedout", 60.0),
+            SpecReport("[sig-a] passed", "passed", 1.0),
+            SpecReport("[sig-a] failed", "failed", 2.0),
+        ],
+    )
+    assert history.failed_specs("1") == ["[sig-a] failed", "[sig-b] timed out"]
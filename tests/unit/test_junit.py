@@ -0,0 +1,93 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for merging the JUnit reports of the ginkgo nodes."""
+
+import subprocess
+import sys
+from pathlib import Path
+from xml.etree import ElementTree
+
+import junit
+from junit import CONSOLIDATED, iter_reports, merge_reports
+
+NODE_1 = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="Kubernetes e2e suite" tests="3" failures="1">
+  <properties><property name="node" value="1"/></properties>
+  <testcase name="[sig-b] second" classname="Kubernetes e2e suite" time="2.5">
+    <failure type="Failure" message="timed out">a.go:1 &lt;details&gt;</failure>
+    <system-out>captured</system-out>
+  </testcase>
+  <testcase name="[sig-a] first" classname="Kubernetes e2e suite" time="1"></testcase>
+  <testcase name="[sig-d] skipped" time="0"><skipped message="skipped"/></testcase>
+</testsuite>
+"""
+NODE_2 = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="Kubernetes e2e suite" tests="2">
+    <testcase name="[sig-c] third" classname="Kubernetes e2e suite" time="0.5">
+      <error message="panic"/>
+    </testcase>
+    <testcase name="[sig-a] first" classname="Kubernetes e2e suite" time="1.25"/>
+  </testsuite>
+</testsuites>
+"""
+
+
+def _reports(tmp_path: Path) -> Path:
+    directory = tmp_path / "1-junit"
+    directory.mkdir()
+    (directory / "junit_01.xml").write_text(NODE_1)
+    (directory / "junit_02.xml").write_text(NODE_2)
+    return directory
+
+
+def test_merge_orders_testcases_and_totals_counts(tmp_path):
+    directory = _reports(tmp_path)
+    # A small chunk forces the merge through several sorted runs.
+    path = merge_reports(directory, "kubernetes-e2e 1", chunk=200)
+    assert path == directory / CONSOLIDATED
+
+    root = ElementTree.parse(path).getroot()
+    assert root.tag == "testsuites"
+    (suite,) = root
+    expected = {
+        "name": "kubernetes-e2e 1",
+        "tests": "5",
+        "failures": "1",
+        "errors": "1",
+        "skipped": "1",
+        "time": "5.250",
+    }
+    assert root.attrib == suite.attrib == expected
+    cases = [(case.get("name"), case.get("time")) for case in suite]
+    assert cases == [
+        ("[sig-a] first", "1"),
+        ("[sig-a] first", "1.25"),
+        ("[sig-b] second", "2.5"),
+        ("[sig-c] third", "0.5"),
+        ("[sig-d] skipped", "0"),
+    ]
+    assert suite[2].find("failure").text == "a.go:1 <details>"
+    assert suite[2].find("system-out").text == "captured"
+    assert suite[4].get("classname") == "kubernetes-e2e 1"
+
+
+def test_directories_are_read_from_the_consolidated_report(tmp_path):
+    directory = _reports(tmp_path)
+    before = sorted((r.name, r.state) for r in iter_reports(directory))
+    merge_reports(directory, "suite")
+    assert sorted((r.name, r.state) for r in iter_reports(directory)) == before
+    (directory / "junit_02.xml").unlink()
+    assert len(list(iter_reports(directory))) == 5
+    # Merging again leaves the consolidated report out.
+    merge_reports(directory, "suite")
+    assert len(list(iter_reports(directory))) == 3
+
+
+def test_script_merges_a_directory(tmp_path):
+    directory = _reports(tmp_path)
+    subprocess.run([sys.executable, junit.__file__, str(directory), "suite"], check=True)
+    assert len(list(iter_reports(directory / CONSOLIDATED))) == 5
+    assert merge_reports(tmp_path / "missing", "suite") is None
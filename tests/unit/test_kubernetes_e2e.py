@@ -6,12 +6,46 @@
 # pylint: disable=duplicate-code,missing-function-docstring
 """Unit tests."""
 
+import functools
+import json
+import math
+import subprocess
+import sys
+import tarfile
+import time
+from pathlib import Path
 from unittest import mock
 
 import ops
 import ops.testing
 import pytest
+import yaml
+from fake_s3 import FakeS3
+
+import benchmark
+import cgroup
+import charm
+import coalesce
+import health
+import retention
+import runner
+import scratch
+import upload
 from charm import KubernetesE2ECharm
+from history import RunHistory
+from junit import CONSOLIDATED, iter_testcases
+from metrics import Metrics
+from scratch import ScratchSpace
+from snaps import LocalSnaps
+from store import ArtifactStore
+
+FAKE_SUITE = Path(__file__).parent / "fake_suite.py"
+PARAMS = {"focus": "", "skip": "", "parallelism": 1, "timeout": 60, "extra": ""}
+SPECS = {
+    "[sig-node] Pods should be submitted and removed": "passed",
+    "[sig-node] Pods should get a host IP": "failed",
+    "[sig-network] DNS should provide DNS for services": "failed",
+}
 
 
 @pytest.fixture
@@ -25,8 +59,533 @@ def harness(tmp_path):
     harness.cleanup()
 
 
+@pytest.fixture
+def charm_root(tmp_path, monkeypatch):
+    """Move everything the charm writes under a temporary directory."""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setattr(runner, "ACTION_HOME", home)
+    monkeypatch.setattr(charm, "ACTION_HOME", home)
+    monkeypatch.setattr(charm, "KUBE_CONFIG_PATH", str(home / ".kube" / "config"))
+    monkeypatch.setattr(charm, "TRACE_DIR", tmp_path / "traces")
+    monkeypatch.setattr(charm, "RunHistory", functools.partial(RunHistory, tmp_path / "h.db"))
+    monkeypatch.setattr(charm, "Metrics", functools.partial(Metrics, tmp_path / "metrics.json"))
+    monkeypatch.setattr(
+        charm, "ArtifactStore", functools.partial(ArtifactStore, tmp_path / "store")
+    )
+    monkeypatch.setattr(
+        coalesce, "RequestLog", functools.partial(coalesce.RequestLog, tmp_path / "requests.json")
+    )
+    monkeypatch.setattr(
+        health, "HealthState", functools.partial(health.HealthState, tmp_path / "health.json")
+    )
+    monkeypatch.setattr(
+        charm, "LocalSnaps", functools.partial(LocalSnaps, tmp_path / "snaps.json")
+    )
+    monkeypatch.setattr(
+        charm, "ScratchSpace", functools.partial(ScratchSpace, root=tmp_path / "scratch")
+    )
+    monkeypatch.setattr(
+        upload, "Uploader", functools.partial(upload.Uploader, state_dir=tmp_path / "uploads")
+    )
+    monkeypatch.setattr(KubernetesE2ECharm, "CA_CERT_PATH", tmp_path / "srv" / "ca.crt")
+    monkeypatch.setattr(KubernetesE2ECharm, "_snap_revision", lambda self, name: "42")
+    # Unit tests run the suite unconfined, whatever the host supports.
+    monkeypatch.setattr(cgroup, "available", lambda: False)
+
+    # The fake suite stands in for scripts/test.sh and the e2e suite behind it.
+    suite_runner = KubernetesE2ECharm._suite_runner
+
+    def fake_suite_runner(self, run_id, args, result_key=""):
+        e2e = suite_runner(self, run_id, args, result_key)
+        e2e.command = [sys.executable, str(FAKE_SUITE), *args]
+        return e2e
+
+    monkeypatch.setattr(KubernetesE2ECharm, "_suite_runner", fake_suite_runner)
+    kube_config = Path(charm.KUBE_CONFIG_PATH)
+    kube_config.parent.mkdir()
+    kube_config.write_text("apiVersion: v1\nkind: Config\n")
+    return home
+
+
+@pytest.fixture
+def action_harness(charm_root):
+    """A harness for running the charm's actions against the fake suite."""
+    harness = ops.testing.Harness(KubernetesE2ECharm)
+    harness.begin()
+    yield harness
+    harness.cleanup()
+
+
 @mock.patch("charm.KubernetesE2ECharm._setup_environment")
 def test_kube_control_relation_joined(mock_setup_environment, harness):
     mock_event = mock.MagicMock()
     harness.charm._kube_control_relation_joined(mock_event)
     mock_setup_environment.assert_called_once_with(mock_event)
+
+
+@mock.patch("charm.LocalSnaps")
+@mock.patch("charm.snap.ensure")
+def test_install_snaps_from_attached_resources(mock_ensure, mock_local_snaps, harness):
+    harness.add_resource("kubernetes-test", b"squashfs")
+    harness.add_resource("kubectl", b"")
+    harness.charm._install_snaps("1.31/stable")
+    install = mock_local_snaps.return_value.install
+    install.assert_called_once()
+    name, _, classic = install.call_args.args
+    assert (name, classic) == ("kubernetes-test", True)
+    # An empty resource is the placeholder for one nobody attached.
+    mock_ensure.assert_called_once_with("kubectl", "latest", channel="1.31/stable", classic=False)
+
+
+@mock.patch("charm.KUBE_CONFIG_PATH", __file__)
+@mock.patch("charm.health.probe")
+def test_update_status_reflects_the_probe(mock_probe, harness, tmp_path):
+    state = health.HealthState(tmp_path / "health.json")
+    with mock.patch("charm.health.HealthState", return_value=state):
+        harness.charm.unit.status = ops.BlockedStatus("Missing kube-control relation")
+        harness.charm._on_update_status(mock.MagicMock())
+        mock_probe.assert_not_called()
+
+        harness.charm.unit.status = ops.ActiveStatus("Ready to test.")
+        mock_probe.return_value = health.Probe(False, "timed out")
+        harness.charm._on_update_status(mock.MagicMock())
+        assert harness.charm.unit.status == ops.WaitingStatus("Cluster unreachable: timed out")
+        assert state.failures == 1
+
+
+@pytest.mark.parametrize(
+    "coalesce, verdict, answered",
+    [(True, "passed", "1"), (False, "passed", ""), (True, "failed", "")],
+)
+@mock.patch("charm.RunHistory")
+@mock.patch("charm.KubernetesE2ECharm._snap_revision", return_value="42")
+def test_only_passed_runs_answer_requests_asking_for_it(
+    _, mock_history, coalesce, verdict, answered, harness
+):
+    mock_history.return_value.get.return_value = {"verdict": verdict, "artifacts": {}}
+    mock_history.return_value.failed_specs.return_value = []
+    requests = mock.MagicMock()
+    requests.start.return_value = "1"
+    event = mock.MagicMock()
+    event.id = "2"
+    event.params = {"focus": "x", "coalesce": coalesce}
+    assert harness.charm._queued_behind(event, requests) == answered
+    assert (event.set_results.call_count > 0) == bool(answered)
+
+
+def test_upload_fails_without_credentials(harness):
+    harness.update_config({"s3-endpoint": "http://minio:9000", "s3-bucket": "artifacts"})
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        harness.run_action("upload", {"run": "1"})
+    assert e.value.message == "s3-credentials is not set"
+
+
+@mock.patch("charm.prepull.list_images")
+def test_test_action_fails_when_images_cannot_be_pre_pulled(
+    mock_list_images, action_harness, charm_root
+):
+    mock_list_images.side_effect = subprocess.CalledProcessError(1, ["kubernetes-test.e2e"])
+    action_harness.charm.unit.status = ops.ActiveStatus("Ready to test.")
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "prepull": True})
+    assert e.value.message.startswith("Failed to pre-pull e2e images:")
+    # The suite does not run against a cluster which could not pull its images.
+    assert not list(charm_root.glob("*.log"))
+    assert action_harness.charm.unit.status == ops.ActiveStatus("Ready to test.")
+
+
+@mock.patch("charm.cleanup.cleanup")
+def test_cleanup_action_fails_while_leftovers_remain(mock_cleanup, action_harness):
+    mock_cleanup.return_value = {
+        "namespaces": "2",
+        "objects": "3",
+        "failed": "0",
+        "remaining": "1",
+        "seconds": "900.0",
+    }
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("cleanup", {"cleanup-min-age": 0})
+    assert e.value.message == "Leftover e2e objects remain. See logs for info."
+    assert mock_cleanup.call_args.kwargs["min_age"] == 0
+    assert e.value.output.results["cleanup"]["remaining"] == "1"
+
+    mock_cleanup.side_effect = subprocess.TimeoutExpired(["kubectl"], 60)
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("cleanup")
+    assert e.value.output.logs[0].startswith("Failed to clean up leftover e2e objects:")
+
+
+def test_test_action_stops_early_with_a_partial_verdict(action_harness, monkeypatch):
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "max-failures": 1})
+    assert e.value.message == "Stopped early: 1 specs failed (max-failures=1)."
+    assert e.value.output.results["partial"] == "true"
+    assert e.value.output.results["failed-specs"].startswith(
+        "[sig-node] Pods should get a host IP"
+    )
+    (run,) = yaml.safe_load(action_harness.run_action("runs").results["runs"])
+    assert run["verdict"] == "partial"
+
+
+def test_resuming_a_run_skips_its_finished_specs(action_harness, charm_root, monkeypatch):
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "resume": "7"})
+    assert e.value.message == "No checkpoint found for run 7."
+
+    finished = dict(list(SPECS.items())[:2])
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(finished))
+    with pytest.raises(ops.testing.ActionFailed):
+        action_harness.run_action("test", PARAMS)
+    (run,) = yaml.safe_load(action_harness.run_action("runs").results["runs"])
+
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "resume": run["id"]})
+    assert e.value.message == "One or more tests failed."
+    assert e.value.output.results["combined-verdict"] == "failed"
+    resumed = next(log for log in charm_root.glob("*.log") if log.stem != run["id"])
+    # Ginkgo matches the skip patterns against the suite description and the spec.
+    assert "[sig-network] DNS should provide DNS for services" in resumed.read_text()
+    assert not any(name in resumed.read_text() for name in finished)
+
+
+def test_runs_action_lists_pins_and_rejects_bad_input(action_harness):
+    action_harness.run_action("test", PARAMS)
+    output = action_harness.run_action("runs", {"verdict": "passed"})
+    (run,) = yaml.safe_load(output.results["runs"])
+    assert run["verdict"] == "passed"
+    assert not run["pinned"]
+
+    output = action_harness.run_action("runs", {"pin": run["id"]})
+    assert yaml.safe_load(output.results["runs"])[0]["pinned"]
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("runs", {"pin": "nope"})
+    assert e.value.message == "Unknown run nope."
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("runs", {"since": "yesterday"})
+    assert e.value.message.startswith("Invalid filter:")
+
+
+def test_compare_action_diffs_the_last_two_runs(action_harness, monkeypatch):
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed):
+        action_harness.run_action("test", PARAMS)
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("compare")
+    assert e.value.message == "Need two finished runs with JUnit results to compare."
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("compare", {"base": "1", "target": "nope"})
+    assert e.value.message == "No JUnit results found for run nope."
+
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(dict.fromkeys(SPECS, "passed")))
+    action_harness.run_action("test", PARAMS)
+    output = action_harness.run_action("compare")
+    assert output.results["new-passes"] == "2"
+    assert output.results["new-failures"] == "0"
+
+
+def test_quarantine_sets_flaky_specs_apart(action_harness, charm_root, monkeypatch):
+    flaky = "[sig-node] Pods should get a host IP"
+    for state in ("failed", "passed"):
+        monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps({**SPECS, flaky: state}))
+        try:
+            action_harness.run_action("test", PARAMS)
+        except ops.testing.ActionFailed:
+            pass
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "quarantine": "skip"})
+    assert flaky in yaml.safe_load(e.value.output.results["quarantine"]["specs"])
+    assert e.value.output.results["failed-specs"] == (
+        "[sig-network] DNS should provide DNS for services"
+    )
+
+    # The retried pass focuses on the quarantined spec alone, which fails again.
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "quarantine": "retry"})
+    assert e.value.output.results["quarantine"]["verdict"] == "failed"
+    assert e.value.output.results["quarantine"]["failed-specs"] == flaky
+
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action(
+            "test", {**PARAMS, "quarantine": "retry", "matrix": "{conformance: {}}"}
+        )
+    assert e.value.message == "A matrix can neither be resumed nor retry quarantined specs."
+
+
+def test_failed_run_is_reported_in_the_metrics_textfile(action_harness, tmp_path, monkeypatch):
+    action_harness.update_config({"metrics-textfile-directory": str(tmp_path / "textfiles")})
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed):
+        action_harness.run_action("test", PARAMS)
+    action_harness.charm.framework.on.commit.emit()
+
+    textfile = (tmp_path / "textfiles" / "kubernetes_e2e.prom").read_text()
+    assert "kubernetes_e2e_run_success 0.0" in textfile
+    assert 'kubernetes_e2e_run_specs{state="failed"} 2' in textfile
+    assert 'kubernetes_e2e_run_sig_seconds{sig="sig-node"} 2.0' in textfile
+
+
+def test_failed_run_still_writes_its_trace(action_harness, monkeypatch):
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "quarantine": "skip"})
+    results = e.value.output.results
+    assert {"quarantine", "run", "test"} <= set(results["timings"])
+    trace = json.loads(Path(results["trace"]).read_text())
+    spans = {event["name"]: event for event in trace["traceEvents"]}
+    assert spans["test"]["dur"] >= spans["run"]["dur"] > 0
+
+
+def test_gc_action_evicts_old_runs_beyond_the_newest(action_harness, charm_root, monkeypatch):
+    action_harness.run_action("test", PARAMS)
+    action_harness.run_action("test", PARAMS)
+    old, new = sorted(log.stem for log in charm_root.glob("*.log"))
+    (charm_root / "notes.log").write_text("not a run's")
+    action_harness.update_config({"artifacts-max-age": 1, "artifacts-keep": 1})
+    # Both runs are two days old by now.
+    monkeypatch.setattr(
+        retention, "plan", functools.partial(retention.plan, now=time.time() + 2 * 24 * 3600)
+    )
+
+    output = action_harness.run_action("gc", {"dry-run": True})
+    assert output.results["evicted"] == old
+    assert (charm_root / f"{old}.log").exists()
+    output = action_harness.run_action("gc")
+    assert output.results["evicted"] == old
+    assert not list(charm_root.glob(f"{old}[.-]*"))
+    assert (charm_root / f"{new}.log").exists()
+    assert (charm_root / "notes.log").exists()
+
+    with mock.patch("charm.retention.collect", side_effect=PermissionError("denied")):
+        with pytest.raises(ops.testing.ActionFailed) as e:
+            action_harness.run_action("gc")
+    assert e.value.message == "Failed to collect artifacts: denied"
+
+
+def test_restore_action_rebuilds_stored_artifacts(action_harness, charm_root):
+    action_harness.update_config({"artifact-store": True})
+    output = action_harness.run_action("test", PARAMS)
+    assert output.results["store"]["files"] != "0"
+    (log,) = charm_root.glob("*.log")
+    content = log.read_text()
+    for path in charm_root.glob(f"{log.stem}[.-]*"):
+        if path.is_file():
+            path.unlink()
+
+    output = action_harness.run_action("restore", {"run": log.stem})
+    tarball = charm_root / f"{log.stem}.log.tar.gz"
+    assert str(tarball) in output.results["files"].split("\n")
+    with tarfile.open(tarball) as tar:
+        assert tar.extractfile(log.name).read().decode() == content
+
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("restore", {"run": "nope"})
+    assert e.value.message == "Run nope is not in the store"
+
+
+def test_logs_action_returns_the_output_of_specs(action_harness, monkeypatch):
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("logs")
+    assert e.value.message == "No finished runs."
+
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed):
+        action_harness.run_action("test", PARAMS)
+    output = action_harness.run_action("logs")
+    assert output.results["matched"] == "2"
+    assert "• [FAILED] [1.000 seconds]" in output.results["output"]
+    output = action_harness.run_action("logs", {"spec": "DNS"})
+    assert output.results["specs"] == "[sig-network] DNS should provide DNS for services [failed]"
+
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("logs", {"spec": "[sig-node"})
+    assert e.value.message.startswith("Invalid spec pattern:")
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("logs", {"run": "nope"})
+    assert e.value.message == "No log index found for run nope."
+
+
+def test_upload_action_sends_a_finished_run(action_harness, charm_root):
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("upload", {"run": "1"})
+    assert e.value.message == "s3-endpoint is not set."
+
+    action_harness.run_action("test", PARAMS)
+    (run_id,) = (log.stem for log in charm_root.glob("*.log"))
+    s3 = FakeS3().start()
+    try:
+        secret = action_harness.add_user_secret({"access-key": "minio", "secret-key": "minio123"})
+        action_harness.grant_secret(secret, action_harness.charm.app)
+        action_harness.update_config(
+            {"s3-endpoint": s3.config.endpoint, "s3-bucket": "artifacts", "s3-credentials": secret}
+        )
+        output = action_harness.run_action("upload", {"run": run_id})
+        assert output.results["failed"] == ""
+        assert f"kubernetes-e2e/kubernetes-e2e-0/{run_id}/{run_id}.log.tar.gz" in s3.objects
+
+        with pytest.raises(ops.testing.ActionFailed) as e:
+            action_harness.run_action("upload", {"run": "nope"})
+        assert e.value.message == "No artifacts of run nope on disk; restore them first."
+    finally:
+        s3.stop()
+
+
+def test_matrix_runs_each_suite_and_reports_the_failing_ones(action_harness, monkeypatch):
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "matrix": "[conformance]"})
+    assert e.value.message.startswith("Invalid matrix:")
+
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    action_harness.update_config({"matrix-max-nodes": 2})
+    matrix = "{node: {focus: Pods should be submitted}, network: {focus: DNS}}"
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "matrix": matrix})
+    assert e.value.message == "Suites did not pass: network."
+    suites = e.value.output.results["suites"]
+    assert suites["node"]["verdict"] == "passed"
+    assert suites["network"]["failed-specs"] == "[sig-network] DNS should provide DNS for services"
+
+
+def test_sampling_without_a_reachable_cluster_keeps_the_runner_columns(action_harness):
+    output = action_harness.run_action("test", {**PARAMS, "sample-interval": 0.05})
+    resources = output.results["resources"]
+    assert int(resources["samples"]) >= 1
+    assert "runner-load" in resources
+    assert "node-cpu" not in resources
+    assert Path(resources["file"]).read_text().startswith("time\trunner-cpu")
+
+
+@pytest.mark.parametrize("mounted", [True, False])
+def test_scratch_space_stages_the_run_or_falls_back_to_disk(
+    action_harness, charm_root, monkeypatch, mounted
+):
+    # The scratch space stays a plain directory, or fails to mount as without privileges.
+    mount = mock.MagicMock()
+    if not mounted:
+        mount.side_effect = subprocess.CalledProcessError(
+            32, ["mount"], stderr=b"mount: permission denied"
+        )
+    monkeypatch.setattr(scratch, "mount_tmpfs", mount)
+    monkeypatch.setattr(scratch, "unmount", mock.MagicMock())
+    monkeypatch.setattr(scratch, "available_memory", lambda proc: 2**40)
+    action_harness.update_config({"scratch-size": 64})
+
+    output = action_harness.run_action("test", PARAMS)
+    trace = json.loads(Path(output.results["trace"]).read_text())
+    (run,) = (event["args"] for event in trace["traceEvents"] if event["name"] == "run")
+    assert run["scratch"] == ("tmpfs" if mounted else "disk")
+    if not mounted:
+        assert run["scratch-fallback"] == "mount failed: mount: permission denied"
+    # The whole log reached the disk, once, and the reports were moved next to it.
+    (log,) = charm_root.glob("*.log")
+    assert log.read_text().count("JUJU_E2E_START=") == 1
+    assert log.read_text().endswith("JUJU_E2E_END=1714644001\n")
+    assert (charm_root / f"{log.stem}-junit" / "junit_01.xml").exists()
+
+
+def test_nodes_are_timed_from_the_ginkgo_report(action_harness, charm_root, monkeypatch):
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(dict.fromkeys(SPECS, "passed")))
+    output = action_harness.run_action("test", {**PARAMS, "parallelism": 2})
+    nodes = output.results["nodes"]
+    assert nodes["count"] == "2"
+    assert nodes["node-1"].startswith("specs 2 ")
+    assert sorted(path.name for path in Path(nodes["logs"]).iterdir()) == [
+        "node-1.log",
+        "node-2.log",
+    ]
+
+    # Without a report to read, the run goes on without node timing.
+    monkeypatch.setattr(charm, "ginkgo_report", lambda run_id: charm_root / "missing.json")
+    output = action_harness.run_action("test", {**PARAMS, "parallelism": 2})
+    assert output.results["result"] == "Tests ran successfully."
+    assert "nodes" not in output.results
+
+
+def test_node_reports_are_merged_unless_the_merge_fails(action_harness, charm_root, monkeypatch):
+    monkeypatch.setenv("E2E_FAKE_SPECS", json.dumps(SPECS))
+    with pytest.raises(ops.testing.ActionFailed):
+        action_harness.run_action("test", {**PARAMS, "parallelism": 2})
+    (junit,) = charm_root.glob("*-junit")
+    merged = list(iter_testcases((junit / CONSOLIDATED).open("rb")))
+    assert sorted(spec.name for spec in merged) == sorted(f"[It] {name}" for name in SPECS)
+
+    suite_runner = KubernetesE2ECharm._suite_runner
+
+    def failing_merge(self, *args):
+        e2e = suite_runner(self, *args)
+        e2e.env["E2E_JUNIT_MERGE"] = "false"
+        return e2e
+
+    monkeypatch.setattr(KubernetesE2ECharm, "_suite_runner", failing_merge)
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("test", {**PARAMS, "parallelism": 2})
+    assert e.value.message == "One or more tests failed."
+    assert sum((path / CONSOLIDATED).exists() for path in charm_root.glob("*-junit")) == 1
+    # The reports of the nodes still make up the run's results.
+    output = action_harness.run_action("compare")
+    report = yaml.safe_load(output.results["report"])
+    assert report["new-failures"] == report["missing"] == report["added"] == []
+
+
+def test_isolation_falls_back_to_running_the_suite_unconfined(action_harness, monkeypatch):
+    monkeypatch.setattr(cgroup, "available", lambda: True)
+    action_harness.update_config({"runner-isolation": True, "runner-memory-max": "lots"})
+    output = action_harness.run_action("test", PARAMS)
+    assert output.results["result"] == "Tests ran successfully."
+    assert output.results["unconfined"] == "MemoryMax 'lots' is not a size, percentage or infinity"
+    assert f"Running the suite unconfined: {output.results['unconfined']}" in output.logs
+
+    # systemd-run is there but cannot make the scope.
+    probe = mock.MagicMock(side_effect=ValueError("systemd-run failed: Access denied"))
+    monkeypatch.setattr(cgroup, "probe_scope", probe)
+    action_harness.update_config({"runner-memory-max": "90%"})
+    output = action_harness.run_action("test", PARAMS)
+    assert output.results["unconfined"] == "systemd-run failed: Access denied"
+    assert "usage" not in output.results
+
+
+def _api_snapshot(requests, seconds):
+    """Every GET of pods so far, each taking about the given seconds."""
+    buckets = {seconds: requests / 2, seconds * 10: requests, math.inf: requests}
+    key = ("apiserver_request_duration_seconds", ("GET", "pods"))
+    return {key: benchmark.Histogram(buckets, requests)}
+
+
+def test_benchmark_measures_the_workload_against_its_baseline(action_harness, monkeypatch):
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("benchmark", {**PARAMS, "baseline": "7"})
+    assert e.value.message == "No latencies recorded for run 7."
+
+    monkeypatch.setattr(benchmark, "snapshot", mock.MagicMock(side_effect=OSError("no kubectl")))
+    with pytest.raises(ops.testing.ActionFailed) as e:
+        action_harness.run_action("benchmark", PARAMS)
+    assert e.value.message == "Failed to read the cluster's metrics: no kubectl"
+
+    snapshots = [_api_snapshot(0, 0.1), _api_snapshot(100, 0.1)]
+    snapshots += [_api_snapshot(100, 0.2), _api_snapshot(200, 0.2)]
+    monkeypatch.setattr(benchmark, "snapshot", mock.MagicMock(side_effect=snapshots))
+    output = action_harness.run_action("benchmark", PARAMS)
+    assert output.results["latency"]["api-server"].startswith("GET pods: p50 100.0ms")
+    assert "baseline" not in output.results
+    # The run just measured is the baseline of the next.
+    output = action_harness.run_action("benchmark", PARAMS)
+    assert output.results["baseline"]
+    assert output.results["latency"]["api-server"].endswith("p99 +100% on the baseline")
+
+
+def test_identical_requests_are_told_how_long_they_take_and_coalesced(action_harness):
+    output = action_harness.run_action("test", PARAMS)
+    assert "expected-duration" not in output.results
+
+    # The fake suite takes a second per spec, between its start and end markers.
+    output = action_harness.run_action("test", PARAMS)
+    assert output.results["expected-duration"] == "1s"
+    assert "answered-by" not in output.results
+
+    output = action_harness.run_action("test", {**PARAMS, "coalesce": True})
+    assert output.results["expected-duration"] == "1s"
+    assert output.results["answered-by"] == "2"
@@ -0,0 +1,93 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the run log index."""
+
+import pytest
+
+import logindex
+import runner
+from ginkgo import GinkgoParser
+from store import ArtifactStore
+
+LOG = "".join(
+    [
+        "JUJU_E2E_START=1700000000\n",
+        "------------------------------\n",
+        "• [0.500 seconds]\n",
+        "[sig-apps] Deployment should roll out\n",
+        "  STEP: creating a deployment\n",
+        "------------------------------\n",
+        "• [FAILED] [2.000 seconds]\n",
+        "[sig-network] Services should serve endpoints\n",
+        "  STEP: creating a service\n",
+        "  \x1b[31m[FAILED] Timed out waiting for endpoints\x1b[0m\n",
+        "  In [It] at: service.go:100\n",
+        "------------------------------\n",
+        "S [SKIPPED] [0.000 seconds]\n",
+        "[sig-storage] Volumes should mount\n",
+        "------------------------------\n",
+    ]
+)
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "ACTION_HOME", tmp_path)
+    (tmp_path / "1.log").write_text(LOG)
+    # Feed the log the way E2ERunner does.
+    parser, index = GinkgoParser(), logindex.LogIndex(logindex.index_path("1"))
+    offset = 0
+    for line in LOG.splitlines(keepends=True):
+        index.on_line(line, offset)
+        for report in parser.feed(line, offset, len(line.encode())):
+            index.on_spec(report)
+        offset += len(line.encode())
+    for report in parser.close():
+        index.on_spec(report)
+    index.close()
+    return tmp_path
+
+
+def test_index_locates_specs_and_failures(home):
+    log = logindex.RunLog("1")
+    assert [spec.state for spec in log.find()] == ["passed", "failed", "skipped"]
+    failed = log.find(failed=True)
+    assert [spec.name for spec in failed] == ["[sig-network] Services should serve endpoints"]
+
+    output = log.output(failed[0])
+    assert output.startswith("------------------------------\n• [FAILED]")
+    assert output.endswith("service.go:100\n")
+    assert "\x1b" not in output
+    # Output over the limit starts at the failure message.
+    assert log.output(failed[0], limit=40) == "  [FAILED] Timed out waiting for en"
+
+
+def test_select_by_exact_name_or_pattern(home):
+    log = logindex.RunLog("1")
+    assert len(log.find("[sig-apps] Deployment should roll out")) == 1
+    assert [spec.state for spec in log.find(r"sig-(apps|storage)")] == [
+        "passed",
+        "skipped",
+    ]
+
+
+def test_lookup_falls_back_to_the_store(home, tmp_path):
+    store = ArtifactStore(tmp_path / "store")
+    store.put("1", {"1.log": home / "1.log", "1-index.tsv": home / "1-index.tsv"})
+    (home / "1.log").unlink()
+    (home / "1-index.tsv").unlink()
+
+    log = logindex.RunLog("1", store)
+    spec = log.find("Volumes")[0]
+    assert log.output(spec).startswith("------------------------------\nS [SKIPPED]")
+    with pytest.raises(FileNotFoundError):
+        logindex.RunLog("1").find()
+
+
+def test_mismatched_index_is_detected(home):
+    (home / "1.log").write_text("x" * len(LOG))
+    log = logindex.RunLog("1")
+    with pytest.raises(ValueError):
+        log.output(log.find()[0])
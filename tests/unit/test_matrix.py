@@ -0,0 +1,114 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for running suites as a matrix."""
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import matrix
+
+DEFAULTS = {
+    "focus": "\\[Conformance\\]",
+    "skip": "\\[Serial\\]",
+    "parallelism": "25",
+    "timeout": "30000",
+    "extra": "",
+}
+
+
+def test_parse_fills_in_the_action_params():
+    suites = matrix.parse(
+        "{conformance: {}, network: {focus: sig-network, parallelism: 4, extra: -a -b}}",
+        DEFAULTS,
+    )
+    assert [suite.name for suite in suites] == ["conformance", "network"]
+    assert suites[0].args() == ["\\[Conformance\\]", "\\[Serial\\]", "25", "30000"]
+    assert suites[1].args() == ["sig-network", "\\[Serial\\]", "4", "30000", "-a", "-b"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "[a, b]",
+        "{}",
+        "{Bad_Name: {}}",
+        "{a: {parallelism: 0}}",
+        "{a: {parallelism: many}}",
+        "{a: {resume: 3}}",
+        "{a: [focus]}",
+        "{a: {",
+    ],
+)
+def test_parse_rejects_invalid_matrices(text):
+    with pytest.raises(ValueError):
+        matrix.parse(text, DEFAULTS)
+
+
+def test_schedule_keeps_within_the_node_budget():
+    suites = matrix.parse(
+        "{a: {parallelism: 4}, b: {parallelism: 4}, c: {parallelism: 6}, d: {parallelism: 2}}",
+        DEFAULTS,
+    )
+    lock = threading.Lock()
+    busy, peak, started = [0], [0], []
+
+    def run(suite):
+        with lock:
+            started.append(suite.name)
+            busy[0] += suite.parallelism
+            peak[0] = max(peak[0], busy[0])
+        time.sleep(0.05)
+        with lock:
+            busy[0] -= suite.parallelism
+        return suite.name.upper()
+
+    assert matrix.schedule(suites, 10, run) == {"a": "A", "b": "B", "c": "C", "d": "D"}
+    assert peak[0] <= 10
+    # d fits next to a and b, while c waits for room.
+    assert started == ["a", "b", "d", "c"]
+
+
+def test_schedule_runs_oversized_suites_alone():
+    suites = matrix.parse("{a: {parallelism: 30}, b: {parallelism: 1}}", DEFAULTS)
+    running, overlaps = set(), []
+
+    def run(suite):
+        overlaps.append(set(running))
+        running.add(suite.name)
+        time.sleep(0.02)
+        running.discard(suite.name)
+
+    matrix.schedule(suites, 8, run)
+    assert overlaps == [set(), set()]
+
+
+def _node(ready="True", unschedulable=False, taints=()):
+    return {
+        "spec": {"unschedulable": unschedulable, "taints": list(taints)},
+        "status": {"conditions": [{"type": "Ready", "status": ready}]},
+    }
+
+
+def test_schedulable_nodes_leave_out_cordoned_tainted_and_unready_nodes():
+    nodes = [
+        _node(),
+        _node(taints=[{"key": "dedicated", "effect": "PreferNoSchedule"}]),
+        _node(unschedulable=True),
+        _node(taints=[{"key": "node-role.kubernetes.io/control-plane", "effect": "NoSchedule"}]),
+        _node(ready="Unknown"),
+    ]
+    assert matrix.schedulable_nodes(nodes) == 2
+
+
+@pytest.mark.parametrize(
+    "max_nodes, cluster_nodes, expected",
+    [(0, 3, 3), (0, 100, 8), (0, 0, 1), (12, 3, 12)],
+)
+def test_capacity_defaults_to_the_cpus_and_nodes_available(max_nodes, cluster_nodes, expected):
+    with mock.patch("os.cpu_count", return_value=8):
+        assert matrix.capacity(max_nodes, cluster_nodes) == expected
@@ -0,0 +1,55 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the Prometheus textfile metrics."""
+
+from ginkgo import SpecReport
+from metrics import TEXTFILE_NAME, Metrics
+
+
+def test_metrics_survive_between_hooks(tmp_path):
+    state = tmp_path / "metrics.json"
+    metrics = Metrics(state)
+    metrics.set("snap_install_duration_seconds", 12.5)
+    metrics.observe_hook("config-changed", 2.0)
+    metrics.save()
+
+    metrics = Metrics(state)
+    metrics.observe_hook("config-changed", 1.0)
+    text = metrics.render()
+    assert "kubernetes_e2e_snap_install_duration_seconds 12.5" in text
+    assert 'kubernetes_e2e_hook_duration_seconds_sum{hook="config-changed"} 3.0' in text
+    assert 'kubernetes_e2e_hook_duration_seconds_count{hook="config-changed"} 2' in text
+
+
+def test_record_run_replaces_previous_run(tmp_path):
+    metrics = Metrics(tmp_path / "metrics.json")
+    metrics.record_run(60.0, "failed", [SpecReport("[sig-old] a", "passed", 1.0)])
+    metrics.record_run(
+        90.0,
+        "passed",
+        [
+            SpecReport("[sig-apps] a", "passed", 10.0),
+            SpecReport("[sig-apps] b", "timedout", 5.0),
+            SpecReport("[sig-node] c", "skipped", 0.0),
+        ],
+    )
+    text = metrics.render()
+    assert "kubernetes_e2e_run_duration_seconds 90.0" in text
+    assert "kubernetes_e2e_run_success 1.0" in text
+    assert 'kubernetes_e2e_run_specs{state="failed"} 1' in text
+    assert 'kubernetes_e2e_run_specs{state="skipped"} 1' in text
+    assert 'kubernetes_e2e_run_sig_seconds{sig="sig-apps"} 15.0' in text
+    assert "sig-old" not in text
+
+
+def test_write_textfile_is_atomic(tmp_path):
+    metrics = Metrics(tmp_path / "metrics.json")
+    metrics.set("run_success", 1.0)
+    metrics.write_textfile(tmp_path / "textfile")
+    assert [p.name for p in (tmp_path / "textfile").iterdir()] == [TEXTFILE_NAME]
+    assert (
+        "# TYPE kubernetes_e2e_run_success gauge"
+        in (tmp_path / "textfile" / TEXTFILE_NAME).read_text()
+    )
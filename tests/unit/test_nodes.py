@@ -0,0 +1,147 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for splitting a run by ginkgo node."""
+
+import json
+
+import pytest
+
+from nodes import NodeDemux, parse_go_time
+
+SUITE_START = "2024-05-02T10:00:00.123456789Z"
+
+
+def _time(seconds: float) -> str:
+    """A time the way Go marshals it, some seconds after the suite started."""
+    whole, fraction = divmod(seconds, 1)
+    fraction = f"{fraction:.9f}"[1:].rstrip("0").rstrip(".")
+    return f"2024-05-02T12:{int(whole) // 60:02d}:{int(whole) % 60:02d}{fraction}+02:00"
+
+
+def _spec(text, process, start, seconds, state="passed", node_type="It", **fields):
+    """A spec report shaped as in ginkgo v2's JSON report."""
+    return {
+        "ContainerHierarchyTexts": ["[sig-node] Pods"] if text else None,
+        "LeafNodeType": node_type,
+        "LeafNodeText": text,
+        "State": state,
+        "StartTime": _time(start),
+        "EndTime": _time(start + seconds),
+        "RunTime": int(seconds * 1e9),
+        "ParallelProcess": process,
+        "NumAttempts": 1,
+        **fields,
+    }
+
+
+def _report(tmp_path, specs, wall):
+    path = tmp_path / "1-junit" / "ginkgo-report.json"
+    path.parent.mkdir()
+    suite = {
+        "SuitePath": "/snap/kubernetes-test/current",
+        "SuiteDescription": "Kubernetes e2e suite",
+        "SuiteSucceeded": True,
+        "StartTime": SUITE_START,
+        "EndTime": _time(wall),
+        "RunTime": int(wall * 1e9),
+        "SpecReports": specs,
+    }
+    path.write_text(json.dumps([suite]))
+    return path
+
+
+def test_parse_go_time():
+    assert parse_go_time("2024-05-02T10:00:00Z") == 1714644000.0
+    assert parse_go_time("2024-05-02T12:00:01.5+02:00") == 1714644001.5
+    assert parse_go_time(SUITE_START) == pytest.approx(1714644000.123456)
+
+
+def test_specs_go_to_the_log_of_their_node(tmp_path):
+    report = _report(
+        tmp_path,
+        [
+            _spec("", 1, 0.2, 1.3, node_type="SynchronizedBeforeSuite"),
+            _spec(
+                "should be submitted and removed",
+                2,
+                1.5,
+                3.0,
+                CapturedGinkgoWriterOutput="STEP: Creating a client\nSTEP: submitting the pod",
+            ),
+            _spec(
+                "should get a host IP",
+                1,
+                1.5,
+                2.0,
+                state="failed",
+                Failure={"Message": "Timed out after 2s."},
+            ),
+            _spec("should be skipped [Serial]", 0, 0, 0, state="skipped"),
+        ],
+        wall=5,
+    )
+    demux = NodeDemux(tmp_path / "1-nodes", report)
+    demux.close()
+
+    assert sorted(p.name for p in demux.path.iterdir()) == ["node-1.log", "node-2.log"]
+    assert (demux.path / "node-1.log").read_text() == (
+        "+0.077 [SynchronizedBeforeSuite] [passed] [1.300 seconds]\n"
+        "+1.377 [sig-node] Pods should get a host IP [failed] [2.000 seconds]\n"
+        "[FAILED] Timed out after 2s.\n"
+    )
+    assert (demux.path / "node-2.log").read_text() == (
+        "+1.377 [sig-node] Pods should be submitted and removed [passed] [3.000 seconds]\n"
+        "STEP: Creating a client\nSTEP: submitting the pod\n"
+    )
+    assert demux.nodes[1].specs == 1
+    assert demux.nodes[1].busy == pytest.approx(3.3)
+    assert demux.nodes[2].last_spec_end == pytest.approx(4.377, abs=1e-3)
+
+
+def test_timing_and_stragglers(tmp_path):
+    # Each node runs its specs back to back; node 3 ends with a long one.
+    report = _report(
+        tmp_path,
+        [
+            _spec("a", 1, 0, 100),
+            _spec("b", 2, 0, 150),
+            _spec("c", 2, 150, 140),
+            _spec("d", 1, 100, 200),
+            _spec("e", 3, 0, 90),
+            _spec("slow", 3, 90, 600, state="failed"),
+        ],
+        wall=700,
+    )
+    demux = NodeDemux(tmp_path / "1-nodes", report)
+    demux.close()
+
+    assert demux.wall == pytest.approx(700, abs=0.2)
+    assert demux.nodes[1].describe(700) == "specs 2 busy 300.0s idle 400.0s finished 299.9s"
+    assert [timing.node for timing in demux.stragglers()] == [3]
+    summary = demux.summary()
+    assert summary["count"] == "3"
+    assert summary["utilisation"] == f"{1280 / (3 * demux.wall):.2f}"
+    assert summary["stragglers"] == (
+        "node 3 finished 390s after the median node; longest spec: [sig-node] Pods slow [600s]"
+    )
+
+
+def test_no_stragglers_when_nodes_finish_together(tmp_path):
+    report = _report(tmp_path, [_spec("spec", node, 10, 10) for node in (1, 2, 3)], wall=30)
+    demux = NodeDemux(tmp_path / "1-nodes", report)
+    demux.close()
+    assert not demux.stragglers()
+    assert "stragglers" not in demux.summary()
+
+
+@pytest.mark.parametrize("content", [None, "not json", '[{"SpecReports": []}]'])
+def test_no_timing_without_a_usable_report(tmp_path, content):
+    report = tmp_path / "ginkgo-report.json"
+    if content is not None:
+        report.write_text(content)
+    demux = NodeDemux(tmp_path / "1-nodes", report)
+    demux.close()
+    assert demux.summary() == {}
+    assert not demux.path.exists()
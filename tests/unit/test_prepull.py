@@ -0,0 +1,123 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the image pre-puller."""
+
+import subprocess
+from unittest import mock
+
+import pytest
+
+import prepull
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("850ms", 0.85), ("2.5s", 2.5), ("1m2s", 62.0), ("1h0m1s", 3601.0)],
+)
+def test_parse_go_duration(value, seconds):
+    assert prepull.parse_go_duration(value) == pytest.approx(seconds)
+
+
+def test_daemonset_manifest_one_container_per_image():
+    manifest = prepull.daemonset_manifest(["a:1", "b:2"])
+    containers = manifest["spec"]["template"]["spec"]["containers"]
+    assert [c["image"] for c in containers] == ["a:1", "b:2"]
+    assert [c["name"] for c in containers] == ["image-0", "image-1"]
+    selector = manifest["spec"]["selector"]["matchLabels"]
+    assert selector != prepull.daemonset_manifest(["c:3"], 1)["spec"]["selector"]["matchLabels"]
+
+
+@mock.patch("prepull.kubectl_json")
+def test_pulled_everywhere(mock_kubectl_json):
+    pods = {
+        "items": [
+            {
+                "status": {
+                    "containerStatuses": [
+                        {"name": "image-0", "imageID": "sha256:a"},
+                        {"name": "image-1", "state": {"waiting": {"reason": "ErrImagePull"}}},
+                    ]
+                }
+            },
+            {
+                "status": {
+                    "containerStatuses": [
+                        {"name": "image-0", "state": {"waiting": {"reason": "CrashLoopBackOff"}}},
+                        {"name": "image-1", "imageID": "sha256:b"},
+                    ]
+                }
+            },
+        ]
+    }
+    mock_kubectl_json.side_effect = [{"status": {"desiredNumberScheduled": 2}}, pods]
+    puller = prepull.ImagePrePuller()
+    assert puller._pulled_everywhere(["a:1", "b:2"], 1) == {"a:1"}
+    assert mock_kubectl_json.call_args.args[-1] == (
+        "app.kubernetes.io/name=e2e-prepull,app.kubernetes.io/instance=batch-1"
+    )
+
+
+@mock.patch("prepull.kubectl_json")
+def test_pulled_everywhere_ignores_terminating_pods(mock_kubectl_json):
+    pulled = {"containerStatuses": [{"name": "image-0", "imageID": "sha256:a"}]}
+    pods = {
+        "items": [
+            {"metadata": {}, "status": pulled},
+            # A pod of the last batch which has image-0 under another image.
+            {"metadata": {"deletionTimestamp": "2024-06-01T00:00:00Z"}, "status": pulled},
+        ]
+    }
+    mock_kubectl_json.side_effect = [{"status": {"desiredNumberScheduled": 2}}, pods]
+    assert prepull.ImagePrePuller()._pulled_everywhere(["a:1"], 2) == set()
+
+
+@mock.patch("prepull.kubectl_json")
+def test_record_pull_durations(mock_kubectl_json):
+    mock_kubectl_json.return_value = {
+        "items": [
+            {
+                "message": 'Successfully pulled image "a:1" in 1.5s (1.5s including waiting)',
+                "source": {"host": "node-0"},
+            },
+            {
+                "message": 'Container image "a:1" already present on machine',
+                "source": {"host": "node-1"},
+            },
+        ]
+    }
+    puller = prepull.ImagePrePuller()
+    puller.images = {"a:1": {"pulled": True, "seconds": 2.0, "nodes": {}}}
+    puller._record_pull_durations()
+    assert puller.images["a:1"]["nodes"] == {"node-0": 1.5, "node-1": 0.0}
+
+
+@pytest.mark.parametrize(
+    "error",
+    [subprocess.TimeoutExpired(["kubectl"], 150), subprocess.CalledProcessError(1, ["kubectl"])],
+)
+@mock.patch("prepull.kubectl")
+@mock.patch("prepull.kubectl_json", return_value={"items": []})
+@mock.patch("prepull.kubectl_apply")
+def test_batch_goes_on_when_its_pods_are_slow_to_go(_, __, mock_kubectl, error, monkeypatch):
+    monkeypatch.setattr(prepull, "POLL_INTERVAL", 0)
+    puller = prepull.ImagePrePuller()
+    monkeypatch.setattr(puller, "_pulled_everywhere", lambda images, batch: set(images))
+    mock_kubectl.side_effect = [error, ""]
+    assert puller.run(["a:1"])["a:1"]["pulled"]
+    delete = mock_kubectl.call_args_list[0]
+    assert "--timeout=120s" in delete.args
+    assert delete.kwargs["timeout"] > prepull.DELETE_TIMEOUT
+
+
+def test_summarize(tmp_path):
+    images = {
+        "a:1": {"pulled": True, "seconds": 2.0, "nodes": {"node-0": 1.5}},
+        "b:2": {"pulled": False, "seconds": None, "nodes": {}},
+    }
+    summary = prepull.summarize(images, tmp_path / "report.json")
+    assert summary["images"] == "2"
+    assert summary["failed"] == "1"
+    assert summary["slowest"].startswith("a:1=1.5s")
+    assert (tmp_path / "report.json").exists()
@@ -0,0 +1,55 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for flaky spec quarantine."""
+
+import re
+
+import checkpoint
+import quarantine
+from ginkgo import SUITE_DESCRIPTION
+
+
+def test_select_applies_threshold_and_minimum_runs():
+    flakes = [
+        {"name": "often", "runs": 4, "failures": 2, "flakes": 2},
+        {"name": "rarely", "runs": 20, "failures": 1, "flakes": 1},
+        {"name": "once", "runs": 1, "failures": 1, "flakes": 1},
+    ]
+    assert quarantine.select(flakes, 0.1) == {
+        "often": "flaked 2 times in 4 runs (50%), 2 failures"
+    }
+
+
+def test_focus_pattern_matches_only_quarantined_specs():
+    pattern = re.compile(quarantine.focus_pattern(["[sig-a] one (x)", "[sig-b] two"]))
+    assert pattern.search("[sig-a] one (x)")
+    assert pattern.search("[sig-b] two")
+    assert not pattern.search("[sig-a] one x")
+
+
+def test_quarantine_patterns_leave_specs_they_are_a_prefix_of_alone():
+    quarantined = ["[sig-apps] Job should run"]
+    longer = "[sig-apps] Job should run a job to completion"
+    focus = re.compile(quarantine.focus_pattern(quarantined))
+    assert focus.search(quarantined[0]) and not focus.search(longer)
+    skip = re.compile(checkpoint.skip_args(quarantined)[1])
+    assert skip.search(quarantined[0]) and not skip.search(longer)
+
+
+def test_quarantine_patterns_match_the_text_ginkgo_v2_matches_against():
+    quarantined = ["[sig-network] Services should serve endpoints on same port [Conformance]"]
+    text = f"{SUITE_DESCRIPTION} {quarantined[0]}"
+    other = f"{SUITE_DESCRIPTION} [sig-network] Services should serve a basic endpoint"
+    focus = re.compile(quarantine.focus_pattern(quarantined))
+    assert focus.search(text) and not focus.search(other)
+    skip = re.compile(checkpoint.skip_args(quarantined)[1])
+    assert skip.search(text) and not skip.search(other)
+
+
+def test_retry_args_replace_flake_attempts():
+    assert quarantine.retry_args(["-ginkgo.v", "-ginkgo.flake-attempts=1"]) == [
+        "-ginkgo.v",
+        "-ginkgo.flake-attempts=3",
+    ]
@@ -0,0 +1,121 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for artifact retention."""
+
+import os
+
+from retention import RunArtifacts, collect, format_size, plan, scan
+from store import ArtifactStore
+
+DAY = 24 * 3600
+
+
+def _run(home, run_id, size, mtime):
+    log = home / f"{run_id}.log"
+    log.write_bytes(b"x" * size)
+    junit = home / f"{run_id}-junit"
+    junit.mkdir()
+    (junit / "junit_01.xml").write_bytes(b"y" * size)
+    for path in (log, junit):
+        os.utime(path, (mtime, mtime))
+
+
+def test_scan_groups_artifacts_by_run(tmp_path):
+    _run(tmp_path, "1", 10, 1000)
+    _run(tmp_path, "2", 20, 2000)
+    (tmp_path / "2-quarantine.log").write_bytes(b"z" * 5)
+    (tmp_path / "notes.log").write_text("not a run")
+    (tmp_path / ".kube").mkdir()
+    runs = [
+        {"id": "1", "created_at": 1000.0},
+        {"id": "2", "created_at": 1500.0, "pinned": 1, "accessed_at": 3000},
+    ]
+
+    found = scan(tmp_path, runs)
+    assert [(a.run_id, a.size) for a in found] == [("1", 20), ("2", 45)]
+    assert (found[0].created, found[0].last_used, found[0].pinned) == (1000, 1000, False)
+    assert (found[1].created, found[1].last_used, found[1].pinned) == (1500, 3000, True)
+    assert len(found[1].paths) == 3
+
+
+def _artifacts(run_id, size, used, pinned=False):
+    return RunArtifacts(run_id, size=size, created=used, last_used=used, pinned=pinned)
+
+
+def test_plan_evicts_least_recently_used_over_budget():
+    runs = [_artifacts(str(i), 100, used) for i, used in enumerate([10, 30, 20, 40, 50])]
+    evicted = plan(runs, budget=250, max_age=0, keep=2, now=100)
+    assert [a.run_id for a in evicted] == ["0", "2", "1"]
+
+
+def test_plan_keeps_newest_and_pinned_runs():
+    runs = [
+        _artifacts("old-pinned", 100, 10, pinned=True),
+        _artifacts("old", 100, 20),
+        _artifacts("new", 100, 30),
+    ]
+    assert [a.run_id for a in plan(runs, budget=1, max_age=0, keep=1, now=100)] == ["old"]
+
+
+def test_plan_evicts_expired_runs_within_budget():
+    runs = [_artifacts("1", 1, 0), _artifacts("2", 1, 50 * DAY), _artifacts("3", 1, 60 * DAY)]
+    evicted = plan(runs, budget=0, max_age=30 * DAY, keep=1, now=70 * DAY)
+    assert [a.run_id for a in evicted] == ["1"]
+
+
+def test_scan_leaves_runs_missing_from_the_history_alone(tmp_path):
+    _run(tmp_path, "2024", 10, 1000)
+    (tmp_path / "1-junit.tar.gz").write_bytes(b"a user's tarball")
+    _run(tmp_path, "7", 10, 2000)
+    assert [a.run_id for a in scan(tmp_path, [{"id": "7", "created_at": 2000.0}])] == ["7"]
+
+
+def test_collect(tmp_path):
+    runs = []
+    for run_id, mtime in (("1", 1000), ("2", 2000), ("3", 3000)):
+        _run(tmp_path, run_id, 100, mtime)
+        runs.append({"id": run_id, "created_at": mtime})
+    (tmp_path / "2024.log").write_bytes(b"x" * 1000)
+
+    dry = collect(tmp_path, runs, budget=300, max_age=0, keep=1, dry_run=True)
+    assert dry == {
+        "evicted": ["1", "2"],
+        "moved-to-store": [],
+        "reclaimed": 400,
+        "remaining": 200,
+        "kept": 1,
+    }
+    assert (tmp_path / "1.log").exists()
+
+    assert collect(tmp_path, runs, budget=300, max_age=0, keep=1) == dry
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2024.log", "3-junit", "3.log"]
+
+
+def test_format_size():
+    assert format_size(512) == "512 B"
+    assert format_size(1536) == "1.5 KiB"
+    assert format_size(3 * 2**30) == "3.0 GiB"
+
+
+def test_collect_with_store(tmp_path):
+    home, store = tmp_path / "home", ArtifactStore(tmp_path / "store")
+    home.mkdir()
+    runs = []
+    for run_id, mtime in (("1", 1000), ("2", 2000), ("3", 3000)):
+        _run(home, run_id, 100, mtime)
+        store.put(run_id, {f"{run_id}.log": home / f"{run_id}.log"})
+        runs.append({"id": run_id, "created_at": mtime})
+
+    result = collect(home, runs, budget=0, max_age=0, keep=1, store=store)
+    assert result["evicted"] == []
+    assert result["moved-to-store"] == ["1", "2"]
+    assert result["reclaimed"] == 400
+    assert sorted(p.name for p in home.iterdir()) == ["3-junit", "3.log"]
+    assert store.runs() == ["1", "2", "3"]
+
+    # The three logs are identical, so evicting two runs frees no chunks.
+    result = collect(home, runs, budget=1, max_age=0, keep=1, store=store)
+    assert result["evicted"] == ["1", "2"]
+    assert store.runs() == ["3"]
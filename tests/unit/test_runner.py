@@ -0,0 +1,82 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the e2e runner."""
+
+import signal
+import sys
+import textwrap
+
+import pytest
+
+from runner import E2ERunner, FailureTracker, RunObserver
+
+# Emulates ginkgo: report failing specs until interrupted, then summarise.
+FAKE_SUITE = textwrap.dedent(
+    """
+    import signal, sys, time
+
+    def interrupted(*_):
+        print("Interrupted by User", flush=True)
+        sys.exit(1)
+
+    signal.signal(signal.SIGINT, interrupted)
+    for i in range(100):
+        print("------------------------------")
+        print("• [FAILED] [0.010 seconds]")
+        print(f"[sig-test] spec {i}", flush=True)
+        time.sleep(0.05)
+    print("------------------------------", flush=True)
+    """
+)
+
+
+def test_runner_stops_after_max_failures():
+    runner = E2ERunner([sys.executable, "-c", FAKE_SUITE])
+    failures = FailureTracker(3, stop=runner.stop)
+    runner.observers.append(failures)
+
+    assert runner.run() == 1
+    assert runner.stop_reason == "3 specs failed (max-failures=3)"
+    assert failures.failures[:3] == ["[sig-test] spec 0", "[sig-test] spec 1", "[sig-test] spec 2"]
+    assert len(failures.failures) < 100
+
+
+def test_runner_without_threshold_runs_to_completion():
+    runner = E2ERunner([sys.executable, "-c", FAKE_SUITE.replace("range(100)", "range(5)")])
+    failures = FailureTracker(stop=runner.stop)
+    runner.observers.append(failures)
+
+    assert runner.run() == 0
+    assert runner.stop_reason is None
+    assert len(failures.failures) == 5
+
+
+class _Broken(RunObserver):
+    def on_line(self, line, offset):
+        raise ValueError("broken")
+
+
+def test_runner_drops_an_observer_which_raises():
+    runner = E2ERunner([sys.executable, "-c", FAKE_SUITE.replace("range(100)", "range(5)")])
+    failures = FailureTracker(stop=runner.stop)
+    runner.observers += [_Broken(), failures]
+
+    assert runner.run() == 0
+    assert runner.observers == [failures]
+    assert len(failures.failures) == 5
+
+
+def test_runner_kills_the_suite_when_reading_its_output_fails(monkeypatch):
+    # Far more output than a pipe holds, which the suite cannot write unread.
+    suite = "import sys\nfor _ in range(100000): print('x' * 100)\n"
+    runner = E2ERunner([sys.executable, "-c", suite])
+
+    def feed(line, offset, length):
+        raise RuntimeError("parser bug")
+
+    monkeypatch.setattr(runner.parser, "feed", feed)
+    with pytest.raises(RuntimeError):
+        runner.run()
+    assert runner._process.returncode == -signal.SIGKILL
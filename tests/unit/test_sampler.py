@@ -0,0 +1,169 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the resource sampler."""
+
+import json
+import subprocess
+import time
+
+import pytest
+
+import sampler
+from ginkgo import SpecReport
+
+NODES = {
+    "items": [
+        {
+            "metadata": {"name": "a"},
+            "status": {
+                "allocatable": {"cpu": "4", "memory": "8Gi"},
+                "conditions": [{"type": "Ready", "status": "True"}],
+            },
+        },
+        {
+            "metadata": {"name": "b"},
+            "status": {
+                "allocatable": {"cpu": "2", "memory": "4Gi"},
+                "conditions": [
+                    {"type": "Ready", "status": "True"},
+                    {"type": "MemoryPressure", "status": "True"},
+                ],
+            },
+        },
+    ]
+}
+NODE_METRICS = {
+    "items": [
+        {"metadata": {"name": "a"}, "usage": {"cpu": "1000m", "memory": "2Gi"}},
+        {"metadata": {"name": "b"}, "usage": {"cpu": "1500000000n", "memory": "1Gi"}},
+    ]
+}
+
+
+def _metrics(fast, slow, watches=0):
+    """API server metrics with fast requests under 0.1s and slow ones under 1s."""
+    return "\n".join(
+        [
+            "# TYPE apiserver_request_duration_seconds histogram",
+            f'apiserver_request_duration_seconds_bucket{{verb="GET",le="0.1"}} {fast}',
+            f'apiserver_request_duration_seconds_bucket{{verb="GET",le="1"}} {fast + slow}',
+            f'apiserver_request_duration_seconds_bucket{{verb="GET",le="+Inf"}} {fast + slow}',
+            f'apiserver_request_duration_seconds_sum{{verb="GET"}} {fast * 0.05 + slow * 0.5}',
+            f'apiserver_request_duration_seconds_bucket{{verb="WATCH",le="+Inf"}} {watches}',
+            f'apiserver_request_duration_seconds_sum{{verb="WATCH"}} {watches * 60}',
+            "apiserver_current_inflight_requests 3",
+        ]
+    )
+
+
+def test_parse_quantity():
+    assert sampler.parse_quantity("250m") == 0.25
+    assert sampler.parse_quantity("1500000000n") == 1.5
+    assert sampler.parse_quantity("8Gi") == 8 * 2**30
+    assert sampler.parse_quantity("2") == 2
+    with pytest.raises(ValueError):
+        sampler.parse_quantity("12Qi")
+
+
+def test_node_usage_and_pressure():
+    cpu, memory = sampler.node_usage(NODE_METRICS, sampler.allocatable_of(NODES))
+    assert cpu == 0.75
+    assert memory == 0.25
+    assert sampler.pressured(NODES) == 1
+
+
+def test_latency_between_histograms():
+    before = sampler.parse_histogram(_metrics(100, 0).splitlines())
+    after = sampler.parse_histogram(_metrics(190, 10, watches=5).splitlines())
+    requests, mean, p99 = sampler.latency(before, after)
+    assert requests == 100
+    assert mean == pytest.approx((90 * 0.05 + 10 * 0.5) / 100)
+    assert p99 == 1.0
+    assert sampler.latency(after, after) == (0.0, 0.0, 0.0)
+
+
+def test_sampler_writes_rows_and_attributes_slow_specs(tmp_path):
+    proc = tmp_path / "proc"
+    (proc / "pressure").mkdir(parents=True)
+    (proc / "meminfo").write_text("MemTotal: 1000 kB\nMemAvailable: 250 kB\n")
+    (proc / "pressure" / "cpu").write_text("some avg10=12.50 avg60=1.00 avg300=0.00 total=1\n")
+    served = iter(range(0, 10**6, 50))
+
+    def kubectl(*args, timeout=None):
+        if args[-1] == "/metrics":
+            return _metrics(next(served), 5)
+        if "metrics.k8s.io" in args[-1]:
+            return json.dumps(NODE_METRICS)
+        return json.dumps(NODES)
+
+    ticks = iter(range(0, 10**6, 100))
+
+    def stat():
+        busy = next(ticks)
+        (proc / "stat").write_text(f"cpu {busy} 0 0 {busy} 0 0 0 0 0 0\n")
+
+    stat()
+    path = tmp_path / "1-resources.tsv"
+    with sampler.ResourceSampler(path, 0.02, run=kubectl, proc=proc) as sampling:
+        sampling.on_spec(SpecReport("fast spec", "passed", 0.01))
+        for _ in range(5):
+            stat()
+            time.sleep(0.02)
+        sampling.on_spec(SpecReport("slow spec", "passed", 60))
+
+    header, *rows = [line.split("\t") for line in path.read_text().splitlines()]
+    assert header == list(sampler.COLUMNS)
+    assert len(rows) >= 3
+    assert rows[-1][header.index("node-cpu")] == "0.75"
+    assert rows[-1][header.index("runner-memory")] == "0.75"
+    assert rows[-1][header.index("runner-cpu-pressure")] == "0.125"
+
+    summary = sampling.summary()
+    assert summary["samples"] == str(len(rows))
+    assert summary["node-cpu"] == "max 0.75 mean 0.75"
+    assert summary["runner-cpu"].startswith("max 0.5 ")
+    assert summary["slow-specs"].splitlines()[0].startswith("slow spec [60s]: runner-cpu 0.5")
+
+
+def test_sampler_falls_back_to_node_conditions(tmp_path):
+    def kubectl(*args, timeout=None):
+        if "metrics.k8s.io" in args[-1]:
+            raise subprocess.CalledProcessError(
+                1,
+                "kubectl",
+                stderr="Error from server (NotFound): the server could not find the "
+                "requested resource\n",
+            )
+        if args[-1] == "/metrics":
+            raise subprocess.CalledProcessError(
+                1, "kubectl", stderr='Error from server (Forbidden): forbidden: User "e2e"\n'
+            )
+        return json.dumps(NODES)
+
+    sampling = sampler.ResourceSampler(tmp_path / "r.tsv", 1, run=kubectl, proc=tmp_path)
+    assert "node-cpu" not in sampling.sample()
+    assert sampling.sample()["nodes-pressured"] == 1
+    assert "api-p99-ms" not in sampling.sample()
+
+
+def test_sampler_keeps_trying_after_other_kubectl_failures(tmp_path):
+    served = iter(range(0, 10**6, 50))
+    failing = [True]
+
+    def kubectl(*args, timeout=None):
+        if failing[0] and args[:2] == ("get", "--raw"):
+            raise subprocess.CalledProcessError(
+                1, "kubectl", stderr="Unable to connect to the server: i/o timeout\n"
+            )
+        if args[-1] == "/metrics":
+            return _metrics(next(served), 5)
+        return json.dumps(NODE_METRICS if "metrics.k8s.io" in args[-1] else NODES)
+
+    sampling = sampler.ResourceSampler(tmp_path / "r.tsv", 1, run=kubectl, proc=tmp_path)
+    row = sampling.sample()
+    assert "node-cpu" not in row and "nodes-pressured" not in row
+    failing[0] = False
+    assert sampling.sample()["node-cpu"] == 0.75
+    assert "api-p99-ms" in sampling.sample()
@@ -0,0 +1,101 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for staging run output in a tmpfs."""
+
+import os
+import subprocess
+import time
+
+import pytest
+
+import scratch
+
+# scripts/test.sh appends the rest of the log this way once the suite is over.
+PERSIST = (
+    'flock "$2" sh -c \'tail -c +$(($(stat -c %s "$2") + 1)) "$1" >> "$2"\' persist "$1" "$2"'
+)
+
+
+@pytest.fixture
+def proc(tmp_path):
+    path = tmp_path / "proc"
+    path.mkdir()
+    (path / "meminfo").write_text("MemTotal: 8388608 kB\nMemAvailable: 4194304 kB\n")
+    return path
+
+
+@pytest.fixture
+def mounts(monkeypatch):
+    mounted, punched = [], []
+
+    def unmount(path):
+        # Whatever is left in the tmpfs goes with it.
+        mounted.remove(path)
+        for child in path.iterdir():
+            child.unlink()
+
+    monkeypatch.setattr(scratch, "mount_tmpfs", lambda path, size: mounted.append(path))
+    monkeypatch.setattr(scratch, "unmount", unmount)
+    monkeypatch.setattr(scratch, "punch_hole", lambda path, length: punched.append(length))
+    return mounted, punched
+
+
+def _space(tmp_path, proc, size_mib=1):
+    home = tmp_path / "home"
+    home.mkdir()
+    return scratch.ScratchSpace("1", size_mib, home, root=tmp_path / "scratch", proc=proc)
+
+
+def test_log_moves_to_disk_in_chunks(tmp_path, proc, mounts):
+    mounted, punched = mounts
+    with _space(tmp_path, proc) as space:
+        assert space.tmpfs and mounted == [space.path]
+        assert space.env() == {"E2E_SCRATCH": str(tmp_path / "scratch" / "1")}
+        log, disk = space.path / "1.log", space.home / "1.log"
+        data = os.urandom(3 * space.chunk)
+        offset = 0
+        with log.open("ab") as out:
+            for line in range(0, len(data), 4096):
+                out.write(data[line : line + 4096])
+                out.flush()
+                space.on_line("x" * 4096, offset)
+                offset += 4096
+        for _ in range(100):
+            if punched and disk.stat().st_size >= 2 * space.chunk:
+                break
+            time.sleep(0.01)
+        assert 2 * space.chunk <= disk.stat().st_size
+
+        with log.open("ab") as out:
+            out.write(b"JUJU_E2E_END=200\n")
+        subprocess.run(["bash", "-c", PERSIST, "persist", log, disk], check=True)
+        (space.path / "1-junit").mkdir()
+        (space.path / "1-junit" / "junit_01.xml").write_text("<testsuite/>")
+        space.close()
+        assert disk.read_bytes() == data + b"JUJU_E2E_END=200\n"
+        assert (space.home / "1-junit" / "junit_01.xml").read_text() == "<testsuite/>"
+    assert not mounted
+    assert not (tmp_path / "scratch" / "1").exists()
+
+
+def test_short_memory_falls_back_to_disk(tmp_path, proc, mounts):
+    with _space(tmp_path, proc, size_mib=3072) as space:
+        assert not space.tmpfs
+        assert space.env() == {"E2E_SCRATCH": str(space.home)}
+        assert "4096 MiB of memory available" in space.fallback
+    assert mounts == ([], [])
+
+
+def test_failed_mount_falls_back_to_disk(tmp_path, proc, monkeypatch):
+    def mount(path, size):
+        raise subprocess.CalledProcessError(32, "mount", stderr=b"permission denied")
+
+    monkeypatch.setattr(scratch, "mount_tmpfs", mount)
+    with _space(tmp_path, proc) as space:
+        assert not space.tmpfs
+        assert space.fallback == "mount failed: permission denied"
+        space.on_line("line\n", 10**9)
+        space.close()
+    assert not (tmp_path / "scratch" / "1").exists()
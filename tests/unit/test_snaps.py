@@ -0,0 +1,82 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for installing snaps from charm resources."""
+
+import hashlib
+from types import SimpleNamespace
+
+import snaps
+
+
+class FakeSnapd:
+    """Installs local snaps with a new revision each time, as snapd does."""
+
+    def __init__(self):
+        self.installed = {}
+        self.calls = []
+
+    def install_local(self, filename, classic=False, dangerous=False):
+        self.calls.append((filename, classic, dangerous))
+        revision = f"x{len(self.calls)}"
+        self.installed["kubernetes-test"] = revision
+        return SimpleNamespace(revision=revision)
+
+    def cache(self):
+        return {
+            name: SimpleNamespace(revision=revision, present=True)
+            for name, revision in self.installed.items()
+        }
+
+
+def test_same_resource_is_installed_once(tmp_path, monkeypatch):
+    snapd = FakeSnapd()
+    monkeypatch.setattr(snaps.snap, "install_local", snapd.install_local)
+    monkeypatch.setattr(snaps.snap, "SnapCache", snapd.cache)
+    resource = tmp_path / "kubernetes-test.snap"
+    resource.write_bytes(b"squashfs" * 1000)
+    state = tmp_path / "state" / "snaps.json"
+
+    assert snaps.LocalSnaps(state).install("kubernetes-test", resource, classic=True)
+    assert snapd.calls == [(str(resource), True, True)]
+    # Later hooks find the same file installed and leave it be.
+    assert not snaps.LocalSnaps(state).install("kubernetes-test", resource)
+    assert len(snapd.calls) == 1
+    entry = snaps.LocalSnaps(state).state["kubernetes-test"]
+    assert entry["sha256"] == hashlib.sha256(resource.read_bytes()).hexdigest()
+    assert entry["revision"] == "x1"
+
+    # Refreshed from the store behind the charm's back.
+    snapd.installed["kubernetes-test"] = "3210"
+    assert snaps.LocalSnaps(state).install("kubernetes-test", resource)
+    # A new resource, even of the same size.
+    resource.write_bytes(b"SQUASHFS" * 1000)
+    assert snaps.LocalSnaps(state).install("kubernetes-test", resource)
+    assert len(snapd.calls) == 3
+
+
+def test_confinement_is_passed_to_snapd(tmp_path, monkeypatch):
+    snapd = FakeSnapd()
+    monkeypatch.setattr(snaps.snap, "install_local", snapd.install_local)
+    monkeypatch.setattr(snaps.snap, "SnapCache", snapd.cache)
+    resource = tmp_path / "kubectl.snap"
+    resource.write_bytes(b"squashfs")
+    assert snaps.LocalSnaps(tmp_path / "snaps.json").install("kubectl", resource)
+    assert snapd.calls == [(str(resource), False, True)]
+
+
+def test_unchanged_resource_is_not_hashed_again(tmp_path, monkeypatch):
+    resource = tmp_path / "kubectl.snap"
+    resource.write_bytes(b"squashfs")
+    local = snaps.LocalSnaps(tmp_path / "snaps.json")
+    info = resource.stat()
+    local.state["kubectl"] = {
+        "sha256": "cached",
+        "size": info.st_size,
+        "mtime-ns": info.st_mtime_ns,
+    }
+    monkeypatch.setattr(snaps, "sha256", lambda path: "hashed")
+    assert local.digest("kubectl", resource) == "cached"
+    local.state["kubectl"]["size"] += 1
+    assert local.digest("kubectl", resource) == "hashed"
@@ -0,0 +1,122 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for the content-addressed artifact store."""
+
+import io
+import random
+import string
+import tarfile
+
+import pytest
+
+from store import ArtifactStore, chunk_sizes, chunks
+
+
+def _log(seed, specs=200):
+    names, rng = random.Random(0), random.Random(seed)
+    lines = []
+    for _ in range(specs):
+        name = "".join(names.choices(string.ascii_lowercase, k=12))
+        lines.append(f"[sig-apps] {name} should work\n")
+        lines += [f"  STEP: step {step} @ 00:00:{rng.randint(0, 59):02d}\n" for step in range(5)]
+        lines.append("------------------------------\n")
+    return "".join(lines).encode()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path / "store")
+
+
+def test_chunks_reassemble_and_ignore_digits_for_boundaries():
+    data = _log(1)
+    pieces = list(chunks(io.BytesIO(data)))
+    assert b"".join(pieces) == data
+    assert len(pieces) > 1
+    assert all(piece.endswith(b"\n") for piece in pieces)
+    # Changing only digits keeps the boundaries where they were.
+    other = list(chunks(io.BytesIO(_log(2))))
+    assert [len(piece) for piece in pieces] == [len(piece) for piece in other]
+
+
+def test_put_deduplicates_and_reads_back(store, tmp_path):
+    first, second = tmp_path / "1.log", tmp_path / "2.log"
+    first.write_bytes(_log(1))
+    second.write_bytes(_log(1) + b"one more line\n")
+
+    stats = store.put("1", {"1.log": first})
+    assert stats["files"] == 1
+    assert stats["new-chunks"] == stats["chunks"]
+    stats = store.put("2", {"2.log": second})
+    assert stats["new-chunks"] == 1
+    assert b"".join(store.read("2", "2.log")) == second.read_bytes()
+    assert store.runs() == ["1", "2"]
+    with pytest.raises(FileNotFoundError):
+        list(store.read("3", "3.log"))
+
+
+def test_rebuild_tarballs(store, tmp_path):
+    home = tmp_path / "home"
+    (home / "1-junit").mkdir(parents=True)
+    (home / "1.log").write_bytes(b"log\n")
+    (home / "1-junit" / "junit_01.xml").write_bytes(b"<testsuite/>\n")
+    (home / "1-trace.json").write_bytes(b"{}")
+    store.put(
+        "1",
+        {
+            "1.log": home / "1.log",
+            "1-junit/junit_01.xml": home / "1-junit" / "junit_01.xml",
+            "1-trace.json": home / "1-trace.json",
+        },
+    )
+
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    rebuilt = store.rebuild("1", restored)
+    assert sorted(path.name for path in rebuilt) == [
+        "1-junit.tar.gz",
+        "1-trace.json",
+        "1.log.tar.gz",
+    ]
+    with tarfile.open(restored / "1-junit.tar.gz") as tar:
+        assert tar.getnames() == ["junit_01.xml"]
+        assert tar.extractfile("junit_01.xml").read() == b"<testsuite/>\n"
+    with tarfile.open(restored / "1.log.tar.gz") as tar:
+        assert tar.getnames() == ["1.log"]
+    assert (restored / "1-trace.json").read_bytes() == b"{}"
+
+
+def test_drop_frees_only_unshared_chunks(store, tmp_path):
+    shared, unique = tmp_path / "shared", tmp_path / "unique"
+    shared.write_bytes(_log(1))
+    unique.write_bytes(b"only in run 2\n")
+    store.put("1", {"a": shared})
+    store.put("2", {"a": shared, "b": unique})
+    run_2 = chunk_sizes(store.manifest("2"))
+    unique_size = sum(
+        size for digest, size in run_2.items() if digest not in chunk_sizes(store.manifest("1"))
+    )
+
+    assert store.drop(["2"]) == unique_size
+    assert store.runs() == ["1"]
+    assert b"".join(store.read("1", "a")) == shared.read_bytes()
+
+
+def test_read_range_skips_unneeded_chunks(store, tmp_path):
+    path = tmp_path / "1.log"
+    data = _log(1, specs=1000)
+    path.write_bytes(data)
+    store.put("1", {"1.log": path})
+    entries = store.manifest("1")["files"]["1.log"]["chunks"]
+    assert len(entries) > 2
+
+    start = entries[0][2] + 10
+    end = start + entries[1][2]
+    assert b"".join(store.read("1", "1.log", start, end)) == data[start:end]
+    assert b"".join(store.read("1", "1.log", len(data) - 5)) == data[-5:]
+    # Only the chunks the range spans are inflated.
+    for digest, *_ in entries[3:]:
+        (store.objects / digest[:2] / digest[2:]).unlink(missing_ok=True)
+    assert b"".join(store.read("1", "1.log", 0, 10)) == data[:10]
@@ -0,0 +1,58 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+# pylint: disable=duplicate-code,missing-function-docstring
+"""Unit tests for span tracing."""
+
+import json
+
+from tracing import SCRIPT_TID, Tracer, traced
+
+
+class Traced:
+    def __init__(self):
+        self.tracer = Tracer()
+
+    @traced("work")
+    def work(self, value):
+        return value * 2
+
+
+def test_traced_methods_record_spans():
+    obj = Traced()
+    assert obj.work(2) == 4
+    assert obj.work(3) == 6
+    assert [span.name for span in obj.tracer.spans] == ["work", "work"]
+    assert set(obj.tracer.summary()) == {"work"}
+
+
+def test_import_phases(tmp_path):
+    phases = tmp_path / "phases"
+    phases.write_text(
+        "version-probe begin 100.0\n"
+        "version-probe end 100.5\n"
+        "suite begin 100.5\n"
+        "garbage\n"
+        "package begin 200.0\n"
+    )
+    tracer = Tracer()
+    tracer.import_phases(phases)
+    tracer.import_phases(tmp_path / "missing")
+    assert [(s.name, s.seconds, s.tid) for s in tracer.spans] == [
+        ("version-probe", 0.5, SCRIPT_TID)
+    ]
+
+
+def test_write_chrome_trace(tmp_path):
+    tracer = Tracer()
+    with tracer.span("outer"):
+        with tracer.span("inner", run="1"):
+            pass
+    tracer.write(tmp_path / "trace.json")
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [event["name"] for event in events] == ["outer", "inner"]
+    assert all(event["ph"] == "X" for event in events)
+    assert events[1]["args"] == {"run": "1"}
+    assert events[0]["ts"] <= events[1]["ts"]
+    assert events[0]["dur"] >= events[1]["dur"]